@@ -1,3 +1,4 @@
+import threading
 from pathlib import Path
 from fastembed import TextEmbedding, SparseTextEmbedding
 
@@ -7,12 +8,51 @@ project_root = current_file.parent.parent
 dense_model_path = project_root / "models" / "bge-small-en-v1.5"
 sparse_model_path = project_root / "models" / "bm25"
 
-dense_embedding_model = TextEmbedding(
-    model_name="BAAI/bge-small-en-v1.5",
-    specific_model_path=str(dense_model_path),
-)
+# Models are loaded on first use (or by warm_up() at API startup) rather
+# than at import time, so importing this module stays cheap.
+_dense_embedding_model = None
+_sparse_embedding_model = None
+_load_lock = threading.Lock()
 
-sparse_embedding_model = SparseTextEmbedding(
-    model_name="Qdrant/bm25",
-    specific_model_path=str(sparse_model_path),
-)
+
+def get_dense_embedding_model() -> TextEmbedding:
+    """Return the dense embedding model, loading it on first use."""
+    global _dense_embedding_model
+    with _load_lock:
+        if _dense_embedding_model is None:
+            _dense_embedding_model = TextEmbedding(
+                model_name="BAAI/bge-small-en-v1.5",
+                specific_model_path=str(dense_model_path),
+            )
+        return _dense_embedding_model
+
+
+def get_sparse_embedding_model() -> SparseTextEmbedding:
+    """Return the sparse embedding model, loading it on first use."""
+    global _sparse_embedding_model
+    with _load_lock:
+        if _sparse_embedding_model is None:
+            _sparse_embedding_model = SparseTextEmbedding(
+                model_name="Qdrant/bm25",
+                specific_model_path=str(sparse_model_path),
+            )
+        return _sparse_embedding_model
+
+
+def warm_up():
+    """Load both models and run one embedding through each."""
+    list(get_dense_embedding_model().embed(["warm up"]))
+    list(get_sparse_embedding_model().embed(["warm up"]))
+
+
+def __getattr__(name: str):
+    """
+    Keep ``from core.embedding import dense_embedding_model`` (and the
+    sparse one) working for notebooks and scripts: the old module-level
+    names now resolve through the lazy getters.
+    """
+    if name == "dense_embedding_model":
+        return get_dense_embedding_model()
+    if name == "sparse_embedding_model":
+        return get_sparse_embedding_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,226 @@
+"""
+Materialized ``smart_search`` results for very short prefixes.
+
+One- to three-character prefixes are the most requested and, covering the
+largest subtrees and posting lists, the most expensive to answer. The
+table keeps their final suggestion lists (at one fixed width) so they are
+served with a dict lookup. Lists are stored packed, as ``ROW`` ints per
+suggestion, ``(match type, id, distance, word)``: the id is a key node, or
+a query id for partial matches, and ``word`` indexes the entry's tuple of
+matched tokens. The trie turns rows back into suggestion dicts on lookup.
+Entries are filled lazily, on the first lookup of a prefix, unless a bulk
+build materializes them up front.
+
+Entries are dropped, not patched, when a change may affect them, and are
+recomputed on the next lookup. What a change can reach follows from how
+``smart_search`` reads the trie after a key ``s`` or query ``q`` changes:
+
+- exact matches of ``p`` read the subtree of ``p``, so ``p`` is a prefix
+  of ``s``;
+- fuzzy matches of ``p`` read subtrees of strings ``m`` within edit
+  distance 1 of ``p``, so some ``m`` of length ``len(p) ± 1`` is a prefix
+  of ``s``. These are found through a deletion-neighbourhood index (two
+  strings within distance 1 share a one-deletion variant);
+- partial matches of ``p`` read the postings of its tokens ``t`` and of
+  the keys cached under ``t``, so ``t`` is a prefix of ``s`` or a
+  substring of ``q``.
+"""
+
+import sys
+import threading
+from array import array
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+# Ints per packed suggestion: match type, id, distance, word index
+ROW = 4
+MATCH_TYPES = ("exact", "partial", "fuzzy")
+
+# Packed suggestions of one prefix, and the words they index
+Entry = Tuple[array, Tuple[str, ...]]
+
+
+# Approximate bytes an index set and one of its members add
+_SET_BYTES = sys.getsizeof(set())
+_MEMBER_BYTES = 16
+
+
+def _entry_bytes(prefix: str, entry: Entry) -> int:
+    rows, words = entry
+    return (
+        sys.getsizeof(prefix)
+        + sys.getsizeof(rows)
+        + sys.getsizeof(words)
+        + sum(map(sys.getsizeof, words))
+    )
+
+
+def _deletion_variants(text: str) -> Set[str]:
+    """``text`` and every string obtained by deleting one character."""
+    return {text, *(text[:i] + text[i + 1 :] for i in range(len(text)))}
+
+
+class HotPrefixTable:
+    """Thread-safe table of suggestion lists for short normalized prefixes."""
+
+    def __init__(self, width: int = 10, min_length: int = 1, max_length: int = 3):
+        """
+        Args:
+            width (int): ``max_suggestions`` the lists are materialized for;
+                other sizes bypass the table
+            min_length (int): Shortest prefix kept
+            max_length (int): Longest prefix kept
+        """
+        self.width = width
+        self.min_length = min_length
+        self.max_length = max_length
+        self.entries: Dict[str, Entry] = {}
+        # Bumped by every invalidation; results computed across one are
+        # not stored (see put)
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._fuzzy_index: Dict[str, Set[str]] = {}
+        self._token_index: Dict[str, Set[str]] = {}
+        # Bytes of entries and index contents, kept up to date by put and
+        # invalidate so memory_bytes does not walk the table
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def covers(self, prefix: str, max_suggestions: int) -> bool:
+        """Whether lookups of normalized ``prefix`` go through the table."""
+        return (
+            max_suggestions == self.width
+            and self.min_length <= len(prefix) <= self.max_length
+        )
+
+    def get(self, prefix: str) -> Optional[Entry]:
+        entry = self.entries.get(prefix)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def put(
+        self,
+        prefix: str,
+        entry: Entry,
+        tokens: Iterable[str] = (),
+        version: Optional[int] = None,
+    ) -> bool:
+        """
+        Store the packed suggestions of ``prefix``.
+
+        Args:
+            prefix (str): Normalized prefix
+            entry (Entry): Its ``smart_search`` results, packed
+            tokens (Iterable[str]): Tokens its partial stage searched
+            version (int, optional): ``version`` read before the search
+                started; if anything was invalidated since, the results
+                may predate that change and are dropped
+
+        Returns:
+            bool: Whether the entry was stored
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return False
+            old = self.entries.get(prefix)
+            if old is not None:
+                self._bytes -= _entry_bytes(prefix, old)
+            self.entries[prefix] = entry
+            self._bytes += _entry_bytes(prefix, entry)
+            for variant in _deletion_variants(prefix):
+                self._index(self._fuzzy_index, variant, prefix)
+            for token in tokens:
+                self._index(self._token_index, token, prefix)
+            return True
+
+    def _index(self, index: Dict[str, Set[str]], key: str, prefix: str):
+        prefixes = index.get(key)
+        if prefixes is None:
+            prefixes = index[key] = set()
+            self._bytes += sys.getsizeof(key) + _SET_BYTES
+        if prefix not in prefixes:
+            prefixes.add(prefix)
+            self._bytes += _MEMBER_BYTES
+
+    def invalidate(self, keys: Iterable[str], query: Optional[str] = None):
+        """
+        Drop entries a change may affect.
+
+        Args:
+            keys (Iterable[str]): Normalized keys whose frequency, rank or
+                postings changed, including newly inserted ones
+            query (str, optional): Original query whose frequency changed
+        """
+        n = self.max_length
+        with self._lock:
+            self.version += 1
+            if not self.entries:
+                return
+            stale = set()
+            for key in keys:
+                stale.update(key[:i] for i in range(1, min(len(key), n) + 1))
+                for i in range(min(len(key), n + 1) + 1):
+                    for variant in _deletion_variants(key[:i]):
+                        stale.update(self._fuzzy_index.get(variant, ()))
+                    stale.update(self._token_index.get(key[:i], ()))
+            if query:
+                text = query.lower()
+                for size in range(1, n + 1):
+                    for start in range(len(text) - size + 1):
+                        stale.update(
+                            self._token_index.get(text[start : start + size], ())
+                        )
+            for prefix in stale:
+                entry = self.entries.pop(prefix, None)
+                if entry is not None:
+                    self._bytes -= _entry_bytes(prefix, entry)
+                    self.invalidated += 1
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self.entries = {}
+            self._fuzzy_index = {}
+            self._token_index = {}
+            self._bytes = 0
+
+    def copy(self) -> "HotPrefixTable":
+        clone = self.__class__(self.width, self.min_length, self.max_length)
+        with self._lock:
+            clone.entries = dict(self.entries)
+            clone._fuzzy_index = {k: set(v) for k, v in self._fuzzy_index.items()}
+            clone._token_index = {k: set(v) for k, v in self._token_index.items()}
+            clone._bytes = self._bytes
+        return clone
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate bytes held by the table and its indexes, without
+        walking them. Index keys of dropped entries stay counted, as they
+        stay in the indexes.
+        """
+        with self._lock:
+            return self._bytes + sum(
+                sys.getsizeof(table)
+                for table in (self.entries, self._fuzzy_index, self._token_index)
+            )
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "width": self.width,
+            "prefix_lengths": [self.min_length, self.max_length],
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "memory_bytes": self.memory_bytes(),
+        }
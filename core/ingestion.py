@@ -0,0 +1,257 @@
+"""
+Learn autocomplete entries from live query traffic.
+
+Request handlers hand user questions to ``QueryIngestor.submit``, which
+only enqueues them on a bounded queue (dropping when full), so it never
+blocks a request. A background thread counts the queued queries in a
+Space-Saving heavy-hitter summary of fixed size, and periodically
+segments the queries that have been seen often enough, from enough
+distinct sources (clients), and applies them to the live trie as journaled
+frequency updates, on the event loop serving lookups
+(``TrieHolder.apply_updates``). Unseen queries are inserted with their
+tokens (see ``AutocompleteTrie.update_frequency``). Memory stays bounded by
+the queue size and the summary capacity regardless of traffic volume;
+one-off queries never reach the trie, and neither does a query a single
+client keeps sending, since whatever is learned is suggested to everyone.
+"""
+
+import heapq
+import queue
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from core.radix_trie import NO_NODE
+from core.segmentation import tokenize
+from core.trie import autocomplete_trie
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter summary (Metwally et al.) over ``capacity``
+    counters.
+
+    Each monitored item keeps ``[count, error, applied]``: ``count`` may
+    overestimate the true frequency by at most ``error``, so
+    ``count - error`` is a guaranteed lower bound, and ``applied`` is how
+    much of that bound has already been handed out by ``take_ready``.
+    When full, a new item replaces the item with the smallest count and
+    inherits that count as its error. The minimum is found with a lazy
+    min-heap whose stale entries are skipped.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self.counters: Dict[str, List[int]] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.counters)
+
+    def offer(self, item: str, count: int = 1) -> Optional[str]:
+        """Count ``item``; returns the item it replaced, if any."""
+        evicted = None
+        counters = self.counters
+        counter = counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(counters) < self.capacity:
+            counter = counters[item] = [count, 0, 0]
+        else:
+            heap = self._heap
+            while counters[heap[0][1]][0] != heap[0][0]:
+                heapq.heappop(heap)  # stale entry of a bumped counter
+            minimum, evicted = heapq.heappop(heap)
+            del counters[evicted]
+            counter = counters[item] = [minimum + count, minimum, 0]
+
+        heapq.heappush(self._heap, (counter[0], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c[0], key) for key, c in counters.items()]
+            heapq.heapify(self._heap)
+        return evicted
+
+    def take_ready(
+        self, min_count: int, eligible: Optional[Callable[[str], bool]] = None
+    ) -> List[Tuple[str, int]]:
+        """
+        Items whose guaranteed count reached ``min_count``, with the part of
+        it not returned before. Items ``eligible`` rejects are skipped and
+        keep their count for a later call.
+        """
+        ready = []
+        for item, counter in self.counters.items():
+            if eligible is not None and not eligible(item):
+                continue
+            guaranteed = counter[0] - counter[1]
+            if guaranteed >= min_count and guaranteed > counter[2]:
+                ready.append((item, guaranteed - counter[2]))
+                counter[2] = guaranteed
+        return ready
+
+
+class QueryIngestor:
+    """Bounded queue plus background learner feeding a ``TrieHolder``."""
+
+    def __init__(
+        self,
+        holder,
+        queue_size: int = 10000,
+        capacity: int = 10000,
+        min_count: int = 2,
+        min_sources: int = 3,
+        flush_interval: float = 10.0,
+        max_query_length: int = 100,
+    ):
+        """
+        Args:
+            holder: ``TrieHolder`` (or trie) the learned queries go to
+            queue_size (int): Queries buffered before new ones are dropped
+            capacity (int): Counters in the heavy-hitter summary
+            min_count (int): Times a query must be seen before it is learned
+            min_sources (int): Distinct sources a query must come from
+                before it is learned
+            flush_interval (float): Seconds between applying learned queries
+            max_query_length (int): Longer messages are not autocomplete
+                material and are skipped
+        """
+        self.holder = holder
+        self.queue: "queue.Queue[Tuple[str, Optional[str]]]" = queue.Queue(
+            maxsize=queue_size
+        )
+        self.summary = SpaceSaving(capacity)
+        # Hashed sources seen per tracked query, up to min_sources of them
+        self.sources: Dict[str, Set[int]] = {}
+        self.min_count = min_count
+        self.min_sources = min_sources
+        self.flush_interval = flush_interval
+        self.max_query_length = max_query_length
+        self.submitted = 0
+        self.dropped = 0
+        self.learned = 0
+        self.applied_frequency = 0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()  # guards the summary
+
+    def submit(self, query: str, source: Optional[str] = None) -> bool:
+        """
+        Enqueue ``query`` without blocking; returns False if it was dropped.
+
+        Args:
+            query (str): The user's question
+            source (str, optional): Who sent it (user id, client address);
+                submissions without one all count as the same source
+        """
+        query = re.sub(r"\s+", " ", query or "").strip()
+        if not query or len(query) > self.max_query_length:
+            return False
+        try:
+            self.queue.put_nowait((query, source))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="query-ingestor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after applying what was counted."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._stopped.is_set():
+            timeout = max(0.0, next_flush - time.monotonic())
+            try:
+                query, source = self.queue.get(timeout=min(timeout, 0.5))
+                with self._lock:
+                    self._count(query, source)
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_flush:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error ingesting queries: {e}")
+                next_flush = time.monotonic() + self.flush_interval
+
+    def _count(self, query: str, source: Optional[str]):
+        evicted = self.summary.offer(query)
+        if evicted is not None:
+            del self.sources[evicted]
+        seen = self.sources.setdefault(query, set())
+        if len(seen) < self.min_sources:
+            seen.add(hash(source))  # the raw source is not kept
+
+    def _has_sources(self, query: str) -> bool:
+        return len(self.sources[query]) >= self.min_sources
+
+    def flush(self) -> int:
+        """
+        Count everything queued so far, then apply queries that reached
+        ``min_count`` from at least ``min_sources`` sources. Segmentation runs here, off the request path; the
+        updates themselves are handed to the holder's ``apply_updates``,
+        which applies them where lookups run instead of in this thread.
+
+        Returns:
+            int: Number of queries applied
+        """
+        with self._lock:
+            while True:
+                try:
+                    self._count(*self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            ready = self.summary.take_ready(self.min_count, self._has_sources)
+
+        updates = []
+        for query, increment in ready:
+            trie = getattr(self.holder, "current", self.holder)
+            if not trie._is_valid_suggestion(query):
+                continue
+            tokens = None
+            # A key lookup; string_id would build the whole string table
+            # of a mapped snapshot
+            if trie.root.find(query.lower()) == NO_NODE:
+                tokens = tokenize(query) if trie.enable_word_segmentation else []
+                self.learned += 1
+            updates.append((query, increment, None, tokens))
+            self.applied_frequency += increment
+
+        apply_updates = getattr(self.holder, "apply_updates", None)
+        if apply_updates is not None:
+            apply_updates(updates)
+        else:
+            for query, increment, timestamp, tokens in updates:
+                self.holder.update_frequency(query, increment, timestamp, tokens)
+        return len(ready)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue.qsize(),
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "tracked": len(self.summary),
+            "learned_queries": self.learned,
+            "applied_frequency": self.applied_frequency,
+            "min_count": self.min_count,
+            "min_sources": self.min_sources,
+        }
+
+
+# Global ingestor learning from /stream traffic
+query_ingestor = QueryIngestor(autocomplete_trie)
@@ -0,0 +1,220 @@
+"""
+Per-user personalization overlay for autocomplete.
+
+Each user gets a small table of their own recent queries, ranked with the
+same decayed score as the global trie (see ``core.ranking``). Tables live
+in an LRU keyed by user id, with caps per user and in total and eviction
+of idle users, so the overlay costs a bounded amount of memory and a
+small constant amount of work per request. A user's matches are merged
+with the global suggestions at query time; the global trie itself is
+not touched by personal history.
+"""
+
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from core.ranking import decay_rate, log_add, rank_of
+
+
+class UserHistory:
+    """
+    One user's recent queries, least recently used first:
+    ``lowercased query -> [rank, count, last used, query as typed]``.
+    """
+
+    def __init__(self):
+        self.queries: "OrderedDict[str, List[Any]]" = OrderedDict()
+        self.last_seen = time.time()
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+
+class PersonalizationLayer:
+    """Bounded LRU of per-user query histories merged over global results."""
+
+    def __init__(
+        self,
+        max_users: int = 10000,
+        max_queries_per_user: int = 50,
+        max_total_queries: int = 200000,
+        max_query_length: int = 200,
+        idle_seconds: float = 3600.0,
+        half_life_days: Optional[float] = 7.0,
+    ):
+        """
+        Args:
+            max_users (int): Users kept at once; least recently active go first
+            max_queries_per_user (int): Queries kept per user; least
+                recently used go first
+            max_total_queries (int): Queries kept across all users
+            max_query_length (int): Longer queries are not recorded
+            idle_seconds (float): Users inactive this long are dropped
+            half_life_days (float, optional): Half-life of a personal use
+        """
+        self.max_users = max_users
+        self.max_queries_per_user = max_queries_per_user
+        self.max_total_queries = max_total_queries
+        self.max_query_length = max_query_length
+        self.idle_seconds = idle_seconds
+        self.decay_rate = decay_rate(half_life_days)
+        self.users: "OrderedDict[str, UserHistory]" = OrderedDict()
+        self.total_queries = 0
+        self.evicted_users = 0
+        self._lock = threading.Lock()
+
+    def record(
+        self, user_id: str, query: str, timestamp: Optional[float] = None
+    ) -> bool:
+        """
+        Record that ``user_id`` used ``query``.
+
+        Returns:
+            bool: Whether the query is new to this user's history, i.e.
+            whether it should also count towards the global trie
+        """
+        query = query.strip()
+        if not user_id or not query or len(query) > self.max_query_length:
+            return True  # not tracked per user, so it counts every time
+        if timestamp is None:
+            timestamp = time.time()
+
+        with self._lock:
+            history = self.users.get(user_id)
+            if history is None:
+                history = self.users[user_id] = UserHistory()
+            self.users.move_to_end(user_id)
+            history.last_seen = time.time()
+
+            key = query.lower()
+            entry = history.queries.get(key)
+            is_new = entry is None
+            if is_new:
+                history.queries[key] = [
+                    rank_of(1, self.decay_rate, timestamp), 1, timestamp, query
+                ]
+                self.total_queries += 1
+                if len(history) > self.max_queries_per_user:
+                    history.queries.popitem(last=False)
+                    self.total_queries -= 1
+            else:
+                entry[0] = log_add(entry[0], rank_of(1, self.decay_rate, timestamp))
+                entry[1] += 1
+                entry[2] = timestamp
+                history.queries.move_to_end(key)
+            self._evict()
+            return is_new
+
+    def suggestions(
+        self, user_id: str, prefix: str, limit: int
+    ) -> List[Dict[str, Any]]:
+        """The user's own queries starting with ``prefix``, best first."""
+        prefix = prefix.strip().lower()
+        if not user_id or not prefix or limit <= 0:
+            return []
+        with self._lock:
+            history = self.users.get(user_id)
+            if history is None:
+                return []
+            self.users.move_to_end(user_id)
+            history.last_seen = time.time()
+            matches = [
+                (entry[0], key, entry)
+                for key, entry in history.queries.items()
+                if key.startswith(prefix)
+            ]
+        return [
+            {
+                "word": key,
+                "original_word": entry[3],
+                "frequency": entry[1],
+                "match_type": "personal",
+            }
+            for _, key, entry in heapq.nlargest(limit, matches)
+        ]
+
+    def merge(
+        self,
+        user_id: Optional[str],
+        prefix: str,
+        suggestions: List[Dict[str, Any]],
+        max_suggestions: int = 10,
+    ) -> List[Dict[str, Any]]:
+        """
+        Merge the user's matches into global ``suggestions``.
+
+        Both lists are already ranked, so they are combined with a k-way
+        merge on position: personal and global results alternate, personal
+        first, and personal results take at most half of the slots. A query
+        present in both lists appears once, at its earlier position.
+
+        Args:
+            user_id (str, optional): The requesting user; None skips merging
+            prefix (str): The prefix being completed
+            suggestions (List[Dict]): Global results, best first
+            max_suggestions (int): Maximum number of merged results
+
+        Returns:
+            List[Dict]: Merged suggestions
+        """
+        personal = self.suggestions(user_id, prefix, max(1, max_suggestions // 2))
+        if not personal:
+            return suggestions[:max_suggestions]
+
+        streams = [
+            ((position, 0, s) for position, s in enumerate(personal)),
+            ((position, 1, s) for position, s in enumerate(suggestions)),
+        ]
+        merged = []
+        seen = set()
+        for _, _, s in heapq.merge(*streams, key=lambda item: item[:2]):
+            original = (s.get("original_word") or s["word"]).lower()
+            if original in seen:
+                continue
+            seen.add(original)
+            merged.append(s)
+            if len(merged) >= max_suggestions:
+                break
+        return merged
+
+    def _evict(self):
+        """Drop idle users, then least recently active ones over the caps."""
+        cutoff = time.time() - self.idle_seconds
+        users = self.users
+        while users:
+            # The front of the LRU is the least recently active user
+            user_id, history = next(iter(users.items()))
+            over_cap = (
+                len(users) > self.max_users
+                or self.total_queries > self.max_total_queries
+            )
+            if history.last_seen >= cutoff and not over_cap:
+                break
+            del users[user_id]
+            self.total_queries -= len(history)
+            self.evicted_users += 1
+
+    def forget(self, user_id: str):
+        """Delete everything recorded for ``user_id``."""
+        with self._lock:
+            history = self.users.pop(user_id, None)
+            if history is not None:
+                self.total_queries -= len(history)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users": len(self.users),
+                "max_users": self.max_users,
+                "total_queries": self.total_queries,
+                "max_total_queries": self.max_total_queries,
+                "max_queries_per_user": self.max_queries_per_user,
+                "evicted_users": self.evicted_users,
+            }
+
+
+# Global personalization overlay
+personalization = PersonalizationLayer()
@@ -0,0 +1,1143 @@
+"""
+Compact radix (Patricia) trie backed by flat typed arrays.
+
+Every node is a row across a handful of parallel ``array`` columns instead of
+a Python object with its own ``children`` dict, and edge labels are stored as
+code points in a single shared buffer. Original queries are interned once in
+a string table and referenced from nodes by integer id.
+
+Token keys additionally carry posting lists of the original queries that
+contain them (an inverted index), so partial matches are found by
+intersecting postings instead of storing every token combination as a key.
+
+Keys are ranked by a time-decayed score kept as a time-invariant log rank
+(see ``core.ranking``), so cached orderings never need re-decaying.
+
+The same columns are written verbatim to a versioned binary snapshot that
+can be opened with ``mmap`` and queried in place; see ``write_snapshot`` and
+``open_snapshot``.
+"""
+
+import codecs
+import heapq
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from core.ranking import NEVER, log_add, rank_of, score_of
+
+# Node 0 is always the root; -1 marks "no node" / "no string" in link columns
+NO_NODE = -1
+
+# array("I") buffers are native-endian UTF-32
+_decode_utf32 = (
+    codecs.utf_32_le_decode if sys.byteorder == "little" else codecs.utf_32_be_decode
+)
+
+SNAPSHOT_MAGIC = b"OMNITRIE"
+SNAPSHOT_VERSION = 5
+_BYTEORDER_CODES = {"little": 1, "big": 2}
+_ALIGNMENT = 8
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a readable trie snapshot."""
+
+
+class _MappedStrings:
+    """Read-only string table decoded lazily from a snapshot buffer."""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return str(self.blob[self.offsets[index] : self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self[index]
+
+
+class RadixTrie:
+    """
+    Radix trie whose nodes live in parallel typed arrays.
+
+    Children are kept as singly linked sibling lists (``first_child`` /
+    ``next_sibling``) in insertion order, like the old per-node dicts. The
+    root, which has by far the largest fan-out, also keeps a small
+    ``first char -> node`` index for O(1) first-step lookups.
+
+    Every node additionally carries a cached list of the ``top_k`` best
+    ranked keys in its subtree (``top`` holds ``top_k`` slots per node, best
+    first), so prefix suggestions never walk the subtree. Keys whose query
+    is flagged invalid (``query_valid``, e.g. stop words) never enter these
+    lists, so suggestion paths need no per-candidate filtering. ``frequency``
+    keeps raw counts; ordering uses the decayed ``rank`` column.
+
+    Postings are stored CSR-style (``posting_offsets`` per node into the flat
+    ``postings`` column) plus a private ``posting_tail`` of entries added
+    since the last snapshot. String ids only grow, so every posting list is
+    sorted without any re-sorting.
+    """
+
+    # Typed array columns and their typecodes, in the order they are persisted
+    COLUMNS = {
+        "labels": "I",
+        "label_start": "I",
+        "label_len": "I",
+        "parent": "i",
+        "first_child": "i",
+        "next_sibling": "i",
+        "frequency": "q",
+        "rank": "d",  # log-space decayed score, see core.ranking
+        "original": "i",
+        "top": "i",
+        "query_frequency": "q",  # per string id: total frequency of the query
+        "query_rank": "d",  # per string id: decayed rank of the query
+        "query_valid": "b",  # per string id: 1 if it may be suggested
+        "posting_offsets": "I",
+        "postings": "i",  # string ids of the queries containing a token key
+    }
+
+    def __init__(self, top_k: int = 10, decay_rate: float = 0.0):
+        self.top_k = top_k
+        self.decay_rate = decay_rate  # per second, 0 disables decay
+        self.labels = array("I")  # edge label code points, shared buffer
+        self.label_start = array("I", [0])
+        self.label_len = array("I", [0])
+        self.parent = array("i", [NO_NODE])
+        self.first_child = array("i", [NO_NODE])
+        self.next_sibling = array("i", [NO_NODE])
+        self.frequency = array("q", [0])
+        self.rank = array("d", [NEVER])
+        self.original = array("i", [NO_NODE])  # string id, NO_NODE if not a key
+        self.top = array("i", [NO_NODE] * top_k)
+        self.query_frequency = array("q")
+        self.query_rank = array("d")
+        self.query_valid = array("b")
+        self.posting_offsets = array("I", [0])
+        self.postings = array("i")
+        self.posting_tail: Dict[int, array] = {}
+        self.strings: List[str] = []
+        self.string_ids: Optional[Dict[str, int]] = {}
+        self.root_children: Dict[str, int] = {}
+        self.key_count = 0
+        self.journal_seq = 0  # last frequency journal segment folded in
+        self._mapping: Optional[mmap.mmap] = None  # set while read-only
+
+    def __len__(self) -> int:
+        return self.key_count
+
+    @property
+    def node_count(self) -> int:
+        return len(self.first_child)
+
+    def is_key(self, node: int) -> bool:
+        return self.original[node] != NO_NODE
+
+    def label(self, node: int) -> str:
+        """Decode the edge label leading into ``node``."""
+        start = self.label_start[node]
+        return _decode_utf32(
+            self.labels[start : start + self.label_len[node]].tobytes()
+        )[0]
+
+    def key_of(self, node: int) -> str:
+        """Rebuild the full key of ``node`` by walking up to the root."""
+        parts = []
+        parent = self.parent
+        while node > 0:
+            parts.append(self.label(node))
+            node = parent[node]
+        parts.reverse()
+        return "".join(parts)
+
+    def original_word(self, node: int) -> Optional[str]:
+        string_id = self.original[node]
+        return self.strings[string_id] if string_id != NO_NODE else None
+
+    @property
+    def is_mapped(self) -> bool:
+        """Whether the columns are still read-only views into a snapshot."""
+        return self._mapping is not None
+
+    def prefetch(self):
+        """Ask the kernel to read a mapped snapshot ahead of first use."""
+        if self._mapping is not None and hasattr(mmap, "MADV_WILLNEED"):
+            self._mapping.madvise(mmap.MADV_WILLNEED)
+
+    def string_id(self, text: str) -> Optional[int]:
+        """Return the string table id for ``text`` if it is interned."""
+        if self.string_ids is None:
+            self.string_ids = {value: i for i, value in enumerate(self.strings)}
+        return self.string_ids.get(text)
+
+    def intern(self, text: str) -> int:
+        """Return the string table id for ``text``, adding it if needed."""
+        self._ensure_writable()
+        string_id = self.string_id(text)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(text)
+            self.query_frequency.append(0)
+            self.query_rank.append(NEVER)
+            self.query_valid.append(1)
+            self.string_ids[text] = string_id
+        return string_id
+
+    def set_valid(self, string_id: int, valid: bool):
+        """
+        Flag whether keys of query ``string_id`` may be suggested. Set it
+        right after interning, before the query's keys are inserted:
+        invalid keys are kept out of every cached top-K list.
+        """
+        self._ensure_writable()
+        self.query_valid[string_id] = 1 if valid else 0
+
+    def add_query_frequency(
+        self, text: str, frequency: int, timestamp: Optional[float] = None
+    ) -> int:
+        """Credit ``frequency`` to the original query ``text``; returns its id."""
+        string_id = self.intern(text)
+        self.query_frequency[string_id] += frequency
+        self.query_rank[string_id] = log_add(
+            self.query_rank[string_id],
+            rank_of(frequency, self.decay_rate, timestamp),
+        )
+        return string_id
+
+    def score(self, node: int, now: Optional[float] = None) -> float:
+        """Decayed score of key ``node`` at ``now``."""
+        return score_of(self.rank[node], self.decay_rate, now)
+
+    def query_score(self, string_id: int, now: Optional[float] = None) -> float:
+        """Decayed score of original query ``string_id`` at ``now``."""
+        return score_of(self.query_rank[string_id], self.decay_rate, now)
+
+    def add_posting(self, node: int, string_id: int):
+        """Record that query ``string_id`` contains the token key ``node``."""
+        self._ensure_writable()
+        tail = self.posting_tail.get(node)
+        if tail is None:
+            tail = self.posting_tail[node] = array("i")
+        tail.append(string_id)
+
+    def postings_of(self, node: int) -> Sequence[int]:
+        """Return the sorted query ids posted under ``node``."""
+        offsets = self.posting_offsets
+        if node + 1 < len(offsets):
+            stored = self.postings[offsets[node] : offsets[node + 1]]
+        else:
+            stored = self.postings[:0]
+        tail = self.posting_tail.get(node)
+        if tail is None:
+            return stored
+        return list(stored) + list(tail) if len(stored) else tail
+
+    def _merged_postings(self) -> Tuple[array, array]:
+        """Fold ``posting_tail`` into fresh CSR columns."""
+        old_offsets = self.posting_offsets
+        old_postings = self.postings
+        offsets = array("I", [0])
+        postings = array("i")
+        for node in range(self.node_count):
+            if node + 1 < len(old_offsets):
+                postings.extend(old_postings[old_offsets[node] : old_offsets[node + 1]])
+            tail = self.posting_tail.get(node)
+            if tail is not None:
+                postings.extend(tail)
+            offsets.append(len(postings))
+        return offsets, postings
+
+    def children(self, node: int) -> Iterator[int]:
+        child = self.first_child[node]
+        next_sibling = self.next_sibling
+        while child != NO_NODE:
+            yield child
+            child = next_sibling[child]
+
+    def child_items(self, node: int) -> List[Tuple[str, int]]:
+        """Return ``(first char, child)`` pairs for the children of ``node``."""
+        if node == 0:
+            return list(self.root_children.items())
+        labels = self.labels
+        label_start = self.label_start
+        next_sibling = self.next_sibling
+        items = []
+        child = self.first_child[node]
+        while child != NO_NODE:
+            items.append((chr(labels[label_start[child]]), child))
+            child = next_sibling[child]
+        return items
+
+    def child(self, node: int, code: int) -> int:
+        """Return the child of ``node`` whose label starts with ``code``."""
+        if node == 0:
+            return self.root_children.get(chr(code), NO_NODE)
+        labels = self.labels
+        label_start = self.label_start
+        next_sibling = self.next_sibling
+        child = self.first_child[node]
+        while child != NO_NODE:
+            if labels[label_start[child]] == code:
+                return child
+            child = next_sibling[child]
+        return NO_NODE
+
+    def _new_node(self, parent: int, suffix: str) -> int:
+        node = len(self.first_child)
+        self.label_start.append(len(self.labels))
+        self.label_len.append(len(suffix))
+        self.labels.extend(map(ord, suffix))
+        self.parent.append(parent)
+        self.first_child.append(NO_NODE)
+        self.next_sibling.append(NO_NODE)
+        self.frequency.append(0)
+        self.rank.append(NEVER)
+        self.original.append(NO_NODE)
+        self.top.extend([NO_NODE] * self.top_k)
+
+        last = self.first_child[parent]
+        if last == NO_NODE:
+            self.first_child[parent] = node
+        else:
+            while self.next_sibling[last] != NO_NODE:
+                last = self.next_sibling[last]
+            self.next_sibling[last] = node
+        if parent == 0:
+            self.root_children[suffix[0]] = node
+        return node
+
+    def _split(self, node: int, at: int) -> int:
+        """
+        Split the edge into ``node`` after ``at`` code points.
+
+        A new head node takes the first ``at`` code points and ``node``'s
+        place among its siblings; ``node`` keeps its id, key data and
+        children under the shortened label, so cached top-K entries that
+        point at it stay valid. Returns the new head.
+        """
+        k = self.top_k
+        parent = self.parent[node]
+        head = len(self.first_child)
+        self.label_start.append(self.label_start[node])
+        self.label_len.append(at)
+        self.parent.append(parent)
+        self.first_child.append(node)
+        self.next_sibling.append(self.next_sibling[node])
+        self.frequency.append(0)
+        self.rank.append(NEVER)
+        self.original.append(NO_NODE)
+        self.top.extend(self.top[node * k : node * k + k])
+
+        if self.first_child[parent] == node:
+            self.first_child[parent] = head
+        else:
+            sibling = self.first_child[parent]
+            while self.next_sibling[sibling] != node:
+                sibling = self.next_sibling[sibling]
+            self.next_sibling[sibling] = head
+        if parent == 0:
+            self.root_children[chr(self.labels[self.label_start[node]])] = head
+
+        self.label_start[node] += at
+        self.label_len[node] -= at
+        self.parent[node] = head
+        self.next_sibling[node] = NO_NODE
+        return head
+
+    def insert(
+        self,
+        key: str,
+        original_word: str,
+        frequency: int,
+        promote: bool = True,
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """
+        Insert ``key`` (already normalized) and return its node id.
+
+        A key seen before only accumulates frequency; the first original
+        query that produced it is kept, matching the previous node layout.
+        Bulk loads pass ``promote=False`` and call ``rebuild_top`` once at
+        the end instead of re-ranking ancestors on every insert.
+        """
+        self._ensure_writable()
+        codes = array("I", map(ord, key))
+        node = 0
+        i = 0
+        n = len(codes)
+        labels = self.labels
+        while i < n:
+            child = self.child(node, codes[i])
+            if child == NO_NODE:
+                node = self._new_node(node, key[i:])
+                break
+            start = self.label_start[child]
+            length = min(self.label_len[child], n - i)
+            j = 1
+            while j < length and labels[start + j] == codes[i + j]:
+                j += 1
+            if j < self.label_len[child]:
+                child = self._split(child, j)
+            node = child
+            i += j
+
+        if self.original[node] != NO_NODE:
+            self.frequency[node] += frequency
+        else:
+            self.original[node] = self.intern(original_word)
+            self.frequency[node] = frequency
+            self.key_count += 1
+        self.rank[node] = log_add(
+            self.rank[node], rank_of(frequency, self.decay_rate, timestamp)
+        )
+        if promote:
+            self._promote(node)
+        return node
+
+    def add_frequency(
+        self, node: int, increment: int, timestamp: Optional[float] = None
+    ):
+        """Increase the frequency of key ``node`` and refresh cached top-K."""
+        self._ensure_writable()
+        self.frequency[node] += increment
+        self.rank[node] = log_add(
+            self.rank[node], rank_of(increment, self.decay_rate, timestamp)
+        )
+        self._promote(node)
+
+    def _promote(self, key: int):
+        """
+        Re-rank ``key`` in the top-K lists of its ancestors after its
+        rank grew.
+
+        Walks upward from the key node and stops at the first ancestor
+        whose list rejects it: every entry of that list also lives under
+        all higher ancestors and outranks the key there as well.
+        """
+        if not self.query_valid[self.original[key]]:
+            return  # never suggested, so never cached
+        top = self.top
+        rank = self.rank
+        parent = self.parent
+        k = self.top_k
+        score = rank[key]
+        holder = key
+        while holder != NO_NODE:
+            base = holder * k
+            end = base + k
+            pos = end - 1
+            for i in range(base, end):
+                entry = top[i]
+                if entry == key or entry == NO_NODE:
+                    pos = i
+                    break
+            else:
+                if score <= rank[top[pos]]:
+                    return
+            while pos > base and rank[top[pos - 1]] < score:
+                top[pos] = top[pos - 1]
+                pos -= 1
+            top[pos] = key
+            holder = parent[holder]
+
+    def top_keys(self, node: int, limit: int) -> List[int]:
+        """Return up to ``limit`` (<= ``top_k``) cached best keys under ``node``."""
+        base = node * self.top_k
+        keys = []
+        for entry in self.top[base : base + min(limit, self.top_k)]:
+            if entry == NO_NODE:
+                break
+            keys.append(entry)
+        return keys
+
+    def best_keys(self, node: int, limit: int) -> List[int]:
+        """
+        Return the ``limit`` best ranked keys under ``node``, best first.
+
+        Beyond ``top_k`` the cached lists no longer suffice, so subtrees are
+        expanded best-first from a max-heap ordered by each subtree's bound,
+        the rank of the head of its cached top-K list. A key is emitted once
+        nothing left on the heap can outrank it, and the walk stops after
+        ``limit`` keys; subtrees whose bound never makes the cut are not
+        visited. A subtree whose cached list is not full holds exactly those
+        keys and is not expanded either.
+        """
+        if limit <= self.top_k:
+            return self.top_keys(node, limit)
+
+        k = self.top_k
+        top = self.top
+        rank = self.rank
+        original = self.original
+        query_valid = self.query_valid
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        keys: List[int] = []
+        # (-rank, tie, id, is_subtree); tie keeps equal ranks in push order
+        heap = []
+        tie = 0
+        if top[node * k] != NO_NODE:
+            heap.append((-rank[top[node * k]], tie, node, True))
+
+        while heap and len(keys) < limit:
+            _, _, item, is_subtree = heapq.heappop(heap)
+            if not is_subtree:
+                keys.append(item)
+                continue
+
+            base = item * k
+            if top[base + k - 1] == NO_NODE:
+                for entry in top[base : base + k]:
+                    if entry == NO_NODE:
+                        break
+                    tie += 1
+                    heapq.heappush(heap, (-rank[entry], tie, entry, False))
+                continue
+
+            if original[item] != NO_NODE and query_valid[original[item]]:
+                tie += 1
+                heapq.heappush(heap, (-rank[item], tie, item, False))
+            child = first_child[item]
+            while child != NO_NODE:
+                head = top[child * k]
+                if head != NO_NODE:
+                    tie += 1
+                    heapq.heappush(heap, (-rank[head], tie, child, True))
+                child = next_sibling[child]
+        return keys
+
+    def _next_chars(self, node: int, offset: int) -> List[Tuple[int, int, int]]:
+        """``(code, node, offset)`` for every position one character deeper."""
+        if offset < self.label_len[node]:
+            code = self.labels[self.label_start[node] + offset]
+            return [(code, node, offset + 1)]
+        labels = self.labels
+        label_start = self.label_start
+        return [(labels[label_start[child]], child, 1) for child in self.children(node)]
+
+    def fuzzy_prefix_nodes(
+        self,
+        query: str,
+        max_distance: int,
+        max_steps: int = 20000,
+        layers: Optional[Dict[str, Dict[Tuple[int, int], int]]] = None,
+        deadline: Optional[float] = None,
+    ) -> Dict[int, int]:
+        """
+        Find subtrees whose path fuzzily matches ``query`` as a prefix.
+
+        Runs a Levenshtein automaton over trie positions ``(node, offset in
+        edge)`` one query character at a time. Each layer maps the
+        positions reachable after consuming ``query[:i]`` to their lowest
+        edit count; insertions are closed over within a layer in order of
+        distance, then matches, substitutions and deletions produce the
+        next layer. Characters that agree with the query follow a single
+        child lookup, and only positions with edit budget left branch.
+
+        A layer depends only on the characters consumed so far, so callers
+        completing several prefixes that share a stem can pass the same
+        ``layers`` dict and every shared layer is computed once.
+
+        Args:
+            query (str): Normalized query to match
+            max_distance (int): Maximum edit distance
+            max_steps (int): Cap on expanded positions, for pathological input
+            layers (Dict, optional): ``query prefix -> layer`` cache shared
+                across calls with the same ``max_distance``
+            deadline (float, optional): ``time.perf_counter()`` value after
+                which the walk gives up between layers
+
+        Returns:
+            Dict[int, int]: ``node -> distance`` for every node whose path has
+            a prefix within ``max_distance`` of ``query``; all keys below such
+            a node match at that distance or better. Empty when ``max_steps``
+            or the deadline runs out first.
+        """
+        if layers is None:
+            layers = {}
+        pos = len(query)
+        while pos > 0 and query[:pos] not in layers:
+            pos -= 1
+        layer = layers[query[:pos]] if pos else {(0, 0): 0}
+
+        labels = self.labels
+        label_start = self.label_start
+        label_len = self.label_len
+        limit = max_distance + 1
+        successors: Dict[Tuple[int, int], List[Tuple[int, int, int]]] = {}
+        steps = 0
+        while pos < len(query) and layer:
+            closed = self._close_insertions(layer, max_distance, successors)
+            steps += len(closed)
+            if steps > max_steps:
+                return {}
+            if deadline is not None and time.perf_counter() >= deadline:
+                return {}
+
+            code = ord(query[pos])
+            next_layer: Dict[Tuple[int, int], int] = {}
+            for (node, offset), distance in closed.items():
+                if offset < label_len[node]:
+                    if labels[label_start[node] + offset] == code:
+                        target = (node, offset + 1)
+                        if next_layer.get(target, limit) > distance:
+                            next_layer[target] = distance
+                else:
+                    child = self.child(node, code)
+                    if child != NO_NODE and next_layer.get((child, 1), limit) > distance:
+                        next_layer[child, 1] = distance
+
+                if distance < max_distance:
+                    distance += 1
+                    if next_layer.get((node, offset), limit) > distance:
+                        next_layer[node, offset] = distance  # deletion
+                    state = (node, offset)
+                    following = successors.get(state)
+                    if following is None:
+                        following = successors[state] = self._next_chars(*state)
+                    for next_code, next_node, next_offset in following:
+                        target = (next_node, next_offset)
+                        if next_code != code and next_layer.get(target, limit) > distance:
+                            next_layer[target] = distance  # substitution
+            pos += 1
+            layer = layers[query[:pos]] = next_layer
+
+        matches: Dict[int, int] = {}
+        for (node, _), distance in layer.items():
+            if distance < matches.get(node, limit):
+                matches[node] = distance
+        return matches
+
+    def _close_insertions(
+        self,
+        layer: Dict[Tuple[int, int], int],
+        max_distance: int,
+        successors: Dict[Tuple[int, int], List[Tuple[int, int, int]]],
+    ) -> Dict[Tuple[int, int], int]:
+        """
+        Extend ``layer`` with positions reachable by inserted characters.
+
+        ``successors`` memoizes ``_next_chars`` for the caller.
+        """
+        closed = dict(layer)
+        by_distance: List[List[Tuple[int, int]]] = [[] for _ in range(max_distance + 1)]
+        for state, distance in layer.items():
+            by_distance[distance].append(state)
+        for distance in range(max_distance):
+            for state in by_distance[distance]:
+                if closed[state] != distance:
+                    continue
+                following = successors.get(state)
+                if following is None:
+                    following = successors[state] = self._next_chars(*state)
+                for _, next_node, next_offset in following:
+                    target = (next_node, next_offset)
+                    if closed.get(target, max_distance + 1) > distance + 1:
+                        closed[target] = distance + 1
+                        by_distance[distance + 1].append(target)
+        return closed
+
+    def rebuild_top(self):
+        """Recompute every node's top-K list bottom-up without recursion."""
+        self._ensure_writable()
+        k = self.top_k
+        rank = self.rank
+        original = self.original
+        query_valid = self.query_valid
+        top = array("i", [NO_NODE]) * (self.node_count * k)
+        stack = [(0, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in self.children(node))
+                continue
+            candidates = []
+            if original[node] != NO_NODE and query_valid[original[node]]:
+                candidates.append(node)
+            for child in self.children(node):
+                base = child * k
+                for entry in top[base : base + k]:
+                    if entry == NO_NODE:
+                        break
+                    candidates.append(entry)
+            best = heapq.nlargest(k, candidates, key=rank.__getitem__)
+            top[node * k : node * k + len(best)] = array("i", best)
+        self.top = top
+
+    def locate(self, prefix: str) -> Tuple[int, str]:
+        """
+        Walk ``prefix`` from the root.
+
+        Returns:
+            Tuple[int, str]: The shallowest node whose path starts with
+            ``prefix`` and that node's full path string, or
+            ``(NO_NODE, "")`` when nothing matches. A prefix ending in the
+            middle of an edge resolves to the node below that edge.
+        """
+        return self._walk(prefix, 0, 0)
+
+    def locate_many(self, prefixes: Iterable[str]) -> Dict[str, Tuple[int, str]]:
+        """
+        ``locate`` several prefixes, sharing the walk along common stems.
+
+        Prefixes are visited in sorted order and each walk resumes from the
+        deepest node boundary it shares with the previous prefix, so a
+        stem common to many prefixes is walked once.
+
+        Returns:
+            Dict[str, Tuple[int, str]]: ``prefix -> locate(prefix)``
+        """
+        results = {}
+        trail: List[Tuple[int, int]] = []  # (chars consumed, node) boundaries
+        previous = ""
+        for prefix in sorted(set(prefixes)):
+            common = len(os.path.commonprefix([previous, prefix]))
+            while trail and trail[-1][0] > common:
+                trail.pop()
+            consumed, node = trail[-1] if trail else (0, 0)
+            results[prefix] = self._walk(prefix, node, consumed, trail)
+            previous = prefix
+        return results
+
+    def advance(
+        self, prefix: str, located: Tuple[int, str], char: str
+    ) -> Tuple[int, str]:
+        """
+        Extend a located ``prefix`` by one character without re-walking it.
+
+        Args:
+            prefix (str): A prefix already resolved by ``locate``
+            located (Tuple[int, str]): ``locate(prefix)``
+            char (str): The character appended
+
+        Returns:
+            Tuple[int, str]: ``locate(prefix + char)``
+        """
+        node, path = located
+        if node == NO_NODE:
+            return NO_NODE, ""
+        depth = len(prefix)
+        if len(path) > depth:  # still inside the edge into ``node``
+            return located if path[depth] == char else (NO_NODE, "")
+        return self._walk(prefix + char, node, depth)
+
+    def _walk(
+        self,
+        prefix: str,
+        node: int,
+        i: int,
+        trail: Optional[List[Tuple[int, int]]] = None,
+    ) -> Tuple[int, str]:
+        """
+        Continue a ``locate`` walk from ``node``, whose path is ``prefix[:i]``.
+
+        Every node boundary passed is appended to ``trail`` when given.
+        """
+        n = len(prefix)
+        labels = self.labels
+        while i < n:
+            child = self.child(node, ord(prefix[i]))
+            if child == NO_NODE:
+                return NO_NODE, ""
+            start = self.label_start[child]
+            length = self.label_len[child]
+            j = 1
+            while j < length and i + j < n:
+                if labels[start + j] != ord(prefix[i + j]):
+                    return NO_NODE, ""
+                j += 1
+            node = child
+            i += j
+            if j < length:
+                return node, prefix + self.label(node)[j:]
+            if trail is not None:
+                trail.append((i, node))
+        return node, prefix
+
+    def find(self, key: str) -> int:
+        """Return the node id holding exactly ``key``, or ``NO_NODE``."""
+        node, path = self.locate(key)
+        if node == NO_NODE or len(path) != len(key) or not self.is_key(node):
+            return NO_NODE
+        return node
+
+    def iter_keys(self, node: int = 0, path: str = "") -> Iterator[Tuple[int, str]]:
+        """Iteratively yield ``(node, key)`` for every key below ``node``."""
+        labels = self.labels
+        label_start = self.label_start
+        label_len = self.label_len
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        original = self.original
+        stack = [(node, path)]
+        while stack:
+            node, path = stack.pop()
+            if original[node] != NO_NODE:
+                yield node, path
+            child = first_child[node]
+            if child == NO_NODE:
+                continue
+            children = []
+            while child != NO_NODE:
+                start = label_start[child]
+                label = _decode_utf32(
+                    labels[start : start + label_len[child]].tobytes()
+                )[0]
+                children.append((child, path + label))
+                child = next_sibling[child]
+            children.reverse()
+            stack.extend(children)
+
+    def pruned(self, keep: Sequence[int]) -> "RadixTrie":
+        """
+        Return a compacted copy holding only the queries ``keep``.
+
+        A key survives while a kept query still uses it: as its original,
+        as the query's own key, or through a posting. Its original then
+        moves to the first kept query using it; frequency and rank are
+        copied unchanged. The copy is rebuilt node by node, so removed keys
+        leave no dead nodes, labels or empty branches behind. Kept string
+        ids are renumbered in ascending order, which keeps every posting
+        list sorted.
+
+        Args:
+            keep (Sequence[int]): String ids to keep, ascending
+
+        Returns:
+            RadixTrie: A new writable trie
+        """
+        clone = self.__class__(self.top_k, self.decay_rate)
+        clone.journal_seq = self.journal_seq
+        new_ids: Dict[int, int] = {}
+        owners: Dict[int, int] = {}  # query key node -> first kept query
+        for string_id in keep:
+            text = self.strings[string_id]
+            new_id = new_ids[string_id] = clone.intern(text)
+            clone.query_frequency[new_id] = self.query_frequency[string_id]
+            clone.query_rank[new_id] = self.query_rank[string_id]
+            clone.query_valid[new_id] = self.query_valid[string_id]
+            node = self.find(text.lower())
+            if node != NO_NODE:
+                owners.setdefault(node, new_id)
+
+        for node, key in self.iter_keys():
+            posted = [new_ids[q] for q in self.postings_of(node) if q in new_ids]
+            original = new_ids.get(self.original[node])
+            if original is None:
+                users = posted[:1]
+                if node in owners:
+                    users.append(owners[node])
+                if not users:
+                    continue
+                original = min(users)
+            copied = clone.insert(key, clone.strings[original], 0, promote=False)
+            clone.frequency[copied] = self.frequency[node]
+            clone.rank[copied] = self.rank[node]
+            for new_id in posted:
+                clone.add_posting(copied, new_id)
+
+        clone.rebuild_top()
+        return clone
+
+    def short_prefixes(self, max_length: int) -> Iterator[str]:
+        """Yield every distinct prefix of a key, up to ``max_length`` characters."""
+        stack = [(0, "")]
+        while stack:
+            node, path = stack.pop()
+            for child in self.children(node):
+                extended = path + self.label(child)
+                for i in range(len(path) + 1, min(len(extended), max_length) + 1):
+                    yield extended[:i]
+                if len(extended) < max_length:
+                    stack.append((child, extended))
+
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the node columns and label buffer."""
+        columns = [getattr(self, name) for name in self.COLUMNS]
+        columns.extend(self.posting_tail.values())
+        return sum(len(column) * column.itemsize for column in columns)
+
+    def memory_usage(self) -> Dict[str, int]:
+        """
+        Approximate bytes per structure, for capacity planning.
+
+        Columns of a mapped snapshot are counted at their size in the file;
+        those pages are shared page cache rather than private memory.
+        """
+        usage = {}
+        for name in self.COLUMNS:
+            column = getattr(self, name)
+            usage[name] = len(column) * column.itemsize
+        usage["posting_tail"] = sys.getsizeof(self.posting_tail) + sum(
+            sys.getsizeof(tail) for tail in self.posting_tail.values()
+        )
+        if isinstance(self.strings, _MappedStrings):
+            usage["strings"] = self.strings.offsets.nbytes + self.strings.blob.nbytes
+        else:
+            usage["strings"] = sys.getsizeof(self.strings) + sum(
+                sys.getsizeof(text) for text in self.strings
+            )
+        # Keys are shared with the string table; only the table itself counts
+        usage["string_ids"] = sys.getsizeof(self.string_ids or {})
+        usage["root_children"] = sys.getsizeof(self.root_children)
+        usage["total"] = sum(usage.values())
+        return usage
+
+    def structure_stats(self) -> Dict[str, any]:
+        """
+        Shape of the trie: depth and how many token keys post each query.
+
+        Walks every node and posting once, so callers should not run it
+        per request.
+
+        Returns:
+            Dict: ``nodes``, ``keys``, ``queries``, ``max_depth`` (edges from
+            the root), ``max_key_length`` (characters), ``mean_children`` of
+            inner nodes and ``segment_fanout``, a histogram of the number of
+            token keys each query is posted under (``"10+"`` collects the
+            tail)
+        """
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        label_len = self.label_len
+        level = [(0, 0)]  # (node, key length)
+        depth = max_length = inner = edges = 0
+        while level:
+            next_level = []
+            for node, length in level:
+                child = first_child[node]
+                if child != NO_NODE:
+                    inner += 1
+                while child != NO_NODE:
+                    next_level.append((child, length + label_len[child]))
+                    child = next_sibling[child]
+            if next_level:
+                depth += 1
+                edges += len(next_level)
+                max_length = max(max_length, *(n for _, n in next_level))
+            level = next_level
+
+        per_query = Counter(self.postings)
+        for tail in self.posting_tail.values():
+            per_query.update(tail)
+        fanout = Counter(min(count, 10) for count in per_query.values())
+        fanout[0] += len(self.strings) - len(per_query)
+        return {
+            "nodes": self.node_count,
+            "keys": self.key_count,
+            "queries": len(self.strings),
+            "max_depth": depth,
+            "max_key_length": max_length,
+            "mean_children": round(edges / inner, 3) if inner else 0.0,
+            "segment_fanout": {
+                ("10+" if count == 10 else str(count)): fanout[count]
+                for count in sorted(fanout)
+                if fanout[count]
+            },
+        }
+
+    def copy(self) -> "RadixTrie":
+        """
+        Return an independent copy, e.g. to persist from another thread.
+
+        Mapped columns are read-only and shared as-is; private arrays are
+        duplicated with a flat memory copy.
+        """
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        if self._mapping is None:
+            for name in self.COLUMNS:
+                setattr(clone, name, getattr(self, name)[:])
+            clone.strings = list(self.strings)
+            clone.string_ids = None
+        clone.posting_tail = {
+            node: tail[:] for node, tail in self.posting_tail.items()
+        }
+        clone.root_children = dict(self.root_children)
+        return clone
+
+    def _ensure_writable(self):
+        """
+        Copy mapped snapshot columns into private arrays before a mutation.
+
+        Other processes mapping the same snapshot are unaffected; this
+        process simply stops sharing pages with them.
+        """
+        if self._mapping is None:
+            return
+        for name, typecode in self.COLUMNS.items():
+            column = array(typecode)
+            column.frombytes(getattr(self, name).cast("B"))
+            setattr(self, name, column)
+        self.strings = list(self.strings)
+        self.string_ids = None
+        self._mapping = None
+
+    def _string_sections(self) -> Tuple[array, bytes]:
+        """Return the string table as (offsets, utf-8 blob) for persistence."""
+        if isinstance(self.strings, _MappedStrings):
+            return self.strings.offsets, self.strings.blob
+        offsets = array("Q", [0])
+        encoded = []
+        size = 0
+        for text in self.strings:
+            data = text.encode("utf-8")
+            encoded.append(data)
+            size += len(data)
+            offsets.append(size)
+        return offsets, b"".join(encoded)
+
+    @classmethod
+    def _header(cls) -> struct.Struct:
+        # magic, version, top_k, byte order, key count, journal seq,
+        # string count, blob size, decay rate, then every column's item count
+        return struct.Struct("<8sIIIxxxxQQQQd" + "Q" * len(cls.COLUMNS))
+
+    def write_snapshot(self, path: str):
+        """
+        Write the trie as a flat binary snapshot, atomically replacing ``path``.
+
+        Layout: a fixed header followed by every column in ``COLUMNS``
+        order, the string offsets and the UTF-8 string blob, each section
+        aligned to 8 bytes. Columns use native byte order (recorded in the
+        header) so they can be mapped back without conversion.
+        """
+        if self.posting_tail:
+            # Only reachable on private arrays: adding postings unmaps
+            self.posting_offsets, self.postings = self._merged_postings()
+            self.posting_tail = {}
+        offsets, blob = self._string_sections()
+        columns = [getattr(self, name) for name in self.COLUMNS]
+        header = self._header().pack(
+            SNAPSHOT_MAGIC,
+            SNAPSHOT_VERSION,
+            self.top_k,
+            _BYTEORDER_CODES[sys.byteorder],
+            self.key_count,
+            self.journal_seq,
+            len(offsets) - 1,
+            len(blob),
+            self.decay_rate,
+            *(len(column) for column in columns),
+        )
+
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(header)
+            for section in (*columns, offsets, blob):
+                f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def is_snapshot(cls, path: str) -> bool:
+        with open(path, "rb") as f:
+            return f.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+    @classmethod
+    def open_snapshot(cls, path: str) -> "RadixTrie":
+        """
+        Map a snapshot read-only and return a trie that queries it in place.
+
+        Nothing is rebuilt: the columns are ``memoryview`` casts over the
+        mapping, so startup cost is bounded by page faults and processes
+        mapping the same file share the page cache. The first mutation
+        copies the columns into private arrays.
+        """
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = cls._header()
+        if len(mapping) < header.size:
+            raise SnapshotError(f"Truncated trie snapshot: {path}")
+        (
+            magic,
+            version,
+            top_k,
+            byteorder,
+            key_count,
+            journal_seq,
+            string_count,
+            blob_size,
+            decay_rate,
+            *counts,
+        ) = header.unpack_from(mapping)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError(f"Not a trie snapshot: {path}")
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Unsupported trie snapshot version {version}")
+        if byteorder != _BYTEORDER_CODES[sys.byteorder]:
+            raise SnapshotError("Trie snapshot was written with another byte order")
+
+        view = memoryview(mapping)
+        position = header.size
+
+        def section(typecode: str, count: int) -> memoryview:
+            nonlocal position
+            position += -position % _ALIGNMENT
+            size = count * array(typecode).itemsize
+            if position + size > len(mapping):
+                raise SnapshotError(f"Truncated trie snapshot: {path}")
+            data = view[position : position + size]
+            position += size
+            return data.cast(typecode) if typecode != "B" else data
+
+        trie = cls.__new__(cls)
+        trie.top_k = top_k
+        trie.decay_rate = decay_rate
+        for (name, typecode), count in zip(cls.COLUMNS.items(), counts):
+            setattr(trie, name, section(typecode, count))
+        trie.strings = _MappedStrings(
+            section("Q", string_count + 1), section("B", blob_size)
+        )
+        trie.string_ids = None
+        trie.posting_tail = {}
+        trie.key_count = key_count
+        trie.journal_seq = journal_seq
+        trie._mapping = mapping
+        trie.root_children = {
+            chr(trie.labels[trie.label_start[child]]): child
+            for child in trie.children(0)
+        }
+        return trie
+
+
+class QueryFrequencyView(Mapping):
+    """Read-only ``original query -> total frequency`` view over a trie."""
+
+    def __init__(self, trie: RadixTrie):
+        self._trie = trie
+
+    def __len__(self) -> int:
+        return len(self._trie.strings)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._trie.strings)
+
+    def __getitem__(self, text: str) -> int:
+        string_id = self._trie.string_id(text)
+        if string_id is None:
+            raise KeyError(text)
+        return self._trie.query_frequency[string_id]
+
+    def values(self):
+        return self._trie.query_frequency
+
+    def items(self):
+        return zip(self._trie.strings, self._trie.query_frequency)
@@ -0,0 +1,135 @@
+"""
+Time-decayed ranking for autocomplete queries.
+
+A query's score decays exponentially: ``score(t) = sum(f_i * exp(-decay *
+(t - t_i)))`` over its updates ``(f_i, t_i)``. Rather than stored scores
+that go stale, every key keeps the time-invariant rank
+``log(sum(f_i * exp(decay * t_i)))``. Ranks compare the same way the scores
+do at any moment, so cached orderings (per-node top-K lists, the top
+queries heap) never need re-decaying; an update only touches the updated
+key, and ``score(t) = exp(rank - decay * t)`` is computed when displayed.
+"""
+
+import heapq
+import math
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+NEVER = float("-inf")  # rank of a key with no positive updates
+
+
+def decay_rate(half_life_days: Optional[float]) -> float:
+    """Per-second decay constant for a half-life in days (None or 0: none)."""
+    if not half_life_days:
+        return 0.0
+    return math.log(2) / (half_life_days * 86400)
+
+
+def log_add(a: float, b: float) -> float:
+    """``log(exp(a) + exp(b))`` without overflow."""
+    if a < b:
+        a, b = b, a
+    if b == NEVER:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+def rank_of(frequency: float, rate: float, timestamp: Optional[float] = None) -> float:
+    """Rank contribution of ``frequency`` observed at ``timestamp`` (now)."""
+    if frequency <= 0:
+        return NEVER
+    if timestamp is None:
+        timestamp = time.time()
+    return math.log(frequency) + rate * timestamp
+
+
+def score_of(rank: float, rate: float, now: Optional[float] = None) -> float:
+    """Decayed score at ``now`` of a key with ``rank``."""
+    if rank == NEVER:
+        return 0.0
+    if now is None:
+        now = time.time()
+    return math.exp(rank - rate * now)
+
+
+class TopQueries:
+    """
+    Exact top-``size`` of a growing rank column, maintained incrementally.
+
+    Ranks only ever increase, so an outsider can only enter when its own
+    rank is bumped, which is when ``update`` is called for it. Members live
+    in a min-heap with lazy deletion: a bumped member pushes a new entry
+    and its old one is dropped when it surfaces.
+    """
+
+    def __init__(self, size: int = 100):
+        self.size = size
+        self.members: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+        # Returns the rank column to rebuild from before the next use
+        self._pending: Optional[Callable[[], Sequence[float]]] = None
+
+    def defer_rebuild(self, ranks: Callable[[], Sequence[float]]):
+        """
+        ``rebuild`` from the column ``ranks()`` returns on first use instead
+        of now, so loading a snapshot that never answers top-query requests
+        does not scan it. The column is fetched then, as it may have been
+        replaced (copied on write) in the meantime.
+        """
+        self.members = {}
+        self._heap = []
+        self._pending = ranks
+
+    def _catch_up(self):
+        if self._pending is not None:
+            self.rebuild(self._pending())
+
+    def rebuild(self, ranks: Sequence[float]):
+        """Select the top members from a full rank column (e.g. after a load)."""
+        self._pending = None
+        best = heapq.nlargest(
+            self.size,
+            (i for i in range(len(ranks)) if ranks[i] != NEVER),
+            key=ranks.__getitem__,
+        )
+        self.members = {i: ranks[i] for i in best}
+        self._heap = [(rank, i) for i, rank in self.members.items()]
+        heapq.heapify(self._heap)
+
+    def update(self, item: int, rank: float):
+        """Record that ``item``'s rank grew to ``rank``."""
+        self._catch_up()
+        members = self.members
+        if item in members:
+            members[item] = rank
+            heapq.heappush(self._heap, (rank, item))
+            if len(self._heap) > 4 * self.size:
+                self._heap = [(r, i) for i, r in members.items()]
+                heapq.heapify(self._heap)
+            return
+        if rank == NEVER:
+            return
+        if len(members) < self.size:
+            members[item] = rank
+            heapq.heappush(self._heap, (rank, item))
+            return
+
+        heap = self._heap
+        while members.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)  # stale entry of a bumped member
+        if rank > heap[0][0]:
+            _, evicted = heapq.heapreplace(heap, (rank, item))
+            del members[evicted]
+            members[item] = rank
+
+    def top(self, limit: int) -> List[int]:
+        """Best ``limit`` (<= ``size``) items, highest rank first."""
+        self._catch_up()
+        return heapq.nlargest(limit, self.members, key=self.members.__getitem__)
+
+    def copy(self) -> "TopQueries":
+        self._catch_up()
+        clone = TopQueries(self.size)
+        clone.members = dict(self.members)
+        clone._heap = list(self._heap)
+        return clone
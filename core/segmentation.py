@@ -0,0 +1,81 @@
+"""
+Query tokenization shared by the trie and its bulk builder.
+
+Kept free of trie state and import side effects so that process-pool
+workers can import it cheaply.
+"""
+
+import re
+from collections import Counter
+from typing import List, Tuple
+
+import jieba
+
+# 只对含中文的长词提取子词；英文单词由 jieba 原样返回，不需要再拆
+_CJK = re.compile(r"[\u4e00-\u9fff]")
+
+
+def tokenize(text: str, subwords: bool = True) -> List[str]:
+    """
+    将文本切分为单个 token（中文词、英文单词），用于倒排索引
+
+    Args:
+        text (str): 输入文本
+        subwords (bool): 是否附加长中文词的 2-3 字子词
+
+    Returns:
+        List[str]: 小写、去重后的 token，保持出现顺序
+    """
+    text = text.strip()
+
+    # 中文分词
+    chinese_words = jieba.lcut(text)
+    chinese_words = [
+        w.strip()
+        for w in chinese_words
+        if w.strip()
+        and len(w.strip()) > 1
+        and w.strip() not in '，。？！；：""（）【】'
+    ]
+
+    # 英文分词
+    english_words = re.findall(r"\b[a-zA-Z]+\b", text)
+    english_words = [w.strip() for w in english_words if len(w.strip()) > 1]
+
+    tokens = []
+    for word in chinese_words:
+        tokens.append(word)
+        # 对长词再次分解（处理 jieba 可能的过度组合）
+        if subwords and len(word) > 2 and _CJK.search(word):
+            # 尝试提取2-3字的子词
+            for i in range(len(word) - 1):
+                for j in range(i + 2, min(i + 4, len(word) + 1)):
+                    tokens.append(word[i:j])
+    tokens.extend(english_words)
+
+    # 去重并返回（保持生成顺序，使插入顺序和快照内容可复现）
+    return list(dict.fromkeys(token.lower() for token in tokens))
+
+
+def segment_chunk(
+    lines: List[str], segmentation: bool = True
+) -> List[Tuple[str, int, List[str]]]:
+    """
+    Tokenize a chunk of raw query lines for the bulk builder.
+
+    Repeated queries are collapsed, keeping first-occurrence order, so the
+    parent inserts each distinct query once with its count.
+
+    Args:
+        lines (List[str]): Raw lines, one query per line
+        segmentation (bool): Whether to tokenize at all
+
+    Returns:
+        List[Tuple[str, int, List[str]]]: ``(query, count, tokens)`` rows
+    """
+    counts = Counter(line.strip() for line in lines)
+    counts.pop("", None)
+    return [
+        (query, count, tokenize(query) if segmentation else [])
+        for query, count in counts.items()
+    ]
@@ -1,6 +1,6 @@
 from core.vectordb import client
 from qdrant_client import models
-from core.embedding import dense_embedding_model, sparse_embedding_model
+from core.embedding import get_dense_embedding_model, get_sparse_embedding_model
 import uuid
 import traceback
 
@@ -49,8 +49,8 @@ class SemanticSearchCache:
                 print(f"Embedding text: {combined_text}")
                 texts.append(combined_text)
 
-            dense_embeddings = list(dense_embedding_model.embed(texts))
-            sparse_embeddings = list(sparse_embedding_model.embed(texts))
+            dense_embeddings = list(get_dense_embedding_model().embed(texts))
+            sparse_embeddings = list(get_sparse_embedding_model().embed(texts))
 
             # upsert to Qdrant
             points = [
@@ -89,12 +89,12 @@ class SemanticSearchCache:
         try:
             prefetch = [
                 models.Prefetch(
-                    query=next(dense_embedding_model.query_embed(query)),
+                    query=next(get_dense_embedding_model().query_embed(query)),
                     using="bge_dense_vector",
                     limit=k * 2,
                 ),
                 models.Prefetch(
-                    query=(next(sparse_embedding_model.query_embed(query)).as_object()),
+                    query=(next(get_sparse_embedding_model().query_embed(query)).as_object()),
                     using="bm25_sparse_vector",
                     limit=k * 2,
                 ),
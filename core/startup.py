@@ -0,0 +1,69 @@
+"""
+Ordered warm-up phases for the API process, with per-phase timings.
+
+The server accepts connections immediately (liveness) and reports ready
+only once every phase has completed successfully (readiness).
+"""
+
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class StartupProfile:
+    """Runs named warm-up phases in order and records how long each took."""
+
+    def __init__(self):
+        self.phases: List[Dict[str, Any]] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def run(self, phases: List[Tuple[str, Callable[[], Any]]]):
+        """
+        Run ``phases`` one after another; a failed phase is recorded and
+        the remaining phases still run.
+
+        Args:
+            phases (List[Tuple[str, Callable]]): ``(name, callable)`` pairs
+        """
+        with self._lock:
+            self.started_at = time.time()
+            self.phases = [
+                {"name": name, "status": "pending", "seconds": None}
+                for name, _ in phases
+            ]
+
+        for phase, (name, warm_up) in zip(self.phases, phases):
+            phase["status"] = "running"
+            start = time.perf_counter()
+            try:
+                warm_up()
+                phase["status"] = "ok"
+            except Exception as e:
+                phase["status"] = "failed"
+                phase["error"] = str(e)
+                print(f"Startup phase '{name}' failed: {e}")
+                traceback.print_exc()
+            phase["seconds"] = round(time.perf_counter() - start, 4)
+            print(f"Startup phase '{name}' {phase['status']} in {phase['seconds']}s")
+
+        self.finished_at = time.time()
+
+    @property
+    def ready(self) -> bool:
+        """Whether every phase has finished successfully."""
+        return self.finished_at is not None and all(
+            phase["status"] == "ok" for phase in self.phases
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        total = None
+        if self.started_at is not None:
+            total = round((self.finished_at or time.time()) - self.started_at, 4)
+        return {
+            "ready": self.ready,
+            "total_seconds": total,
+            "phases": [dict(phase) for phase in self.phases],
+        }
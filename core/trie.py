@@ -1,17 +1,34 @@
 """
 Trie data structure for autocomplete functionality.
-Supports persistence, LRU cache, frequency-based suggestions,
+Supports persistence, LRU cache, time-decayed frequency ranking,
 word segmentation, and fuzzy matching.
 """
 
+import asyncio
+import atexit
+import fcntl
+import heapq
+from array import array
+from bisect import bisect_left
 import pickle
-from typing import List, Optional, Dict
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
 from functools import lru_cache
-from collections import defaultdict
+from itertools import islice
+from typing import Iterator, List, Dict, Optional, Tuple
+from collections import defaultdict, deque
 import os
 import re
 import jieba
 
+from core.radix_trie import NO_NODE, QueryFrequencyView, RadixTrie, SnapshotError
+from core.ranking import TopQueries, decay_rate
+from core.hot_prefixes import MATCH_TYPES, ROW, HotPrefixTable
+from core.segmentation import segment_chunk, tokenize
+from core.suggestion_cache import SuggestionCache
+from core.trie_journal import FrequencyJournal, UpdateInbox
+
 STOP_WORDS = {
     "in",
     "out",
@@ -185,15 +202,121 @@ STOP_WORDS = {
 MIN_WORD_LENGTH = 2
 
 
-class TrieNode:
-    """A single node in the Trie data structure."""
+@lru_cache(maxsize=4096)
+def _is_valid_text(check_word: str) -> bool:
+    """
+    ``AutocompleteTrie._is_valid_suggestion`` on normalized text. Stored
+    queries are checked once at insert (``RadixTrie.set_valid``); the memo
+    covers the typed queries checked per request.
+    """
+    # 过滤过短的词
+    if len(check_word) < MIN_WORD_LENGTH:
+        return False
+
+    # 过滤停用词
+    if check_word in STOP_WORDS:
+        return False
+
+    # 过滤只包含停用词的组合
+    words = re.findall(r"\b\w+\b", check_word)
+    if words and all(w in STOP_WORDS for w in words):
+        return False
+
+    return True
+
+
+def _descending(rank):
+    """Sort key putting larger ranks (floats or tuples of them) first."""
+    if isinstance(rank, tuple):
+        return tuple(-part for part in rank)
+    return -rank
+
+
+def _merge_stages(stages: List[Tuple[int, Iterator]]) -> Iterator:
+    """
+    ``heapq.merge`` of ranked stages keyed by (priority, -rank).
+
+    ``stages`` are ``(priority, iterator)`` pairs sorted by priority; each
+    iterator yields ``(rank, item)`` pairs, best rank first, and the merge
+    yields the items. Ranks are floats, or tuples compared in order (within
+    one stage they are all of one kind). Unlike ``heapq.merge``, a stage is only started once
+    nothing of higher priority is left on the heap, so a consumer that
+    stops early never runs the lower-priority stages.
+    """
+    pending = deque(stages)
+    heap = []
+    # tie keeps equal keys in push order and keeps items out of comparisons
+    tie = 0
+    while heap or pending:
+        while pending and (not heap or pending[0][0] <= heap[0][0]):
+            priority, stage = pending.popleft()
+            for rank, item in stage:
+                heapq.heappush(heap, (priority, _descending(rank), tie, item, stage))
+                tie += 1
+                break
+        if not heap:
+            continue
+        priority, _, _, item, stage = heapq.heappop(heap)
+        yield item
+        for rank, item in stage:
+            heapq.heappush(heap, (priority, _descending(rank), tie, item, stage))
+            tie += 1
+            break
+
+
+class _SearchBatch:
+    """Trie walks and segmentation shared by the prefixes of one batch."""
+
+    def __init__(self, located: Dict[str, Tuple[int, str]]):
+        self.located = located
+        self.tokens: Dict[Tuple[str, bool], List[str]] = {}
+        self.postings: Dict[str, List[int]] = {}
+        self.fuzzy_layers: Dict[int, Dict] = {}  # per max_distance
+
+
+class SearchBudget:
+    """
+    Time budget for one ``smart_search`` call, and a record of what each of
+    its stages did.
+
+    The exact prefix stage is bounded by the prefix length and always runs.
+    The partial and fuzzy stages are skipped if the budget is already spent
+    when they would start; partial matching also stops between tokens and
+    the fuzzy automaton between layers once it runs out. ``stages`` maps
+    each planned stage to ``"ran"``, ``"truncated"``, ``"skipped"`` or
+    ``"unused"`` (earlier stages already filled the result).
+    """
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.started = time.perf_counter()
+        self.deadline = self.started + budget_ms / 1000
+        self.stages: Dict[str, str] = {}
+        self.cached = False
+        # Set when a search stopped early; reset per stage by _stage
+        self.interrupted = False
+
+    def exhausted(self) -> bool:
+        if time.perf_counter() < self.deadline:
+            return False
+        self.interrupted = True
+        return True
 
-    def __init__(self):
-        self.children: Dict[str, "TrieNode"] = {}
-        self.is_end_of_word: bool = False
-        self.frequency: int = 0  # Track how often this word is used
-        self.word: Optional[str] = None  # Store the complete word at end nodes
-        self.original_word: Optional[str] = None  # Store the original complete query
+    @property
+    def degraded(self) -> bool:
+        """Whether a stage was skipped or cut short, so results may be partial."""
+        return any(
+            status in ("truncated", "skipped") for status in self.stages.values()
+        )
+
+    def report(self) -> Dict[str, any]:
+        return {
+            "budget_ms": self.budget_ms,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "cached": self.cached,
+            "degraded": self.degraded,
+            "stages": dict(self.stages),
+        }
 
 
 class AutocompleteTrie:
@@ -202,19 +325,111 @@ class AutocompleteTrie:
     Features:
     - Persistence to disk
     - Frequency-based ranking
-    - LRU cache for fast lookups
+    - Generation-keyed LRU cache for fast lookups
     - Prefix-based suggestions
+    - Compact array-backed radix storage (see core.radix_trie)
+    - Cached per-node top-K lists, so prefix lookups cost O(len(prefix))
+    - Exponentially decayed ranking (see core.ranking): recent use outranks
+      old counts, without any periodic re-decay
     """
 
     def __init__(
-        self, persistence_file: str = "models/autocomplete/enhanced_trie_data.pkl"
+        self,
+        persistence_file: str = "models/autocomplete/enhanced_trie_data.pkl",
+        journal: bool = False,
+        compact_every: int = 10000,
+        cache_size: int = 500,
+        half_life_days: Optional[float] = 30.0,
+        top_queries_size: int = 100,
+        max_queries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        prune_by: str = "rank",
+        hot_prefix_width: int = 10,
     ):
-        self.root = TrieNode()
+        """
+        Args:
+            persistence_file (str): Path of the binary trie snapshot
+            journal (bool): Log frequency updates to an append-only journal
+                instead of requiring a full save after each one
+            compact_every (int): Journal records after which the snapshot is
+                rewritten in the background
+            cache_size (int): Maximum cached suggestion lists
+            half_life_days (float, optional): Half-life of a use's weight in
+                the ranking; None disables decay. A loaded snapshot keeps the
+                rate it was built with.
+            top_queries_size (int): Queries tracked by the top-queries heap
+            max_queries (int, optional): Cap on original queries; see ``prune``
+            max_bytes (int, optional): Cap on ``RadixTrie.memory_bytes``
+            prune_by (str): What pruning keeps: ``"rank"`` (decayed score, so
+                queries not used lately go first) or ``"frequency"`` (raw
+                counts)
+            hot_prefix_width (int): ``max_suggestions`` that short prefixes
+                are materialized for
+        """
+        self.decay_rate = decay_rate(half_life_days)
+        self.root = RadixTrie(decay_rate=self.decay_rate)
+        self.top_queries = TopQueries(top_queries_size)
+        self.max_queries = max_queries
+        self.max_bytes = max_bytes
+        self.prune_by = prune_by
+        # Bumped on every mutation; cached suggestions are keyed by it
+        self.generation = 0
+        # Tells generations of independently loaded tries apart (see etag)
+        self.instance_id = os.urandom(6).hex()
+        # Inode and mtime of the snapshot while the trie still matches it
+        self._snapshot_tag: Optional[str] = None
+        self.suggestion_cache = SuggestionCache(cache_size)
+        # Final results of 1-3 character prefixes, see core.hot_prefixes
+        self.hot_prefixes = HotPrefixTable(width=hot_prefix_width)
         self.persistence_file = persistence_file
-        self.word_frequencies: Dict[str, int] = defaultdict(int)
         self.enable_word_segmentation = True  # 启用分词功能
+        self.compact_every = compact_every
+        self.journal = FrequencyJournal(persistence_file) if journal else None
+        self._compaction: Optional[threading.Thread] = None
+        # Duration of the last load/build/save/compaction, in seconds
+        self.timings: Dict[str, float] = {}
+        # (time.monotonic(), total frequency, RadixTrie.structure_stats())
+        # of the last full scan made by get_stats
+        self._structure_stats: Optional[Tuple[float, int, Dict[str, any]]] = None
+        # Updates applied since fork(), for the fork to catch up on
+        self._updates_since_fork: Optional[
+            List[Tuple[str, int, float, Optional[List[str]]]]
+        ] = None
         self._create_data_dir()
         self.load_from_disk()
+        if self.journal is not None:
+            atexit.register(self.journal.close)
+
+    @property
+    def enable_word_segmentation(self) -> bool:
+        return self._word_segmentation
+
+    @enable_word_segmentation.setter
+    def enable_word_segmentation(self, enabled: bool):
+        # 分词开关会改变部分匹配结果，已物化的短前缀结果作废
+        self._word_segmentation = enabled
+        self.hot_prefixes.clear()
+
+    @property
+    def etag(self) -> str:
+        """
+        Strong HTTP entity tag for suggestions served at this generation.
+
+        Until the first mutation after loading a snapshot, the tag names
+        the snapshot file, so every worker mapping it (see
+        ``SharedTrieHolder``) hands out the same one. After that it is
+        ``instance_id`` plus the generation; forks keep ``instance_id`` but
+        always move to a newer generation (see ``adopt_updates``), so a tag
+        never names two contents.
+        """
+        if self._snapshot_tag is not None:
+            return f'"{self._snapshot_tag}"'
+        return f'"{self.instance_id}-{self.generation}"'
+
+    @property
+    def word_frequencies(self) -> QueryFrequencyView:
+        """Total frequency per original query, backed by the trie string table."""
+        return QueryFrequencyView(self.root)
 
     def _create_data_dir(self):
         """Create data directory if it doesn't exist."""
@@ -232,130 +447,84 @@ class AutocompleteTrie:
             bool: 是否为有效建议
         """
         # 使用原始词进行检查，如果没有则使用当前词
-        check_word = (original_word or word).strip().lower()
+        return _is_valid_text((original_word or word).strip().lower())
 
-        # 过滤过短的词
-        if len(check_word) < MIN_WORD_LENGTH:
-            return False
-
-        # 过滤停用词
-        if check_word in STOP_WORDS:
-            return False
-
-        # 过滤只包含停用词的组合
-        words = re.findall(r"\b\w+\b", check_word.lower())
-        if words and all(w in STOP_WORDS for w in words):
-            return False
-
-        return True
-
-    def _segment_text(self, text: str) -> List[str]:
-        """
-        对文本进行分词处理，生成多个搜索索引
+    def _tokenize(self, text: str, subwords: bool = True) -> List[str]:
+        """将文本切分为单个 token，见 ``core.segmentation.tokenize``"""
+        return tokenize(text, subwords)
 
-        Args:
-            text (str): 输入文本
-
-        Returns:
-            List[str]: 分词后的所有可能子串
-        """
-        segments = []
-        text = text.strip()
-
-        # 添加完整查询
-        segments.append(text)
-
-        # 中文分词
-        chinese_words = jieba.lcut(text)
-        chinese_words = [
-            w.strip()
-            for w in chinese_words
-            if w.strip()
-            and len(w.strip()) > 1
-            and w.strip() not in '，。？！；：""（）【】'
-        ]
-
-        # 生成中文词组合
-        for i in range(len(chinese_words)):
-            for j in range(i + 1, len(chinese_words) + 1):
-                segment = "".join(chinese_words[i:j]).strip()
-                if len(segment) > 1:
-                    segments.append(segment)
-
-        # 英文分词
-        english_words = re.findall(r"\b[a-zA-Z]+\b", text)
-        english_words = [w.strip() for w in english_words if len(w.strip()) > 1]
-
-        # 生成英文词组合
-        for i in range(len(english_words)):
-            for j in range(i + 1, len(english_words) + 1):
-                segment = " ".join(english_words[i:j]).strip()
-                if len(segment) > 1:
-                    segments.append(segment)
-
-        # 单独的中文词
-        for word in chinese_words:
-            if len(word) > 1:
-                segments.append(word)
-                # 对长词再次分解（处理 jieba 可能的过度组合）
-                if len(word) > 2:
-                    # 尝试提取2-3字的子词
-                    for i in range(len(word) - 1):
-                        for j in range(i + 2, min(i + 4, len(word) + 1)):
-                            sub_word = word[i:j]
-                            if len(sub_word) >= 2:
-                                segments.append(sub_word)
-
-        # 单独的英文单词
-        for word in english_words:
-            if len(word) > 1:
-                segments.append(word)
-
-        # 去重并返回
-        return list(set(segments))
-
-    def insert(self, word: str, frequency: int = 1):
+    def insert(
+        self, word: str, frequency: int = 1, timestamp: Optional[float] = None
+    ):
         """
         Insert a word into the trie with optional frequency.
-        支持分词处理，将长查询拆分成多个可搜索的片段。
+        支持分词处理：完整查询和每个 token 写入 Trie，
+        查询 id 写入 token 的倒排列表。
 
         Args:
             word (str): The word to insert
             frequency (int): The frequency/weight of this word
+            timestamp (float, optional): When it was used, defaults to now
         """
         if not word or not word.strip():
             return
 
         original_word = word.strip()
-
-        if self.enable_word_segmentation:
-            segments = self._segment_text(original_word)
-            for segment in segments:
-                self._insert_single(segment, original_word, frequency)
-        else:
-            self._insert_single(original_word, original_word, frequency)
-
-    def _insert_single(self, key: str, original_word: str, frequency: int):
-        """插入单个词到 Trie"""
-        key = key.lower()
-        node = self.root
-
-        # Traverse the trie, creating nodes as needed
-        for char in key:
-            if char not in node.children:
-                node.children[char] = TrieNode()
-            node = node.children[char]
-
-        # Mark end of word and update frequency
-        if node.is_end_of_word:
-            node.frequency += frequency
-        else:
-            node.is_end_of_word = True
-            node.frequency = frequency
-            node.word = key
-            node.original_word = original_word
-
-        self.word_frequencies[original_word] += frequency
+        tokens = self._tokenize(original_word) if self.enable_word_segmentation else []
+        self._insert_tokens(original_word, tokens, frequency, timestamp=timestamp)
+
+    def _insert_tokens(
+        self,
+        original_word: str,
+        tokens: List[str],
+        frequency: int,
+        promote: bool = True,
+        timestamp: Optional[float] = None,
+    ):
+        """插入完整查询及其已切分的 token，并登记倒排列表"""
+        trie = self.root
+        is_new_query = trie.string_id(original_word) is None
+
+        if timestamp is None:
+            timestamp = time.time()
+        query_id = trie.intern(original_word)
+        if is_new_query:
+            # 有效性只取决于原始查询，插入时算一次；无效的键不会进入 top-K
+            trie.set_valid(query_id, self._is_valid_suggestion(original_word))
+        query_node = self._insert_single(
+            original_word, original_word, frequency, promote, timestamp
+        )
+        for token in tokens:
+            if token == original_word.lower():
+                node = query_node
+            else:
+                node = self._insert_single(
+                    token, original_word, frequency, promote, timestamp
+                )
+            if is_new_query:
+                trie.add_posting(node, query_id)
+
+        trie.add_query_frequency(original_word, frequency, timestamp)
+        self.top_queries.update(query_id, trie.query_rank[query_id])
+        if promote:  # bulk loads rebuild the table once at the end
+            self.hot_prefixes.invalidate(
+                [original_word.lower(), *tokens], original_word
+            )
+        self.generation += 1
+        self._snapshot_tag = None
+
+    def _insert_single(
+        self,
+        key: str,
+        original_word: str,
+        frequency: int,
+        promote: bool = True,
+        timestamp: Optional[float] = None,
+    ) -> int:
+        """插入单个词到 Trie，返回其节点 id"""
+        return self.root.insert(
+            key.lower(), original_word, frequency, promote, timestamp
+        )
 
     def insert_batch(self, words: List[str]):
         """
@@ -374,17 +543,106 @@ class AutocompleteTrie:
         Args:
             file_path (str): Path to the text file containing search queries
         """
+        try:
+            count = 0
+            start = time.perf_counter()
+            with open(file_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self.insert(line)
+                        count += 1
+            if count:
+                self.materialize_hot_prefixes()
+            self.timings["build_seconds"] = time.perf_counter() - start
+            print(f"Loaded {count} queries from {file_path}")
+        except FileNotFoundError:
+            print(f"File not found: {file_path}")
+        except (IOError, OSError) as e:
+            print(f"Error loading from file: {e}")
+
+    def build_from_text_file(
+        self,
+        file_path: str,
+        workers: Optional[int] = None,
+        chunk_size: int = 5000,
+    ) -> int:
+        """
+        Bulk-load a large query log, segmenting it on several cores.
+
+        The file is streamed in chunks of ``chunk_size`` lines; chunks are
+        tokenized by a ``ProcessPoolExecutor`` (``core.segmentation``) and
+        merged into this trie in file order, so the result matches
+        ``load_from_text_file``. At most ``2 * workers`` chunks are in
+        flight, which bounds memory regardless of file size. Cached top-K
+        lists are rebuilt once at the end rather than per insert (equal
+        frequencies may then rank in a different order).
+
+        Args:
+            file_path (str): Path to the text file containing search queries
+            workers (int, optional): Worker processes, defaults to the CPU
+                count; 1 segments in-process
+            chunk_size (int): Lines per work unit
+
+        Returns:
+            int: Number of non-empty lines loaded
+        """
+        workers = workers or os.cpu_count() or 1
+        generation = self.generation
+        count = 0
+        start = time.perf_counter()
         try:
             with open(file_path, "r", encoding="utf-8") as f:
-                words = [line.strip() for line in f if line.strip()]
-                self.insert_batch(words)
-            print(f"Loaded {len(words)} queries from {file_path}")
+                chunks = iter(lambda: list(islice(f, chunk_size)), [])
+                if workers == 1:
+                    results = (
+                        segment_chunk(chunk, self.enable_word_segmentation)
+                        for chunk in chunks
+                    )
+                    count = self._merge_segmented(results)
+                else:
+                    with ProcessPoolExecutor(
+                        max_workers=workers, initializer=jieba.initialize
+                    ) as pool:
+                        count = self._merge_segmented(
+                            self._segment_in_pool(pool, chunks, 2 * workers)
+                        )
+            print(f"Loaded {count} queries from {file_path}")
         except FileNotFoundError:
             print(f"File not found: {file_path}")
         except (IOError, OSError) as e:
             print(f"Error loading from file: {e}")
+        finally:
+            if self.generation != generation:
+                self.root.rebuild_top()
+                self.materialize_hot_prefixes()
+            self.timings["build_seconds"] = time.perf_counter() - start
+        return count
+
+    def _segment_in_pool(
+        self, pool: ProcessPoolExecutor, chunks: Iterator[List[str]], window: int
+    ) -> Iterator[List[Tuple[str, int, List[str]]]]:
+        """Yield segmented chunks in input order, ``window`` chunks in flight."""
+        pending = deque()
+        for chunk in chunks:
+            pending.append(
+                pool.submit(segment_chunk, chunk, self.enable_word_segmentation)
+            )
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _merge_segmented(
+        self, results: Iterator[List[Tuple[str, int, List[str]]]]
+    ) -> int:
+        """Insert ``(query, count, tokens)`` rows; returns the line count."""
+        count = 0
+        for rows in results:
+            for query, occurrences, tokens in rows:
+                self._insert_tokens(query, tokens, occurrences, promote=False)
+                count += occurrences
+        return count
 
-    @lru_cache(maxsize=1000)
     def search(self, word: str) -> bool:
         """
         Check if a word exists in the trie.
@@ -395,27 +653,24 @@ class AutocompleteTrie:
         Returns:
             bool: True if word exists, False otherwise
         """
-        word = word.strip().lower()
-        node = self.root
-
-        for char in word:
-            if char not in node.children:
-                return False
-            node = node.children[char]
+        return self.root.find(word.strip().lower()) != NO_NODE
 
-        return node.is_end_of_word
-
-    @lru_cache(maxsize=500)
     def get_suggestions(
-        self, prefix: str, max_suggestions: int = 10
+        self,
+        prefix: str,
+        max_suggestions: int = 10,
+        budget: Optional[SearchBudget] = None,
     ) -> List[Dict[str, any]]:
         """
         Get autocomplete suggestions for a given prefix.
         现在支持智能匹配，包括分词匹配和模糊匹配。
+        Results are cached per normalized prefix and trie generation.
 
         Args:
             prefix (str): The prefix to search for
             max_suggestions (int): Maximum number of suggestions to return
+            budget (SearchBudget, optional): Time budget for the search;
+                degraded results are returned but not cached
 
         Returns:
             List[Dict]: List of suggestions with word and frequency
@@ -423,10 +678,199 @@ class AutocompleteTrie:
         if not prefix or not prefix.strip():
             return []
 
-        return self.smart_search(prefix, max_suggestions)
+        normalized = prefix.strip().lower()
+        hot = self.hot_prefixes.covers(normalized, max_suggestions)
+        if hot:
+            entry = self.hot_prefixes.get(normalized)
+            if entry is not None:
+                if budget is not None:
+                    budget.cached = True
+                return self._unpack_suggestions(entry)
+
+        key = (normalized, max_suggestions, self.generation)
+        suggestions = self.suggestion_cache.get(key)
+        if suggestions is not None:
+            if budget is not None:
+                budget.cached = True
+            return suggestions
+
+        if hot:
+            suggestions = self._hot_search(prefix, budget=budget)
+            if suggestions:
+                return suggestions  # kept in the hot table instead
+        else:
+            suggestions = self.smart_search(prefix, max_suggestions, budget=budget)
+        if budget is None or not budget.degraded:
+            self.suggestion_cache.put(key, suggestions)
+        return suggestions
+
+    def get_suggestions_batch(
+        self, prefixes: List[str], max_suggestions: int = 10
+    ) -> List[List[Dict[str, any]]]:
+        """
+        Get autocomplete suggestions for many prefixes in one call.
+
+        Cached prefixes are answered directly. The rest share one sorted
+        trie walk (``RadixTrie.locate_many``), so a common stem is walked
+        once, and share tokenization and posting lookups for repeated
+        tokens.
+
+        Args:
+            prefixes (List[str]): Prefixes to complete
+            max_suggestions (int): Maximum number of suggestions per prefix
+
+        Returns:
+            List[List[Dict]]: Suggestion lists in the order of ``prefixes``
+        """
+        generation = self.generation
+        hot = self.hot_prefixes
+        results: Dict[str, List[Dict[str, any]]] = {"": []}
+        pending = {}
+        for prefix in prefixes:
+            normalized = (prefix or "").strip().lower()
+            if normalized in results or normalized in pending:
+                continue
+            cached = None
+            if hot.covers(normalized, max_suggestions):
+                entry = hot.get(normalized)
+                if entry is not None:
+                    cached = self._unpack_suggestions(entry)
+            if cached is None:
+                cached = self.suggestion_cache.get(
+                    (normalized, max_suggestions, generation)
+                )
+            if cached is None:
+                pending[normalized] = prefix.strip()
+            else:
+                results[normalized] = cached
+
+        if pending:
+            batch = _SearchBatch(self.root.locate_many(pending))
+            for normalized, prefix in pending.items():
+                if hot.covers(normalized, max_suggestions):
+                    suggestions = self._hot_search(prefix, batch)
+                else:
+                    suggestions = self.smart_search(
+                        prefix, max_suggestions, batch=batch
+                    )
+                if not suggestions or not hot.covers(normalized, max_suggestions):
+                    self.suggestion_cache.put(
+                        (normalized, max_suggestions, generation), suggestions
+                    )
+                results[normalized] = suggestions
+
+        return [results[(prefix or "").strip().lower()] for prefix in prefixes]
+
+    def _hot_search(
+        self,
+        prefix: str,
+        batch: Optional[_SearchBatch] = None,
+        budget: Optional[SearchBudget] = None,
+    ) -> List[Dict[str, any]]:
+        """
+        ``smart_search`` a short prefix at the hot table's width and store
+        the results there, unless they are empty or degraded.
+        """
+        hot = self.hot_prefixes
+        version = hot.version
+        if batch is None:
+            batch = _SearchBatch({})
+        suggestions = self.smart_search(prefix, hot.width, batch=batch, budget=budget)
+        if suggestions and (budget is None or not budget.degraded):
+            normalized = prefix.strip().lower()
+            # 部分匹配实际查过的 token，供失效时反查
+            tokens = batch.tokens.get((normalized, False), ())
+            hot.put(
+                normalized,
+                self._pack_suggestions(suggestions),
+                tokens,
+                version,
+            )
+        return suggestions
+
+    def _pack_suggestions(
+        self, suggestions: List[Dict[str, any]]
+    ) -> Tuple[array, Tuple[str, ...]]:
+        """Pack ``smart_search`` results into hot-table rows (see ``ROW``)."""
+        trie = self.root
+        rows = array("i")
+        words: List[str] = []
+        for s in suggestions:
+            match_type = MATCH_TYPES.index(s["match_type"])
+            word = 0
+            if s["match_type"] == "partial":
+                # The query's full text is a key; its owner is the query
+                # unless another spelling of it owns the key
+                original = s["original_word"]
+                node = trie.find(original.lower())
+                ident = trie.original[node] if node != NO_NODE else NO_NODE
+                if ident == NO_NODE or trie.strings[ident] != original:
+                    ident = trie.string_id(original)
+                if s["word"] not in words:
+                    words.append(s["word"])
+                word = words.index(s["word"])
+            else:
+                ident = trie.find(s["word"])
+            rows.extend((match_type, ident, s.get("distance", 0), word))
+        return rows, tuple(words)
+
+    def _unpack_suggestions(
+        self, entry: Tuple[array, Tuple[str, ...]]
+    ) -> List[Dict[str, any]]:
+        """Suggestion dicts of a hot-table entry, as ``smart_search`` built them."""
+        rows, words = entry
+        suggestions = []
+        for i in range(0, len(rows), ROW):
+            match_type, ident, distance, word = rows[i : i + ROW]
+            if match_type == 1:
+                s = self._query_suggestion(ident, words[word])
+            elif match_type == 2:
+                s = self._key_suggestion(ident, distance=distance)
+            else:
+                s = self._key_suggestion(ident)
+            s["match_type"] = MATCH_TYPES[match_type]
+            suggestions.append(s)
+        return suggestions
+
+    def materialize_hot_prefixes(self) -> int:
+        """
+        Fill the hot-prefix table with every short prefix of a key in the
+        trie. Prefixes whose search comes back empty are not stored.
+
+        Returns:
+            int: Number of entries in the table
+        """
+        hot = self.hot_prefixes
+        hot.clear()
+        start = time.perf_counter()
+        batch, version = None, None
+        for prefix in self.root.short_prefixes(hot.max_length):
+            if len(prefix) < hot.min_length:
+                continue
+            if hot.version != version:
+                # Memoized walks and postings may predate a concurrent update
+                batch, version = _SearchBatch({}), hot.version
+            self._hot_search(prefix, batch)
+        self.timings["hot_prefixes_seconds"] = time.perf_counter() - start
+        return len(hot)
+
+    def _locate(
+        self, prefix: str, batch: Optional[_SearchBatch] = None
+    ) -> Tuple[int, str]:
+        """``RadixTrie.locate``, memoized across a batch."""
+        if batch is None:
+            return self.root.locate(prefix)
+        located = batch.located.get(prefix)
+        if located is None:
+            located = batch.located[prefix] = self.root.locate(prefix)
+        return located
 
     def smart_search(
-        self, query: str, max_suggestions: int = 10
+        self,
+        query: str,
+        max_suggestions: int = 10,
+        batch: Optional[_SearchBatch] = None,
+        budget: Optional[SearchBudget] = None,
     ) -> List[Dict[str, any]]:
         """
         智能搜索，结合多种策略，并过滤停用词和过短结果
@@ -434,6 +878,9 @@ class AutocompleteTrie:
         Args:
             query (str): 搜索查询
             max_suggestions (int): 最大建议数量
+            batch (_SearchBatch, optional): 批量请求共享的遍历与分词结果
+            budget (SearchBudget, optional): 时间预算；用完后跳过或截断
+                分词与模糊阶段，并记录各阶段的执行情况
 
         Returns:
             List[Dict]: 搜索建议列表
@@ -447,67 +894,99 @@ class AutocompleteTrie:
         if not self._is_valid_suggestion(query):
             return []
 
-        all_suggestions = []
-
+        lowered = query.lower()
+        # 各阶段按优先级排列：精确前缀 > 分词部分匹配 > 模糊匹配；
+        # 阶段在被消费时才执行，前面的阶段已填满结果时后面的阶段不会运行
         # 1. 精确前缀匹配
-        exact_matches = self._prefix_search(query.lower(), max_suggestions)
-        # 过滤有效建议
-        filtered_exact = [
-            {**s, "match_type": "exact"}
-            for s in exact_matches
-            if self._is_valid_suggestion(s["word"], s.get("original_word"))
-        ]
-        all_suggestions.extend(filtered_exact)
-
-        # 2. 分词后的部分匹配
+        exact = self._stage(
+            "exact",
+            self._prefix_search,
+            lowered,
+            max_suggestions,
+            batch,
+            budget=budget,
+        )
+        stages = [(0, exact)]
         if self.enable_word_segmentation:
-            segments = self._segment_text(query)
-            for segment in segments:
-                if segment.lower() != query.lower():
-                    partial_matches = self._prefix_search(
-                        segment.lower(), max_suggestions // 2
-                    )
-                    # 过滤有效建议
-                    filtered_partial = [
-                        {**s, "match_type": "partial"}
-                        for s in partial_matches
-                        if self._is_valid_suggestion(s["word"], s.get("original_word"))
-                    ]
-                    all_suggestions.extend(filtered_partial)
-
-        # 3. 模糊匹配（编辑距离 <= 1）
+            # 2. 分词后的部分匹配（倒排列表求交）
+            partial = self._stage(
+                "partial",
+                self._partial_search,
+                query,
+                max_suggestions,
+                batch,
+                budget=budget,
+            )
+            stages.append((1, partial))
         if len(query) > 2:  # 只对长度大于2的查询进行模糊匹配
-            fuzzy_matches = self._fuzzy_search(
-                query.lower(), max_distance=1, max_suggestions=max_suggestions // 2
+            # 3. 模糊匹配（编辑距离 <= 1）
+            fuzzy = self._stage(
+                "fuzzy",
+                self._fuzzy_search,
+                lowered,
+                max_distance=1,
+                max_suggestions=max_suggestions // 2,
+                batch=batch,
+                budget=budget,
             )
-            # 过滤有效建议
-            filtered_fuzzy = [
-                {**s, "match_type": "fuzzy"}
-                for s in fuzzy_matches
-                if self._is_valid_suggestion(s["word"], s.get("original_word"))
-            ]
-            all_suggestions.extend(filtered_fuzzy)
+            stages.append((2, fuzzy))
 
-        # 去重并排序
+        # 按 (匹配类型优先级, 衰减排名) 归并，边归并边去重，够数即停
         seen = set()
-        unique_suggestions = []
-        for s in all_suggestions:
+        suggestions = []
+        for s in _merge_stages(stages):
             # 使用原始词作为去重键
             original = s.get("original_word", s["word"])
-            if original not in seen:
-                seen.add(original)
-                unique_suggestions.append(s)
-
-        # 按匹配类型和频率排序
-        match_type_priority = {"exact": 0, "partial": 1, "fuzzy": 2}
-        unique_suggestions.sort(
-            key=lambda x: (match_type_priority.get(x["match_type"], 3), -x["frequency"])
-        )
-
-        return unique_suggestions[:max_suggestions]
+            if original in seen:
+                continue
+            seen.add(original)
+            suggestions.append(s)
+            if len(suggestions) >= max_suggestions:
+                break
+        if budget is not None:
+            # 未执行的阶段：前面的阶段已经填满了结果
+            for priority, _ in stages:
+                match_type = MATCH_TYPES[priority]
+                budget.stages.setdefault(match_type, "unused")
+        return suggestions
+
+    def _stage(
+        self,
+        match_type: str,
+        search,
+        *args,
+        budget: Optional[SearchBudget] = None,
+        **kwargs,
+    ) -> Iterator[Tuple[float, Dict[str, any]]]:
+        """
+        Lazily run one smart_search stage and yield ``(rank, suggestion)``
+        pairs of its valid suggestions in rank order, tagged with
+        ``match_type``. The search only runs when the first suggestion is
+        requested; stages after the exact one are skipped if ``budget`` is
+        already spent by then, and ``budget`` is passed on to the search.
+        """
+        if budget is not None:
+            if match_type != "exact" and budget.exhausted():
+                budget.stages[match_type] = "skipped"
+                return
+            budget.interrupted = False
+        results = search(*args, budget=budget, with_rank=True, **kwargs)
+        if budget is not None:
+            budget.stages[match_type] = (
+                "truncated" if budget.interrupted else "ran"
+            )
+        for rank, s in results:
+            # 无效建议在插入时已排除；各阶段返回的都是新建的 dict，可直接标注
+            s["match_type"] = match_type
+            yield rank, s
 
     def _prefix_search(
-        self, prefix: str, max_suggestions: int = 10
+        self,
+        prefix: str,
+        max_suggestions: int = 10,
+        batch: Optional[_SearchBatch] = None,
+        budget: Optional[SearchBudget] = None,
+        with_rank: bool = False,
     ) -> List[Dict[str, any]]:
         """
         传统的前缀搜索
@@ -515,237 +994,1209 @@ class AutocompleteTrie:
         Args:
             prefix (str): 搜索前缀
             max_suggestions (int): 最大建议数量
+            batch (_SearchBatch, optional): 批量请求共享的遍历结果
+            budget (SearchBudget, optional): 不检查；遍历代价只与前缀长度
+                有关，总是完整执行
+            with_rank (bool): 返回 ``(rank, suggestion)`` 对
 
         Returns:
             List[Dict]: 搜索结果
         """
-        node = self.root
+        # Navigate to the prefix node (possibly in the middle of an edge)
+        node, _ = self._locate(prefix, batch)
+        if node == NO_NODE:
+            return []
+
+        # Cached per-node top-K answers; larger limits expand best-first
+        return self._key_suggestions(
+            self.root.best_keys(node, max_suggestions), with_rank
+        )
 
-        # Navigate to the prefix node
-        for char in prefix:
-            if char not in node.children:
-                return []
-            node = node.children[char]
+    def _partial_search(
+        self,
+        query: str,
+        max_suggestions: int = 10,
+        batch: Optional[_SearchBatch] = None,
+        budget: Optional[SearchBudget] = None,
+        with_rank: bool = False,
+    ) -> List[Dict[str, any]]:
+        """
+        通过 token 倒排列表查找包含查询各部分的完整查询
+
+        The best ``max_suggestions`` queries containing every token of
+        ``query`` come first, best rank first. After them, each token's own
+        best ``max_suggestions // 2`` queries (like the old per-segment
+        prefix searches) are merged best rank first; a query found both
+        ways is reported once, as an intersection match. A query that is a
+        single token is looked up itself, for ``max_suggestions`` queries:
+        its key alone answers only for the one query owning it. Every token
+        also matches as a prefix through the tokens cached in its top-K
+        list. Once ``budget`` is spent the remaining tokens are dropped, and
+        the intersection is skipped unless every token was looked up.
 
-        # Collect all words with this prefix
+        Args:
+            query (str): 搜索查询
+            max_suggestions (int): 最大建议数量
+            batch (_SearchBatch, optional): 批量请求共享的分词与倒排列表
+            budget (SearchBudget, optional): 时间预算
+            with_rank (bool): 返回 ``(rank, suggestion)`` 对；rank 为
+                ``(是否命中全部 token, 查询排名)``
+
+        Returns:
+            List[Dict]: 部分匹配结果，``word`` 为命中的 token
+        """
+        query_key = query.strip().lower()
+        if batch is None:
+            tokens = self._tokenize(query, subwords=False)
+        else:
+            tokens = batch.tokens.get((query_key, False))
+            if tokens is None:
+                tokens = batch.tokens[query_key, False] = self._tokenize(
+                    query, subwords=False
+                )
+        # 查询本身就是一个 token 时查它自己的倒排列表
+        tokens = [t for t in tokens if t != query_key] or tokens[:1]
+        if not tokens:
+            return []
+        per_token = max_suggestions // 2 if len(tokens) > 1 else max_suggestions
+
+        trie = self.root
+        rank = trie.query_rank.__getitem__
+        valid = trie.query_valid
+        postings = []
+        for token in tokens:
+            if budget is not None and budget.exhausted():
+                break
+            postings.append(self._token_postings(token, batch))
+
+        # 交集命中排在前面；各 token 的候选列表按排名降序归并
+        shared = []
+        if len(tokens) > 1 and len(postings) == len(tokens):
+            shared = self._intersect_postings(postings)
+            shared = (query_id for query_id in shared if valid[query_id])
+            shared = heapq.nlargest(max_suggestions, shared, key=rank)
+        candidates = []
+        for token, posting in zip(tokens, postings):
+            if budget is not None and budget.exhausted():
+                break
+            posting = (query_id for query_id in posting if valid[query_id])
+            best = heapq.nlargest(per_token, posting, key=rank)
+            candidates.append([(query_id, token) for query_id in best])
+
+        shared_ids = set(shared)
+        matches = [(query_id, " ".join(tokens)) for query_id in shared]
+        matches.extend(
+            heapq.merge(*candidates, key=lambda match: -rank(match[0]))
+        )
         suggestions = []
-        self._collect_words(node, prefix, suggestions)
+        seen = set()
+        for query_id, word in matches:
+            if query_id in seen:
+                continue
+            seen.add(query_id)
+            s = self._query_suggestion(query_id, word)
+            if with_rank:
+                s = ((int(query_id in shared_ids), rank(query_id)), s)
+            suggestions.append(s)
+        return suggestions
+
+    def _token_postings(
+        self, token: str, batch: Optional[_SearchBatch] = None
+    ) -> List[int]:
+        """Sorted ids of the queries containing ``token`` or a cached extension."""
+        if batch is not None:
+            postings = batch.postings.get(token)
+            if postings is None:
+                postings = batch.postings[token] = self._token_postings(token)
+            return postings
+
+        trie = self.root
+        node, _ = trie.locate(token)
+        if node == NO_NODE:
+            return []
+        candidates = [trie.find(token), *trie.top_keys(node, trie.top_k)]
+        lists = []
+        for key in dict.fromkeys(candidates):
+            if key != NO_NODE:
+                posting = trie.postings_of(key)
+                if len(posting):
+                    lists.append(posting)
+        if len(lists) == 1:
+            return list(lists[0])
+        return list(dict.fromkeys(heapq.merge(*lists)))
+
+    @staticmethod
+    def _intersect_postings(postings: List[List[int]]) -> List[int]:
+        """Intersect sorted posting lists, probing from the shortest."""
+        postings = sorted(postings, key=len)
+        shared = postings[0]
+        for other in postings[1:]:
+            if not shared:
+                break
+            shared = [
+                query_id
+                for query_id in shared
+                if (i := bisect_left(other, query_id)) < len(other)
+                and other[i] == query_id
+            ]
+        return shared
 
-        # Sort by frequency (descending) and return top suggestions
-        suggestions.sort(key=lambda x: x["frequency"], reverse=True)
-        return suggestions[:max_suggestions]
+    def _query_suggestion(self, query_id: int, word: str) -> Dict[str, any]:
+        """Build a suggestion dict for original query ``query_id``."""
+        trie = self.root
+        return {
+            "word": word,
+            "original_word": trie.strings[query_id],
+            "frequency": trie.query_frequency[query_id],
+        }
 
     def _fuzzy_search(
-        self, prefix: str, max_distance: int = 1, max_suggestions: int = 10
+        self,
+        prefix: str,
+        max_distance: int = 1,
+        max_suggestions: int = 10,
+        max_steps: int = 20000,
+        batch: Optional[_SearchBatch] = None,
+        budget: Optional[SearchBudget] = None,
+        with_rank: bool = False,
     ) -> List[Dict[str, any]]:
         """
         模糊搜索，支持编辑距离
 
+        Matching subtrees come from a bounded Levenshtein automaton walk
+        (``RadixTrie.fuzzy_prefix_nodes``) and are answered from their cached
+        top-K lists, nearest distance first; later distances are skipped once
+        ``max_suggestions`` results are in hand. The kept results are
+        returned best rank first.
+
         Args:
             prefix (str): 搜索前缀
             max_distance (int): 最大编辑距离
             max_suggestions (int): 最大建议数量
+            max_steps (int): 自动机最多处理的字符步数
+            batch (_SearchBatch, optional): 批量请求共享的遍历结果
+            budget (SearchBudget, optional): 时间预算；用完后自动机停止，
+                不返回模糊结果
+            with_rank (bool): 返回 ``(rank, suggestion)`` 对
 
         Returns:
             List[Dict]: 模糊匹配结果
         """
-        suggestions = []
+        trie = self.root
 
-        def dfs(node, current_word, distance, pos):
-            if distance > max_distance:
-                return
+        # Exact prefix subtree alone already fills the result
+        node, _ = self._locate(prefix, batch)
+        if node != NO_NODE:
+            exact = trie.best_keys(node, max_suggestions)
+            if len(exact) >= max_suggestions:
+                return self._key_suggestions(exact, with_rank, distance=0)
 
-            if node.is_end_of_word and len(current_word) >= len(prefix) - max_distance:
-                suggestions.append(
-                    {
-                        "word": current_word,
-                        "original_word": getattr(node, "original_word", current_word),
-                        "frequency": node.frequency,
-                        "distance": distance,
-                    }
-                )
-                if len(suggestions) >= max_suggestions * 3:  # 收集更多候选
-                    return
-
-            # 如果已经处理完整个前缀，继续遍历子节点
-            if pos >= len(prefix):
-                for char, child in node.children.items():
-                    dfs(child, current_word + char, distance, pos + 1)
-                return
-
-            target_char = prefix[pos].lower()
-
-            for char, child in node.children.items():
-                if char == target_char:
-                    # 精确匹配
-                    dfs(child, current_word + char, distance, pos + 1)
-                elif distance < max_distance:
-                    # 替换
-                    dfs(child, current_word + char, distance + 1, pos + 1)
-                    # 插入
-                    dfs(child, current_word + char, distance + 1, pos)
-
-            # 删除（跳过当前前缀字符）
-            if distance < max_distance and pos < len(prefix):
-                dfs(node, current_word, distance + 1, pos + 1)
-
-        dfs(self.root, "", 0, 0)
-
-        # 按距离和频率排序
-        suggestions.sort(key=lambda x: (x["distance"], -x["frequency"]))
-        return suggestions[:max_suggestions]
+        layers = (
+            batch.fuzzy_layers.setdefault(max_distance, {}) if batch else None
+        )
+        deadline = budget.deadline if budget is not None else None
+        matches = trie.fuzzy_prefix_nodes(
+            prefix, max_distance, max_steps, layers, deadline
+        )
+        if not matches and budget is not None:
+            budget.exhausted()  # an empty walk may have been cut short
+        by_distance = defaultdict(list)
+        for match_node, distance in matches.items():
+            by_distance[distance].append(match_node)
+
+        kept = {}
+        for distance in sorted(by_distance):
+            for match_node in by_distance[distance]:
+                for key in trie.top_keys(match_node, trie.top_k):
+                    kept.setdefault(key, distance)
+            if len(kept) >= max_suggestions:
+                break
+
+        rank = trie.rank.__getitem__
+        keys = heapq.nlargest(
+            max_suggestions, kept, key=lambda key: (-kept[key], rank(key))
+        )
+        keys.sort(key=rank, reverse=True)
+        suggestions = [
+            self._key_suggestion(key, distance=kept[key]) for key in keys
+        ]
+        if with_rank:
+            return list(zip(map(rank, keys), suggestions))
+        return suggestions
+
+    def _key_suggestions(self, keys: List[int], with_rank: bool, **extra) -> List:
+        """Suggestion dicts for key nodes ``keys``, paired with their rank."""
+        suggestions = [self._key_suggestion(key, **extra) for key in keys]
+        if with_rank:
+            rank = self.root.rank
+            return [(rank[key], s) for key, s in zip(keys, suggestions)]
+        return suggestions
+
+    def _key_suggestion(self, key: int, **extra) -> Dict[str, any]:
+        """Build the suggestion dict returned to callers for key node ``key``."""
+        trie = self.root
+        return {
+            "word": trie.key_of(key),
+            "original_word": trie.original_word(key),
+            "frequency": trie.frequency[key],
+            **extra,
+        }
 
-    def _collect_words(
-        self, node: TrieNode, current_word: str, suggestions: List[Dict[str, any]]
+    def update_frequency(
+        self,
+        word: str,
+        increment: int = 1,
+        timestamp: Optional[float] = None,
+        tokens: Optional[List[str]] = None,
     ):
-        """
-        Recursively collect all words from a given node.
-
-        Args:
-            node (TrieNode): Current trie node
-            current_word (str): Word built so far
-            suggestions (List[Dict]): List to store suggestions
-        """
-        if node.is_end_of_word:
-            original = getattr(node, "original_word", current_word)
-            suggestions.append(
-                {
-                    "word": current_word,
-                    "original_word": original,
-                    "frequency": node.frequency,
-                }
-            )
-
-        for char, child_node in node.children.items():
-            self._collect_words(child_node, current_word + char, suggestions)
-
-    def update_frequency(self, word: str, increment: int = 1):
         """
         Update the frequency of a word (e.g., when user selects a suggestion).
 
         Args:
             word (str): The word to update
             increment (int): Amount to increment frequency by
+            timestamp (float, optional): When it was used, defaults to now
+            tokens (List[str], optional): Segmentation of ``word``; when
+                given, a query not in the trie yet is inserted instead of
+                ignored (learning new queries through the journal)
         """
+        if timestamp is None:
+            timestamp = time.time()
+        if not self._apply_frequency(word, increment, timestamp, tokens):
+            return
+        if self._updates_since_fork is not None:
+            self._updates_since_fork.append((word, increment, timestamp, tokens))
+        if self.journal is None:
+            return
+
+        # Durable via the journal; fold it into the snapshot now and then
+        self.journal.append(word, increment, timestamp, tokens)
+        if self.journal.records_since_rotate >= self.compact_every:
+            self.compact_in_background()
+
+    def _apply_frequency(
+        self,
+        word: str,
+        increment: int,
+        timestamp: Optional[float] = None,
+        tokens: Optional[List[str]] = None,
+    ) -> bool:
+        """
+        Apply a frequency update in memory; returns False for unknown words
+        unless ``tokens`` are given, in which case the query is inserted.
+        """
+        trie = self.root
+        if tokens is not None and trie.string_id(word.strip()) is None:
+            self._insert_tokens(word.strip(), tokens, increment, timestamp=timestamp)
+            return True
         word = word.strip().lower()
-        if self.search(word):
-            node = self.root
-            for char in word:
-                node = node.children[char]
-            node.frequency += increment
-            self.word_frequencies[word] += increment
+        node = trie.find(word)
+        if node == NO_NODE:
+            return False
+        trie.add_frequency(node, increment, timestamp)
+        original_word = trie.original_word(node)
+        query_id = trie.add_query_frequency(original_word, increment, timestamp)
+        self.top_queries.update(query_id, trie.query_rank[query_id])
+        self.hot_prefixes.invalidate([word], original_word)
+        self.generation += 1
+        self._snapshot_tag = None
+        return True
+
+    # Pruning goes below the caps by this factor, so it does not rerun at once
+    PRUNE_HEADROOM = 0.9
+
+    def over_capacity(self) -> bool:
+        """Whether the trie exceeds ``max_queries`` or ``max_bytes``."""
+        trie = self.root
+        if self.max_queries is not None and len(trie.strings) > self.max_queries:
+            return True
+        return self.max_bytes is not None and trie.memory_bytes() > self.max_bytes
+
+    def prune(self, target: Optional[int] = None) -> int:
+        """
+        Evict the lowest ranked original queries with the keys only they use.
 
-            # Clear cache to reflect updated frequencies
-            self.get_suggestions.cache_clear()
+        The surviving queries are copied into a compacted radix trie
+        (``RadixTrie.pruned``), which then replaces ``root``. This walks the
+        whole trie; on a live trie call it through ``TrieHolder.prune``,
+        which works on a fork.
+
+        Args:
+            target (int, optional): Queries to keep; defaults to
+                ``PRUNE_HEADROOM`` of what the caps allow
+
+        Returns:
+            int: Number of queries removed
+        """
+        trie = self.root
+        count = len(trie.strings)
+        if target is None:
+            target = count
+            if self.max_queries is not None:
+                target = min(target, int(self.max_queries * self.PRUNE_HEADROOM))
+            if self.max_bytes is not None and count:
+                per_query = trie.memory_bytes() / count
+                target = min(
+                    target, int(self.max_bytes * self.PRUNE_HEADROOM / per_query)
+                )
+        if count <= target:
+            return 0
+
+        score = trie.query_frequency if self.prune_by == "frequency" else trie.query_rank
+        keep = sorted(heapq.nlargest(target, range(count), key=score.__getitem__))
+        self.root = trie.pruned(keep)
+        self.top_queries.rebuild(self.root.query_rank)
+        self.materialize_hot_prefixes()
+        self.generation += 1
+        self._snapshot_tag = None
+        print(f"Pruned {count - len(keep)} queries, {len(keep)} left")
+        return count - len(keep)
+
+    # Seconds get_stats reuses its full scan of the trie for
+    STATS_SCAN_INTERVAL = 60.0
 
     def get_stats(self) -> Dict[str, any]:
         """
         Get statistics about the trie.
 
+        The total frequency and the structure scan (depth, segment fan-out)
+        walk the whole trie, so they are refreshed at most every
+        ``STATS_SCAN_INTERVAL`` seconds, not on every change of a trie under
+        traffic; everything else is read directly.
+
         Returns:
-            Dict: Statistics including total words, nodes, etc.
+            Dict: Statistics including total words, nodes, estimated bytes
+            per structure, cache hit ratios and the last build/save
+            durations
         """
-        total_words = len(self.word_frequencies)
-        total_frequency = sum(self.word_frequencies.values())
+        now = time.monotonic()
+        scan = self._structure_stats
+        if scan is None or now - scan[0] >= self.STATS_SCAN_INTERVAL:
+            scan = self._structure_stats = (
+                now,
+                sum(self.word_frequencies.values()),
+                self.root.structure_stats(),
+            )
+        validity = _is_valid_text.cache_info()
+        lookups = validity.hits + validity.misses
 
         return {
-            "total_words": total_words,
-            "total_frequency": total_frequency,
+            "total_words": len(self.word_frequencies),
+            "total_frequency": scan[1],
             "persistence_file": self.persistence_file,
+            "generation": self.generation,
+            "max_queries": self.max_queries,
+            "max_bytes": self.max_bytes,
+            "structure": {
+                **scan[2],
+                "mapped": self.root.is_mapped,
+                "age_seconds": round(now - scan[0], 3),
+            },
+            "memory_bytes": self.root.memory_usage(),
+            "suggestion_cache": self.suggestion_cache.get_stats(),
+            "hot_prefixes": self.hot_prefixes.get_stats(),
+            "validity_cache": {
+                "size": validity.currsize,
+                "max_size": validity.maxsize,
+                "hits": validity.hits,
+                "misses": validity.misses,
+                "hit_ratio": validity.hits / lookups if lookups else 0.0,
+            },
+            "timings": {
+                name: round(seconds, 3) for name, seconds in self.timings.items()
+            },
         }
 
     def save_to_disk(self):
-        """Save the trie to disk for persistence."""
+        """Save the trie to disk as a memory-mappable binary snapshot."""
+        if self._compaction is not None:
+            self._compaction.join()
         try:
-            data = {
-                "word_frequencies": dict(self.word_frequencies),
-                "trie_structure": self._serialize_trie(),
-            }
-            with open(self.persistence_file, "wb") as f:
-                pickle.dump(data, f)
+            start = time.perf_counter()
+            if self.journal is not None:
+                self.root.journal_seq = self.journal.rotate()
+            self.root.write_snapshot(self.persistence_file)
+            if self.journal is not None:
+                self.journal.discard_through(self.root.journal_seq)
+            self.timings["save_seconds"] = time.perf_counter() - start
             print(f"Trie saved to {self.persistence_file}")
-        except (IOError, OSError, pickle.PickleError) as e:
+        except (IOError, OSError) as e:
             print(f"Error saving trie: {e}")
 
+    def compact_in_background(self) -> threading.Thread:
+        """
+        Fold the journal into a new snapshot without blocking the caller.
+
+        The journal is rotated and the trie copied synchronously, so the
+        copy holds exactly the rotated records; the snapshot is then written
+        and atomically renamed from a worker thread, after which the folded
+        journal segments are deleted.
+        """
+        if self._compaction is not None and self._compaction.is_alive():
+            return self._compaction
+
+        frozen = self.root.copy()
+        if self.journal is not None:
+            frozen.journal_seq = self.journal.rotate()
+
+        def compact():
+            try:
+                start = time.perf_counter()
+                frozen.write_snapshot(self.persistence_file)
+                if self.journal is not None:
+                    self.journal.discard_through(frozen.journal_seq)
+                self.timings["compaction_seconds"] = time.perf_counter() - start
+                print(f"Trie compacted to {self.persistence_file}")
+            except (IOError, OSError) as e:
+                print(f"Error compacting trie: {e}")
+
+        self._compaction = threading.Thread(
+            target=compact, name="trie-compaction", daemon=True
+        )
+        self._compaction.start()
+        return self._compaction
+
     def load_from_disk(self):
-        """Load the trie from disk if it exists."""
+        """
+        Load the trie from disk if it exists.
+
+        Binary snapshots are mapped and queried in place; files in the old
+        pickle format are migrated into a fresh trie.
+        """
+        start = time.perf_counter()
+        self._snapshot_tag = None
         try:
             if (
                 os.path.exists(self.persistence_file)
                 and os.path.getsize(self.persistence_file) > 0
             ):
-                with open(self.persistence_file, "rb") as f:
-                    data = pickle.load(f)
-
-                self.word_frequencies = defaultdict(
-                    int, data.get("word_frequencies", {})
-                )
-                self._deserialize_trie(data.get("trie_structure", {}))
+                if RadixTrie.is_snapshot(self.persistence_file):
+                    before = os.stat(self.persistence_file)
+                    self.root = RadixTrie.open_snapshot(self.persistence_file)
+                    after = os.stat(self.persistence_file)
+                    # Not if a new snapshot replaced the file meanwhile
+                    if (before.st_ino, before.st_mtime_ns) == (
+                        after.st_ino,
+                        after.st_mtime_ns,
+                    ):
+                        self._snapshot_tag = f"{after.st_ino:x}-{after.st_mtime_ns:x}"
+                else:
+                    with open(self.persistence_file, "rb") as f:
+                        data = pickle.load(f)
+                    self._deserialize_trie(data.get("trie_structure", {}))
+                    for word, frequency in data.get("word_frequencies", {}).items():
+                        self.root.add_query_frequency(word, frequency)
+                    self._index_postings()
+                    self._index_validity()
+                # Scanning every query rank is left to the first use
+                self.top_queries.defer_rebuild(lambda: self.root.query_rank)
                 print(f"Trie loaded from {self.persistence_file}")
             else:
                 print(f"No existing trie file found at {self.persistence_file}")
-        except (IOError, OSError, pickle.PickleError, EOFError) as e:
-            print(f"Error loading trie: {e}")
 
-    def _serialize_trie(self) -> Dict:
-        """Serialize the trie structure to a dictionary."""
-
-        def serialize_node(node: TrieNode) -> Dict:
-            return {
-                "is_end_of_word": node.is_end_of_word,
-                "frequency": node.frequency,
-                "word": node.word,
-                "original_word": getattr(node, "original_word", None),
-                "children": {
-                    char: serialize_node(child) for char, child in node.children.items()
-                },
-            }
-
-        return serialize_node(self.root)
+            if self.journal is not None:
+                replayed = 0
+                for word, increment, timestamp, tokens in self.journal.replay(
+                    self.root.journal_seq
+                ):
+                    self._apply_frequency(word, increment, timestamp, tokens)
+                    replayed += 1
+                if replayed:
+                    print(f"Replayed {replayed} journaled frequency updates")
+            self.timings["load_seconds"] = time.perf_counter() - start
+        except (IOError, OSError, SnapshotError, pickle.PickleError, EOFError) as e:
+            print(f"Error loading trie: {e}")
+        finally:
+            self.hot_prefixes.clear()
+            self.generation += 1
 
     def _deserialize_trie(self, data: Dict):
-        """Deserialize the trie structure from a dictionary."""
+        """Deserialize the legacy nested per-character pickle structure."""
+        self.root = (
+            self._from_legacy_nodes(data, self.decay_rate)
+            if data
+            else RadixTrie(decay_rate=self.decay_rate)
+        )
 
-        def deserialize_node(node_data: Dict) -> TrieNode:
-            node = TrieNode()
-            node.is_end_of_word = node_data.get("is_end_of_word", False)
-            node.frequency = node_data.get("frequency", 0)
-            node.word = node_data.get("word")
-            node.original_word = node_data.get("original_word")
+    def _index_postings(self):
+        """Post every known query under its token keys (legacy migration)."""
+        trie = self.root
+        for query_id, text in enumerate(list(trie.strings)):
+            for token in self._tokenize(text):
+                node = trie.find(token)
+                if node != NO_NODE:
+                    trie.add_posting(node, query_id)
+
+    def _index_validity(self):
+        """Flag unsuggestable queries and drop their keys (legacy migration)."""
+        trie = self.root
+        for query_id, text in enumerate(list(trie.strings)):
+            trie.set_valid(query_id, self._is_valid_suggestion(text))
+        trie.rebuild_top()
+
+    @staticmethod
+    def _from_legacy_nodes(data: Dict, rate: float = 0.0) -> RadixTrie:
+        """
+        Rebuild a radix trie from the old nested per-character node dicts.
 
+        The old format has no timestamps, so all counts date from the load.
+        """
+        trie = RadixTrie(decay_rate=rate)
+        stack = [("", data)]
+        while stack:
+            key, node_data = stack.pop()
+            if node_data.get("is_end_of_word"):
+                trie.insert(
+                    key,
+                    node_data.get("original_word") or node_data.get("word") or key,
+                    node_data.get("frequency", 0),
+                )
             for char, child_data in node_data.get("children", {}).items():
-                node.children[char] = deserialize_node(child_data)
+                stack.append((key + char, child_data))
+        return trie
 
-            return node
+    def warm_up(self, prefixes: Tuple[str, ...] = ("python", "how to", "天气")):
+        """
+        Fault in the snapshot and run every search stage once, so the first
+        real request does not pay for it. The suggestion cache is bypassed.
+        The hot-prefix table is left to fill on demand: every worker would
+        otherwise rebuild it before reporting ready.
+        """
+        self.root.prefetch()
+        for prefix in prefixes:
+            self.smart_search(prefix, 10)
 
-        if data:
-            self.root = deserialize_node(data)
-        else:
-            self.root = TrieNode()
+    def fork(self) -> "AutocompleteTrie":
+        """
+        Return a copy-on-write sibling to rebuild into while this one serves.
+
+        The sibling shares the journal and persistence file but gets its own
+        radix trie copy (mapped snapshot columns stay shared until its
+        first write) and its own suggestion cache. Frequency updates applied
+        here afterwards are recorded until ``adopt_updates`` hands them over.
+        """
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone.root = self.root.copy()
+        clone.top_queries = self.top_queries.copy()
+        clone.suggestion_cache = SuggestionCache(self.suggestion_cache.max_size)
+        clone.hot_prefixes = self.hot_prefixes.copy()
+        clone._compaction = None
+        clone._updates_since_fork = None
+        self._updates_since_fork = []
+        return clone
+
+    def adopt_updates(self, source: "AutocompleteTrie"):
+        """
+        Replay frequency updates ``source`` received since it was forked.
+
+        The updates are already in the shared journal, so they are applied
+        in memory only. The generation moves past ``source``'s so cache keys
+        derived from it never repeat across the swap.
+        """
+        updates, source._updates_since_fork = source._updates_since_fork or [], None
+        for word, increment, timestamp, tokens in updates:
+            self._apply_frequency(word, increment, timestamp, tokens)
+        self.generation = max(self.generation, source.generation) + 1
 
     def clear_cache(self):
-        """Clear all LRU caches."""
-        self.search.cache_clear()
-        self.get_suggestions.cache_clear()
+        """Clear the suggestion cache and the hot-prefix table."""
+        self.suggestion_cache.clear()
+        self.hot_prefixes.clear()
 
     def get_top_queries(self, limit: int = 20) -> List[Dict[str, any]]:
         """
-        Get the most frequent queries.
+        Get the highest ranked queries by decayed score.
+
+        Served from the incrementally maintained top-queries heap; only a
+        ``limit`` beyond its size scans every query.
 
         Args:
             limit (int): Maximum number of queries to return
 
         Returns:
-            List[Dict]: Top queries with their frequencies
+            List[Dict]: Top queries with their frequencies and current scores
         """
-        sorted_words = sorted(
-            self.word_frequencies.items(), key=lambda x: x[1], reverse=True
-        )
+        trie = self.root
+        if limit <= self.top_queries.size:
+            query_ids = self.top_queries.top(limit)
+        else:
+            ranks = trie.query_rank
+            query_ids = heapq.nlargest(
+                limit, range(len(ranks)), key=ranks.__getitem__
+            )
 
         return [
-            {"word": word, "frequency": freq} for word, freq in sorted_words[:limit]
+            {
+                "word": trie.strings[query_id],
+                "frequency": trie.query_frequency[query_id],
+                "score": trie.query_score(query_id),
+            }
+            for query_id in query_ids
         ]
 
 
-# Global trie instance
-autocomplete_trie = AutocompleteTrie()
+class TrieHolder:
+    """
+    Swappable reference to the live ``AutocompleteTrie``.
+
+    Reads go to ``current`` (attribute access is forwarded), so each call
+    runs against one consistent instance. Rebuilds happen on a fork, off the
+    request path, and are published with a single reference assignment;
+    in-flight readers keep the instance they started with.
+
+    Frequency updates mutate ``current`` in place. Lookups run on the
+    server's event loop, so updates coming from background threads go
+    through ``apply_updates``, which runs them on that loop (see
+    ``attach_loop``) rather than alongside the lookups.
+    """
+
+    # Seconds between capacity checks made on the update path
+    PRUNE_CHECK_INTERVAL = 30.0
+    # Updates applied per event loop callback, so lookups are not held up
+    APPLY_CHUNK = 256
+
+    def __init__(self, trie: AutocompleteTrie):
+        self.current = trie
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()  # orders updates against the swap
+        self._rebuild_lock = threading.Lock()  # one rebuild at a time
+        self._pruning: Optional[threading.Thread] = None
+        self._next_capacity_check = 0.0
+
+    def __getattr__(self, name: str):
+        return getattr(self.current, name)
+
+    def attach_loop(self, loop: Optional[asyncio.AbstractEventLoop]):
+        """
+        Set the event loop lookups run on (None to detach). Without one,
+        ``apply_updates`` applies in the calling thread.
+        """
+        self.loop = loop
+
+    def apply_updates(
+        self,
+        updates: List[Tuple[str, int, Optional[float], Optional[List[str]]]],
+    ):
+        """
+        ``update_frequency`` for each ``(word, increment, timestamp, tokens)``
+        from a background thread. The updates run on the attached event
+        loop, ``APPLY_CHUNK`` per callback, and the call blocks until all
+        of them are applied.
+        """
+        for start in range(0, len(updates), self.APPLY_CHUNK):
+            self._call_on_loop(
+                self._apply_chunk, updates[start : start + self.APPLY_CHUNK]
+            )
+
+    def _apply_chunk(self, updates):
+        for word, increment, timestamp, tokens in updates:
+            self.update_frequency(word, increment, timestamp, tokens)
+
+    def _call_on_loop(self, func, *args):
+        """Run ``func`` on the attached loop and wait for its result."""
+        loop = self.loop
+        if loop is None or not loop.is_running():
+            return func(*args)
+        try:
+            if asyncio.get_running_loop() is loop:
+                return func(*args)
+        except RuntimeError:
+            pass  # not on an event loop thread
+
+        done = Future()
+
+        def call():
+            try:
+                done.set_result(func(*args))
+            except BaseException as e:
+                done.set_exception(e)
+
+        loop.call_soon_threadsafe(call)
+        return done.result()
+
+    def update_frequency(
+        self,
+        word: str,
+        increment: int = 1,
+        timestamp: Optional[float] = None,
+        tokens: Optional[List[str]] = None,
+    ):
+        with self._lock:
+            self.current.update_frequency(word, increment, timestamp, tokens)
+        if tokens is not None:
+            self.prune_if_needed()
+
+    def prune_if_needed(self) -> Optional[threading.Thread]:
+        """
+        Start ``prune`` in the background if the live trie is over its caps.
+        Checks at most every ``PRUNE_CHECK_INTERVAL`` seconds.
+        """
+        now = time.monotonic()
+        if now < self._next_capacity_check:
+            return None
+        self._next_capacity_check = now + self.PRUNE_CHECK_INTERVAL
+        if self._pruning is not None and self._pruning.is_alive():
+            return self._pruning
+        if not self.current.over_capacity():
+            return None
+
+        def prune():
+            try:
+                self.prune()
+            except (IOError, OSError) as e:
+                print(f"Error pruning trie: {e}")
+
+        self._pruning = threading.Thread(target=prune, name="trie-prune", daemon=True)
+        self._pruning.start()
+        return self._pruning
+
+    def prune(self, target: Optional[int] = None) -> int:
+        """
+        Prune a fork of the live trie (``AutocompleteTrie.prune``) and swap
+        it in. Blocking; lookups keep using the live trie meanwhile, and
+        updates reaching it are replayed onto the fork before the swap.
+
+        Args:
+            target (int, optional): Queries to keep, defaults to the caps
+
+        Returns:
+            int: Number of queries removed
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                live = self.current
+                fresh = live.fork()
+            removed = fresh.prune(target)
+            if not removed:
+                with self._lock:
+                    live._updates_since_fork = None
+                return 0
+
+            with self._lock:
+                if live._compaction is not None:
+                    live._compaction.join()
+                fresh.adopt_updates(live)
+                self.current = fresh
+                # Frozen under the lock, as in rebuild_from_text_file
+                snapshot = fresh.compact_in_background()
+            snapshot.join()
+            return removed
+
+    def rebuild_from_text_file(self, file_path: str) -> AutocompleteTrie:
+        """
+        Load ``file_path`` into a fork of the live trie and swap it in.
+
+        Blocking; call it from a worker thread. Frequency updates that reach
+        the live trie during the build are replayed onto the fork right
+        before the swap.
+
+        Args:
+            file_path (str): Path to the text file containing search queries
+
+        Returns:
+            AutocompleteTrie: The newly published trie
+        """
+        with self._rebuild_lock:
+            with self._lock:
+                live = self.current
+                fresh = live.fork()
+            fresh.load_from_text_file(file_path)
+            if fresh.over_capacity():
+                fresh.prune()
+
+            with self._lock:
+                if live._compaction is not None:
+                    live._compaction.join()
+                fresh.adopt_updates(live)
+                self.current = fresh
+                # Once published, fresh is written to by the update path:
+                # snapshot a copy frozen under the lock, not fresh itself
+                snapshot = fresh.compact_in_background()
+            snapshot.join()
+            return fresh
+
+
+class SharedTrieHolder(TrieHolder):
+    """
+    One autocomplete index shared by every worker process of a server.
+
+    The process holding an exclusive ``flock`` on ``<snapshot>.writer.lock``
+    is the writer: it owns the only mutable trie and the journal, applies
+    updates handed over by the others through an ``UpdateInbox``, and
+    republishes the snapshot when something changed. Every other process
+    is a reader serving straight from the mapped snapshot (shared page
+    cache, no private copy); it forwards updates to the writer and remaps
+    when a new snapshot is published. If the writer exits, the next reader
+    to check takes the lock over. Memory therefore grows with the corpus,
+    not with the worker count; readers lag the writer by up to
+    ``publish_interval + refresh_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        persistence_file: str = "models/autocomplete/enhanced_trie_data.pkl",
+        publish_interval: float = 5.0,
+        refresh_interval: float = 1.0,
+        **trie_options,
+    ):
+        self.persistence_file = persistence_file
+        self.publish_interval = publish_interval
+        self.refresh_interval = refresh_interval
+        self._trie_options = trie_options
+        self.inbox = UpdateInbox(persistence_file)
+        self.is_writer = False
+        self._lock_fd: Optional[int] = None
+        self._snapshot_id = None
+        self._next_check = 0.0
+        self._published_generation = None
+        self._closed = threading.Event()
+        self._publisher: Optional[threading.Thread] = None
+        self._remap: Optional[threading.Thread] = None
+        self._remap_lock = threading.Lock()
+        os.makedirs(os.path.dirname(persistence_file) or ".", exist_ok=True)
+
+        if self._try_lock():
+            super().__init__(self._open_writer())
+            self._start_publishing()
+        else:
+            super().__init__(self._open_reader())
+
+    def __getattr__(self, name: str):
+        self.refresh()
+        return getattr(self.current, name)
+
+    def _try_lock(self) -> bool:
+        fd = os.open(f"{self.persistence_file}.writer.lock", os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _snapshot_identity(self):
+        try:
+            stat = os.stat(self.persistence_file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open_reader(self) -> AutocompleteTrie:
+        self._snapshot_id = self._snapshot_identity()
+        return AutocompleteTrie(self.persistence_file, **self._trie_options)
+
+    def _open_writer(self) -> AutocompleteTrie:
+        return AutocompleteTrie(self.persistence_file, journal=True, **self._trie_options)
+
+    def _start_publishing(self):
+        """Act as the writer for ``current``, opened by ``_open_writer``."""
+        self.inbox = UpdateInbox(self.persistence_file)  # adopt leftovers
+        # Unfolded journal records mean readers have not seen them yet
+        if not self.current.journal.segments():
+            self._published_generation = self.current.generation
+        self.is_writer = True
+        self._publisher = threading.Thread(
+            target=self._publish_periodically, name="trie-publisher", daemon=True
+        )
+        self._publisher.start()
+
+    def refresh(self, force: bool = False, wait: bool = False):
+        """
+        Reader side: remap if a new snapshot was published, or take over as
+        writer if the lock is free. Checks at most every
+        ``refresh_interval`` seconds unless ``force``.
+
+        The new trie is opened (and on takeover the journal replayed) by a
+        background thread that swaps it in when ready; lookups are served
+        from the old one meanwhile. ``wait`` blocks until that swap.
+        """
+        with self._remap_lock:
+            remap = self._remap
+            if remap is None or not remap.is_alive():
+                remap = self._start_remap(force)
+        if wait and remap is not None:
+            remap.join()
+
+    def _start_remap(self, force: bool) -> Optional[threading.Thread]:
+        if self.is_writer or self._closed.is_set():
+            return None
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return None
+        self._next_check = now + self.refresh_interval
+
+        if self._try_lock():
+            writer = True
+        elif self._snapshot_identity() != self._snapshot_id:
+            writer = False
+        else:
+            return None
+        self._remap = threading.Thread(
+            target=self._swap_in, args=(writer,), name="trie-remap", daemon=True
+        )
+        self._remap.start()
+        return self._remap
+
+    def _swap_in(self, writer: bool):
+        try:
+            fresh = self._open_writer() if writer else self._open_reader()
+        except (IOError, OSError) as e:
+            print(f"Error remapping shared trie: {e}")
+            if writer:
+                os.close(self._lock_fd)  # let another process take over
+                self._lock_fd = None
+            return
+        with self._lock:
+            fresh.generation = max(fresh.generation, self.current.generation + 1)
+            self.current = fresh
+        if writer:
+            self._start_publishing()
+
+    def update_frequency(
+        self,
+        word: str,
+        increment: int = 1,
+        timestamp: Optional[float] = None,
+        tokens: Optional[List[str]] = None,
+    ):
+        if self.is_writer:
+            super().update_frequency(word, increment, timestamp, tokens)
+            return
+        if timestamp is None:
+            timestamp = time.time()
+        record = {"op": "update", "word": word, "increment": increment, "ts": timestamp}
+        if tokens is not None:
+            record["tokens"] = tokens
+        self.inbox.append(record)
+
+    def rebuild_from_text_file(self, file_path: str) -> AutocompleteTrie:
+        """
+        Load ``file_path`` on the writer. Readers queue the load for the
+        writer and return their current trie; the data appears once the
+        writer republishes.
+        """
+        if self.is_writer:
+            trie = super().rebuild_from_text_file(file_path)
+            self._published_generation = trie.generation
+            return trie
+        self.inbox.append({"op": "load", "file_path": file_path})
+        return self.current
+
+    def save_to_disk(self):
+        """
+        Save on the writer. Readers must not write the snapshot (theirs is
+        the mapped, possibly stale one); they ask the writer to publish
+        at its next sync instead.
+        """
+        if not self.is_writer:
+            self.inbox.append({"op": "save"})
+            return
+        with self._lock:
+            trie = self.current
+            trie.save_to_disk()
+            self._published_generation = trie.generation
+
+    def prune(self, target: Optional[int] = None) -> int:
+        """
+        Prune on the writer. Readers return 0; they pick up the pruned
+        index once the writer publishes it.
+        """
+        if not self.is_writer:
+            return 0
+        removed = super().prune(target)
+        if removed:
+            self._published_generation = self.current.generation
+        return removed
+
+    def sync(self):
+        """
+        Writer side: apply queued reader updates and loads, then republish
+        the snapshot if anything changed since the last publish or a
+        reader asked for a save. Updates are applied through
+        ``apply_updates``, in order with the loads between them.
+        """
+        if not self.is_writer:
+            return
+        updates = []
+        for record in self.inbox.drain():
+            if record.get("op") == "update":
+                updates.append(
+                    (
+                        record["word"],
+                        record["increment"],
+                        record.get("ts"),
+                        record.get("tokens"),
+                    )
+                )
+                continue
+            self.apply_updates(updates)
+            updates = []
+            if record.get("op") == "load":
+                super().rebuild_from_text_file(record["file_path"])
+            elif record.get("op") == "save":
+                self._published_generation = None
+        self.apply_updates(updates)
+
+        with self._lock:
+            trie = self.current
+            if trie.generation == self._published_generation:
+                return
+            if trie._compaction is not None:
+                trie._compaction.join()  # else the stale copy would be reused
+            compaction = trie.compact_in_background()
+            self._published_generation = trie.generation
+        compaction.join()
+
+    def _publish_periodically(self):
+        while not self._closed.wait(self.publish_interval):
+            try:
+                self.sync()
+            except (IOError, OSError) as e:
+                print(f"Error publishing shared trie: {e}")
+
+    def close(self):
+        """Stop publishing and give up the writer lock (tests, shutdown)."""
+        self._closed.set()
+        with self._remap_lock:
+            remap = self._remap
+        if remap is not None:
+            remap.join()
+        if self.is_writer:
+            self.sync()
+            self.current.journal.close()
+            os.close(self._lock_fd)
+            self._lock_fd = None
+            self.is_writer = False
+
+
+class PrefixSession:
+    """
+    Incremental autocomplete state of one client connection.
+
+    Keeps a stack with one frame per typed character: the trie position of
+    that prefix and, once computed, its suggestions. Typing a character
+    advances one step from the previous frame (``RadixTrie.advance``),
+    backspace pops a frame and reuses its suggestions, and segmentation,
+    posting lookups and fuzzy automaton layers are memoized for the whole
+    session, so each keystroke only does the work the new character adds.
+    The stack is rebuilt whenever the trie is swapped or mutated.
+    """
+
+    # Memoized search state is dropped past this many distinct prefixes
+    MAX_MEMO_PREFIXES = 256
+
+    def __init__(self, source, max_suggestions: int = 10):
+        """
+        Args:
+            source: An ``AutocompleteTrie`` or a ``TrieHolder`` (followed
+                across swaps)
+            max_suggestions (int): Maximum number of suggestions per prefix
+        """
+        self.source = source
+        self.max_suggestions = max_suggestions
+        self.text = ""
+        # (located, suggestions or None) per character of the normalized text
+        self._frames: List[Tuple[Tuple[int, str], Optional[List[Dict]]]] = []
+        self._trie: Optional[AutocompleteTrie] = None
+        self._generation = -1
+        self._batch = _SearchBatch({})
+
+    @property
+    def prefix(self) -> str:
+        """The normalized prefix the stack is built for."""
+        return self.text.lstrip().lower()
+
+    def set_text(self, text: str) -> List[Dict[str, any]]:
+        """Replace the whole input, keeping the frames of the common prefix."""
+        self._sync()
+        old, new = self.prefix, text.lstrip().lower()
+        common = 0
+        limit = min(len(old), len(new), len(self._frames))
+        while common < limit and old[common] == new[common]:
+            common += 1
+        del self._frames[common:]
+        self.text = text
+        self._extend()
+        return self.suggestions()
+
+    def append(self, chars: str) -> List[Dict[str, any]]:
+        """Type ``chars`` at the end of the input."""
+        return self.set_text(self.text + chars)
+
+    def backspace(self, count: int = 1) -> List[Dict[str, any]]:
+        """Delete ``count`` characters from the end of the input."""
+        return self.set_text(self.text[: max(0, len(self.text) - count)])
+
+    def reset(self):
+        self.text = ""
+        self._frames = []
+        self._batch = _SearchBatch({})
+
+    def suggestions(self) -> List[Dict[str, any]]:
+        """Suggestions for the current input, computed at most once per frame."""
+        self._sync()
+        if not self._frames:
+            return []
+        located, suggestions = self._frames[-1]
+        if suggestions is not None:
+            return suggestions
+
+        trie = self._trie
+        query = self.text.strip()
+        key = (query.lower(), self.max_suggestions, trie.generation)
+        suggestions = trie.suggestion_cache.get(key)
+        if suggestions is None:
+            if query.lower() == self.prefix:
+                self._batch.located[self.prefix] = located
+            suggestions = trie.smart_search(query, self.max_suggestions, self._batch)
+            trie.suggestion_cache.put(key, suggestions)
+        self._frames[-1] = (located, suggestions)
+        return suggestions
+
+    def _sync(self):
+        """Start over against the live trie if it changed since the last call."""
+        if isinstance(self.source, SharedTrieHolder):
+            self.source.refresh()
+        if isinstance(self.source, TrieHolder):
+            trie = self.source.current
+        else:
+            trie = self.source
+        if trie is self._trie and trie.generation == self._generation:
+            return
+        self._trie = trie
+        self._generation = trie.generation
+        self._frames = []
+        self._batch = _SearchBatch({})
+        self._extend()
+
+    def _extend(self):
+        """Push frames for the characters of the prefix not yet on the stack."""
+        if len(self._batch.located) > self.MAX_MEMO_PREFIXES:
+            self._batch = _SearchBatch({})
+        root = self._trie.root
+        prefix = self.prefix
+        depth = len(self._frames)
+        located = self._frames[-1][0] if self._frames else (0, "")
+        while depth < len(prefix):
+            located = root.advance(prefix[:depth], located, prefix[depth])
+            depth += 1
+            self._frames.append((located, None))
+
+
+# Global trie instance. With several server workers, set
+# AUTOCOMPLETE_SHARED_INDEX=true so they share one mapped index.
+# AUTOCOMPLETE_MAX_QUERIES / AUTOCOMPLETE_MAX_BYTES cap its size.
+_size_caps = {
+    option: int(os.environ[variable])
+    for option, variable in (
+        ("max_queries", "AUTOCOMPLETE_MAX_QUERIES"),
+        ("max_bytes", "AUTOCOMPLETE_MAX_BYTES"),
+    )
+    if os.getenv(variable)
+}
+if os.getenv("AUTOCOMPLETE_SHARED_INDEX", "false").lower() == "true":
+    autocomplete_trie = SharedTrieHolder(**_size_caps)
+else:
+    autocomplete_trie = TrieHolder(AutocompleteTrie(journal=True, **_size_caps))
@@ -0,0 +1,225 @@
+"""
+Append-only journal of autocomplete frequency updates.
+
+Updates are buffered and written to numbered segment files next to the trie
+snapshot (``<snapshot>.journal.00000001`` ...), with one ``fsync`` per batch.
+The snapshot header records the last segment it already contains, so loading
+replays only newer segments and a crash loses at most the unflushed batch.
+
+``UpdateInbox`` carries updates from worker processes that only map the
+shared snapshot to the one process that owns the journal.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class FrequencyJournal:
+    """
+    Batched write-ahead log of ``(word, increment, timestamp)`` records,
+    plus the query's tokens for updates that insert a new query.
+
+    Records are JSON lines; a torn line at the end of a segment (crash during
+    a write) ends replay of that segment instead of failing the load.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        batch_size: int = 256,
+        flush_interval: float = 0.05,
+    ):
+        self.prefix = f"{snapshot_path}.journal."
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.records_since_rotate = 0
+        self._pending: List[bytes] = []
+        self._lock = threading.Lock()
+        self._fd = None
+        self._flusher = None
+        self._closed = threading.Event()
+        segments = self.segments()
+        self.seq = segments[-1][0] if segments else 0
+
+    def segments(self) -> List[Tuple[int, str]]:
+        """Return existing ``(seq, path)`` segment files in order."""
+        found = []
+        for path in glob.glob(glob.escape(self.prefix) + "*"):
+            suffix = path[len(self.prefix) :]
+            if suffix.isdigit():
+                found.append((int(suffix), path))
+        return sorted(found)
+
+    def _segment_path(self, seq: int) -> str:
+        return f"{self.prefix}{seq:08d}"
+
+    def replay(
+        self, after_seq: int
+    ) -> Iterator[Tuple[str, int, Optional[float], Optional[List[str]]]]:
+        """
+        Yield ``(word, increment, timestamp, tokens)`` from every segment
+        newer than ``after_seq``.
+
+        Records written before timestamps were journaled yield ``None``
+        timestamps; plain frequency updates yield ``None`` tokens.
+        """
+        for seq, path in self.segments():
+            if seq <= after_seq:
+                continue
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        word, increment, *rest = json.loads(line)
+                    except ValueError:
+                        break  # torn tail from an interrupted write
+                    rest += [None] * (2 - len(rest))
+                    yield word, increment, rest[0], rest[1]
+
+    def append(
+        self,
+        word: str,
+        increment: int,
+        timestamp: float,
+        tokens: Optional[List[str]] = None,
+    ):
+        """Buffer one update; the batch is fsynced when full or on a timer."""
+        fields = [word, increment, timestamp]
+        if tokens is not None:
+            fields.append(tokens)
+        record = json.dumps(fields, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._pending.append(record.encode("utf-8"))
+            self.records_since_rotate += 1
+            if len(self._pending) >= self.batch_size:
+                self._flush_locked()
+        self._start_flusher()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        if self._fd is None:
+            # Never append to a segment a snapshot may already cover
+            self.seq += 1
+            self._fd = os.open(
+                self._segment_path(self.seq),
+                os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                0o644,
+            )
+        os.write(self._fd, b"".join(self._pending))
+        os.fsync(self._fd)
+        self._pending.clear()
+
+    def rotate(self) -> int:
+        """
+        Flush and close the active segment.
+
+        Returns:
+            int: The highest segment number holding records written so far;
+            the next append starts a new segment.
+        """
+        with self._lock:
+            self._flush_locked()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self.records_since_rotate = 0
+            return self.seq
+
+    def discard_through(self, seq: int):
+        """Delete segments already folded into a snapshot."""
+        for segment_seq, path in self.segments():
+            if segment_seq <= seq:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name="trie-journal", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._closed.set()
+        self.rotate()
+
+
+class UpdateInbox:
+    """
+    Append-only hand-off file from reader processes to the single writer.
+
+    Readers open, append one JSON line and close again, so no file handle
+    survives the writer moving the inbox aside. The writer drains by
+    renaming the file and reading it; the renamed file is read once more
+    on the next drain, to pick up appends that raced with the rename,
+    before it is deleted. Files left over by a crashed writer are picked
+    up by the next one.
+    """
+
+    def __init__(self, snapshot_path: str):
+        self.path = f"{snapshot_path}.inbox"
+        # Renamed files still to re-read: path -> bytes already consumed
+        self._draining: Dict[str, int] = {
+            path: 0 for path in glob.glob(glob.escape(self.path) + ".*")
+        }
+
+    def append(self, record: dict):
+        data = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def drain(self) -> List[dict]:
+        """Writer side: return every record appended since the last drain."""
+        records = []
+        for path, offset in sorted(self._draining.items()):
+            records.extend(self._read(path, offset)[0])
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._draining = {}
+
+        aside = f"{self.path}.{time.time_ns()}"
+        try:
+            os.replace(self.path, aside)
+        except FileNotFoundError:
+            return records
+        new_records, consumed = self._read(aside, 0)
+        records.extend(new_records)
+        self._draining[aside] = consumed
+        return records
+
+    @staticmethod
+    def _read(path: str, offset: int) -> Tuple[List[dict], int]:
+        """Parse complete lines after ``offset``; returns records and new offset."""
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], offset
+        end = data.rfind(b"\n") + 1  # a line still being written stays put
+        records = []
+        for line in data[:end].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records, offset + end
@@ -1,13 +1,16 @@
+import asyncio
 import json
 import os
 import traceback
 import re
+from contextlib import asynccontextmanager
 from typing import List, Dict, Iterable, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+import jieba
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from core.supervisors import supervisor
@@ -16,13 +19,51 @@ from core.utils import pretty_yield_messages
 from core.get_suggestion import suggestion_agent
 from core.sources import ss
 from core.semantic_search_cache import semantic_cache
-from core.trie import autocomplete_trie
+from core.trie import PrefixSession, SearchBudget, SharedTrieHolder, autocomplete_trie
+from core.personalization import personalization
+from core.ingestion import query_ingestor
+from core.embedding import warm_up as warm_up_embedding_models
+from core.startup import StartupProfile
 from core.agents.summarizing import (
     question_answering_agent,
     QUESTION_ANSWERING_SYS_PROMPT,
 )
 
-app = FastAPI(title="Omni API", description="A REST API for the Omni supervisor system")
+startup_profile = StartupProfile()
+
+# Warm-up order: jieba first (the trie's partial matching needs it), then
+# the trie itself, then the embedding models used by the semantic cache.
+STARTUP_PHASES = [
+    ("jieba", jieba.initialize),
+    ("autocomplete_trie", lambda: autocomplete_trie.warm_up()),
+    ("embedding_models", warm_up_embedding_models),
+]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the warm-up phases in a worker thread while serving liveness checks."""
+    app.state.warm_up = asyncio.create_task(
+        asyncio.to_thread(startup_profile.run, STARTUP_PHASES)
+    )
+    # Background updates to the trie are applied on the loop serving lookups
+    autocomplete_trie.attach_loop(asyncio.get_running_loop())
+    if is_learn_from_stream:
+        query_ingestor.start()
+    yield
+    # Off the loop: the final flush applies its updates on the loop
+    await asyncio.to_thread(query_ingestor.stop)
+    autocomplete_trie.attach_loop(None)
+    if isinstance(autocomplete_trie, SharedTrieHolder):
+        # Publish pending updates and hand the writer role to another worker
+        autocomplete_trie.close()
+
+
+app = FastAPI(
+    title="Omni API",
+    description="A REST API for the Omni supervisor system",
+    lifespan=lifespan,
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins
@@ -32,6 +73,15 @@ app.add_middleware(
 )
 
 is_ingest_cache = os.getenv("INGEST_CACHE", "true").lower() == "true"
+# Learn autocomplete entries from the questions sent to /stream (opt-in:
+# learned questions are suggested to every user)
+is_learn_from_stream = (
+    os.getenv("AUTOCOMPLETE_LEARN_FROM_STREAM", "false").lower() == "true"
+)
+# Default per-request time budget of /autocomplete/suggest, in milliseconds
+autocomplete_budget_ms = float(os.getenv("AUTOCOMPLETE_BUDGET_MS", "20"))
+# How long browsers and CDNs may reuse a GET /autocomplete/suggest response
+autocomplete_max_age = int(os.getenv("AUTOCOMPLETE_CACHE_MAX_AGE", "30"))
 
 
 class QueryModel(BaseModel):
@@ -71,6 +121,20 @@ class AutocompleteQueryModel(BaseModel):
 
     prefix: str
     max_suggestions: int = 10
+    user_id: str = None  # Optional user whose own history is merged in
+    budget_ms: float = None  # Optional search time budget, default from env
+
+
+class AutocompleteBatchQueryModel(BaseModel):
+    """Model for batch autocomplete requests.
+
+    Args:
+        BaseModel (pydantic.BaseModel): The base model class from Pydantic.
+    """
+
+    prefixes: List[str]
+    max_suggestions: int = 10
+    user_id: str = None  # Optional user whose own history is merged in
 
 
 class AutocompleteUpdateModel(BaseModel):
@@ -82,6 +146,7 @@ class AutocompleteUpdateModel(BaseModel):
 
     word: str
     increment: int = 1
+    user_id: str = None  # Optional user who selected the word
 
 
 class AutocompleteLoadModel(BaseModel):
@@ -95,18 +160,31 @@ class AutocompleteLoadModel(BaseModel):
 
 
 @app.post("/stream")
-async def stream_endpoint(input_query: QueryModel) -> StreamingResponse:
+async def stream_endpoint(
+    input_query: QueryModel, request: Request
+) -> StreamingResponse:
     """
     Stream responses from the supervisor system based on the user query.
 
     Args:
         input_query (QueryModel): The query data containing the user's messages, mode, location,
                                   and preferred language.
+        request (Request): Incoming request; its client is the source of a learned query
 
     Returns:
         StreamingResponse: A streaming response with the supervisor's outputs.
     """
     input_data = {"messages": input_query.messages}
+    if is_learn_from_stream:
+        # Only enqueues; segmentation and trie updates happen in the background
+        user_messages = [
+            message.get("content", "")
+            for message in input_query.messages
+            if message.get("role") == "user"
+        ]
+        if user_messages:
+            client = request.client.host if request.client else None
+            query_ingestor.submit(user_messages[-1], source=client)
     mode = input_query.mode
     location = input_query.location
     preferred_language = input_query.preferredLanguage
@@ -336,8 +414,9 @@ async def suggest_endpoint(suggestion_model: SuggestionModel):
 
 
 @app.get("/health")
+@app.get("/health/live")
 async def health_check() -> dict:
-    """Check the health status of the service.
+    """Liveness check: the process is up and serving requests.
 
     Returns:
         dict: A dictionary containing the health status.
@@ -345,6 +424,32 @@ async def health_check() -> dict:
     return {"status": "healthy"}
 
 
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness check: every startup warm-up phase has completed.
+
+    Returns:
+        JSONResponse: 200 once warmed up, 503 (with phase status) before that
+        or if a phase failed.
+    """
+    if startup_profile.ready:
+        return {"status": "ready"}
+    status = "failed" if startup_profile.finished_at is not None else "warming_up"
+    return JSONResponse(
+        status_code=503, content={"status": status, **startup_profile.to_dict()}
+    )
+
+
+@app.get("/health/startup")
+async def startup_timings() -> dict:
+    """Per-phase startup warm-up timings.
+
+    Returns:
+        dict: Readiness, total seconds and each phase's status and duration.
+    """
+    return startup_profile.to_dict()
+
+
 # Autocomplete API endpoints
 
 
@@ -357,16 +462,24 @@ async def autocomplete_suggest(query: AutocompleteQueryModel) -> dict:
         query (AutocompleteQueryModel): Contains prefix and max_suggestions
 
     Returns:
-        dict: List of suggestions with word and frequency
+        dict: List of suggestions with word and frequency, and which search
+        stages ran within the time budget
     """
     try:
+        budget = SearchBudget(query.budget_ms or autocomplete_budget_ms)
         suggestions = autocomplete_trie.get_suggestions(
-            prefix=query.prefix, max_suggestions=query.max_suggestions
+            prefix=query.prefix,
+            max_suggestions=query.max_suggestions,
+            budget=budget,
+        )
+        suggestions = personalization.merge(
+            query.user_id, query.prefix, suggestions, query.max_suggestions
         )
         return {
             "suggestions": suggestions,
             "prefix": query.prefix,
             "count": len(suggestions),
+            "search": budget.report(),
         }
     except Exception as e:
         raise HTTPException(
@@ -374,6 +487,171 @@ async def autocomplete_suggest(query: AutocompleteQueryModel) -> dict:
         )
 
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header lists ``etag`` (weak comparison)."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@app.get("/autocomplete/suggest")
+async def autocomplete_suggest_get(
+    request: Request,
+    prefix: str,
+    max_suggestions: int = 10,
+    user_id: str = None,
+) -> Response:
+    """
+    Cacheable variant of POST /autocomplete/suggest.
+
+    Anonymous responses carry a strong ETag derived from the trie
+    generation and ``Cache-Control: public, max-age=...``, so browsers and
+    CDNs can reuse them and revalidate with If-None-Match, which is answered
+    with 304 while the trie is unchanged. Personalized and time-budget
+    degraded responses are marked uncacheable.
+
+    Args:
+        request (Request): Incoming request, for If-None-Match
+        prefix (str): The prefix to complete
+        max_suggestions (int): Maximum number of suggestions to return
+        user_id (str, optional): User whose own history is merged in
+
+    Returns:
+        Response: Suggestions as in the POST endpoint, or 304
+    """
+    try:
+        # Taken before searching: if the trie changes meanwhile, the tag is
+        # older than the body and only costs a refetch later
+        etag = autocomplete_trie.etag
+        cache_control = f"public, max-age={autocomplete_max_age}"
+        if not user_id and _etag_matches(
+            request.headers.get("if-none-match", ""), etag
+        ):
+            return Response(
+                status_code=304, headers={"ETag": etag, "Cache-Control": cache_control}
+            )
+
+        budget = SearchBudget(autocomplete_budget_ms)
+        suggestions = autocomplete_trie.get_suggestions(
+            prefix=prefix, max_suggestions=max_suggestions, budget=budget
+        )
+        suggestions = personalization.merge(
+            user_id, prefix, suggestions, max_suggestions
+        )
+        if user_id:
+            headers = {"Cache-Control": "private, no-store"}
+        elif budget.degraded:
+            headers = {"Cache-Control": "no-store"}
+        else:
+            headers = {"ETag": etag, "Cache-Control": cache_control}
+        # No timing report here: a strong ETag needs an identical body
+        return JSONResponse(
+            content={
+                "suggestions": suggestions,
+                "prefix": prefix,
+                "count": len(suggestions),
+            },
+            headers=headers,
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error getting suggestions: {str(e)}"
+        )
+
+
+@app.post("/autocomplete/suggest/batch")
+async def autocomplete_suggest_batch(query: AutocompleteBatchQueryModel) -> dict:
+    """
+    Get autocomplete suggestions for several prefixes in one call.
+
+    Args:
+        query (AutocompleteBatchQueryModel): Contains prefixes and max_suggestions
+
+    Returns:
+        dict: One suggestion list per prefix, in request order
+    """
+    try:
+        batches = autocomplete_trie.get_suggestions_batch(
+            prefixes=query.prefixes, max_suggestions=query.max_suggestions
+        )
+        batches = [
+            personalization.merge(
+                query.user_id, prefix, suggestions, query.max_suggestions
+            )
+            for prefix, suggestions in zip(query.prefixes, batches)
+        ]
+        results = [
+            {"prefix": prefix, "suggestions": suggestions, "count": len(suggestions)}
+            for prefix, suggestions in zip(query.prefixes, batches)
+        ]
+        return {"results": results, "count": len(results)}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error getting suggestions: {str(e)}"
+        )
+
+
+@app.websocket("/autocomplete/ws")
+async def autocomplete_websocket(
+    websocket: WebSocket, max_suggestions: int = 10, user_id: str = None
+):
+    """
+    Push suggestions as the user types, over one connection.
+
+    The connection keeps a ``PrefixSession``, so each keystroke only
+    advances the previous trie position instead of starting over. Clients
+    send JSON messages, either the whole input ``{"text": "pyth"}`` or an
+    edit ``{"op": "append", "chars": "o"}``, ``{"op": "backspace",
+    "count": 1}``, ``{"op": "reset"}``. An optional ``"id"`` is echoed
+    back so replies can be matched to keystrokes.
+
+    Args:
+        websocket (WebSocket): The client connection
+        max_suggestions (int): Maximum number of suggestions per reply
+        user_id (str): Optional user whose own history is merged in
+    """
+    await websocket.accept()
+    session = PrefixSession(autocomplete_trie, max_suggestions=max_suggestions)
+    try:
+        while True:
+            message = await websocket.receive_json()
+            if not isinstance(message, dict):
+                message = {"op": None}
+            try:
+                op = message.get("op", "text")
+                if op == "text":
+                    suggestions = session.set_text(message.get("text", ""))
+                elif op == "append":
+                    suggestions = session.append(message.get("chars", ""))
+                elif op == "backspace":
+                    suggestions = session.backspace(message.get("count", 1))
+                elif op == "reset":
+                    session.reset()
+                    suggestions = []
+                else:
+                    raise ValueError(f"Unknown op: {op}")
+                suggestions = personalization.merge(
+                    user_id, session.text, suggestions, max_suggestions
+                )
+            except Exception as e:
+                await websocket.send_json(
+                    {"id": message.get("id"), "error": f"Error getting suggestions: {e}"}
+                )
+                continue
+            await websocket.send_json(
+                {
+                    "id": message.get("id"),
+                    "prefix": session.text,
+                    "suggestions": suggestions,
+                    "count": len(suggestions),
+                }
+            )
+    except WebSocketDisconnect:
+        pass
+
+
 @app.post("/autocomplete/update")
 async def autocomplete_update_frequency(update: AutocompleteUpdateModel) -> dict:
     """
@@ -386,12 +664,21 @@ async def autocomplete_update_frequency(update: AutocompleteUpdateModel) -> dict
         dict: Success message
     """
     try:
-        autocomplete_trie.update_frequency(word=update.word, increment=update.increment)
-        autocomplete_trie.save_to_disk()  # Persist the update
+        # A user's repeated selections only reinforce their own history;
+        # the global count moves once per query per user
+        counts_globally = True
+        if update.user_id:
+            counts_globally = personalization.record(update.user_id, update.word)
+        if counts_globally:
+            # Persisted through the trie's batched journal, not a full re-save
+            autocomplete_trie.update_frequency(
+                word=update.word, increment=update.increment
+            )
         return {
             "message": f"Updated frequency for '{update.word}' by {update.increment}",
             "word": update.word,
             "increment": update.increment,
+            "counted_globally": counts_globally,
         }
     except Exception as e:
         raise HTTPException(
@@ -404,6 +691,9 @@ async def autocomplete_load_data(load_request: AutocompleteLoadModel) -> dict:
     """
     Load search queries from a text file into the trie.
 
+    The data is loaded into a copy of the live trie in a worker thread and
+    swapped in atomically, so suggestions keep being served meanwhile.
+
     Args:
         load_request (AutocompleteLoadModel): Contains file path
 
@@ -411,9 +701,11 @@ async def autocomplete_load_data(load_request: AutocompleteLoadModel) -> dict:
         dict: Load status and statistics
     """
     try:
-        autocomplete_trie.load_from_text_file(load_request.file_path)
-        autocomplete_trie.save_to_disk()  # Persist the loaded data
-        stats = autocomplete_trie.get_stats()
+        # Builds, swaps in and persists the new trie off the event loop
+        trie = await asyncio.to_thread(
+            autocomplete_trie.rebuild_from_text_file, load_request.file_path
+        )
+        stats = trie.get_stats()
         return {
             "message": f"Successfully loaded data from {load_request.file_path}",
             "stats": stats,
@@ -433,7 +725,12 @@ async def autocomplete_stats() -> dict:
     try:
         stats = autocomplete_trie.get_stats()
         top_queries = autocomplete_trie.get_top_queries(limit=10)
-        return {"stats": stats, "top_queries": top_queries}
+        return {
+            "stats": stats,
+            "top_queries": top_queries,
+            "personalization": personalization.get_stats(),
+            "ingestion": query_ingestor.get_stats(),
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting stats: {str(e)}")
 
@@ -453,6 +750,24 @@ async def autocomplete_save() -> dict:
         raise HTTPException(status_code=500, detail=f"Error saving trie: {str(e)}")
 
 
+@app.post("/autocomplete/prune")
+async def autocomplete_prune() -> dict:
+    """
+    Evict low-ranked queries until the trie is back under its size caps.
+
+    The pruned trie is built from a copy in a worker thread and swapped in,
+    so suggestions keep being served meanwhile.
+
+    Returns:
+        dict: Number of queries removed and the new statistics
+    """
+    try:
+        removed = await asyncio.to_thread(autocomplete_trie.prune)
+        return {"removed": removed, "stats": autocomplete_trie.get_stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error pruning trie: {str(e)}")
+
+
 @app.post("/autocomplete/clear-cache")
 async def autocomplete_clear_cache() -> dict:
     """
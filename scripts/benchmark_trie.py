@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Autocomplete trie benchmark
+
+Generates mixed English/Chinese query logs at several scales from
+``data/search_queries.txt``, builds a trie for each, and measures build,
+save and load time, snapshot size, memory and per-call latency
+(p50/p95/p99) of ``smart_search``, ``_prefix_search``, ``_fuzzy_search``
+and ``insert_batch``. Each scale runs in a fresh interpreter so RSS
+figures are not inflated by the previous one. Results are written as
+JSON; pass an earlier result file as ``--baseline`` to flag regressions.
+
+Usage:
+    python scripts/benchmark_trie.py [--scales 1000,10000,100000,1000000]
+        [--samples N] [--workers N] [--output PATH]
+        [--baseline PATH] [--tolerance 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.segmentation import tokenize
+
+SEARCH_METHODS = ("smart_search", "_prefix_search", "_fuzzy_search", "insert_batch")
+_CJK = re.compile(r"[\u4e00-\u9fff]")
+
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Benchmark the autocomplete trie")
+    parser.add_argument(
+        "--scales",
+        default="1000,10000,100000",
+        help="Comma-separated corpus sizes in queries (e.g. 1000,...,1000000)",
+    )
+    parser.add_argument(
+        "--seed-file",
+        default="data/search_queries.txt",
+        help="Real queries the synthetic corpora are derived from",
+    )
+    parser.add_argument(
+        "--samples", type=int, default=1000, help="Timed calls per method"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Segmentation processes for the build (default: CPU count)",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument(
+        "--output", default="trie_benchmark.json", help="Where to write results"
+    )
+    parser.add_argument(
+        "--baseline", default=None, help="Earlier result file to compare against"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="Relative slowdown (p95, build time) reported as a regression",
+    )
+    # Internal: benchmark one scale in this process and print JSON
+    parser.add_argument("--run-scale", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def generate_corpus(seed_file: str, size: int, seed: int) -> List[str]:
+    """
+    Derive ``size`` query lines from the seed queries.
+
+    Distinct queries are the seeds plus recombinations of their English
+    and Chinese tokens; lines are drawn from them with Zipf-like weights,
+    so repeats (frequencies) look like a real log.
+    """
+    rng = random.Random(seed)
+    with open(seed_file, "r", encoding="utf-8") as f:
+        seeds = [line.strip() for line in f if line.strip()]
+
+    english, chinese = set(), set()
+    for query in seeds:
+        for token in tokenize(query, subwords=False):
+            (chinese if _CJK.search(token) else english).add(token)
+    english, chinese = sorted(english), sorted(chinese)
+
+    distinct = max(size // 3, min(size, len(seeds)))
+    pool = list(seeds[:distinct])
+    seen = set(pool)
+    while len(pool) < distinct:
+        kind = rng.random()
+        if kind < 0.45:
+            query = " ".join(rng.sample(english, rng.randint(2, 6)))
+        elif kind < 0.9:
+            query = "".join(rng.sample(chinese, rng.randint(2, 4)))
+        else:
+            query = "".join(rng.sample(chinese, 2)) + " " + rng.choice(english)
+        if query not in seen:
+            seen.add(query)
+            pool.append(query)
+
+    rng.shuffle(pool)
+    weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+    return rng.choices(pool, weights=weights, k=size)
+
+
+def sample_prefixes(corpus: List[str], count: int, rng: random.Random) -> List[str]:
+    """Prefixes of random queries, 1-3 chars for Chinese, 2-10 for English."""
+    prefixes = []
+    for query in rng.choices(corpus, k=count):
+        if _CJK.match(query):
+            length = rng.randint(1, 3)
+        else:
+            length = rng.randint(2, 10)
+        prefixes.append(query[:length])
+    return prefixes
+
+
+def misspell(prefix: str, rng: random.Random) -> str:
+    """Replace one character, so fuzzy search has something to correct."""
+    if len(prefix) < 2:
+        return prefix
+    i = rng.randrange(len(prefix))
+    alphabet = "abcdefghijklmnopqrstuvwxyz" if prefix[i].isascii() else prefix
+    return prefix[:i] + rng.choice(alphabet) + prefix[i + 1 :]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Nearest-rank percentiles of ``samples`` (seconds), in milliseconds."""
+    ordered = sorted(samples)
+
+    def at(p: float) -> float:
+        index = min(len(ordered) - 1, max(0, int(round(p * len(ordered))) - 1))
+        return round(ordered[index] * 1000, 4)
+
+    return {
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "mean": round(sum(ordered) / len(ordered) * 1000, 4),
+        "calls": len(ordered),
+    }
+
+
+def time_calls(call, arguments) -> Dict[str, float]:
+    samples = []
+    for argument in arguments:
+        start = time.perf_counter()
+        call(argument)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process (Linux), else the peak."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024  # bytes on macOS, KiB elsewhere
+    return round(peak / 1024, 1)
+
+
+def benchmark_scale(args, size: int) -> Dict:
+    """Build, persist, reload and query a trie over ``size`` queries."""
+    from core.trie import AutocompleteTrie
+
+    rng = random.Random(args.seed + size)
+    corpus = generate_corpus(args.seed_file, size, args.seed)
+    result = {"scale": size, "distinct_queries": len(set(corpus))}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_file = os.path.join(tmp_dir, "queries.txt")
+        snapshot = os.path.join(tmp_dir, "trie.bin")
+        with open(corpus_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(corpus) + "\n")
+        rss_before = current_rss_mb()
+
+        trie = AutocompleteTrie(snapshot, cache_size=0)
+        start = time.perf_counter()
+        trie.build_from_text_file(corpus_file, workers=args.workers)
+        build = time.perf_counter() - start
+        result["build_seconds"] = round(build, 3)
+        result["build_lines_per_second"] = round(size / build, 1)
+        result["rss_mb_after_build"] = current_rss_mb()
+        result["rss_mb_trie"] = round(result["rss_mb_after_build"] - rss_before, 1)
+
+        start = time.perf_counter()
+        trie.save_to_disk()
+        result["save_seconds"] = round(time.perf_counter() - start, 3)
+        result["snapshot_bytes"] = os.path.getsize(snapshot)
+        del trie
+
+        start = time.perf_counter()
+        trie = AutocompleteTrie(snapshot, cache_size=0)
+        result["load_seconds"] = round(time.perf_counter() - start, 3)
+        result["rss_mb_after_load"] = current_rss_mb()
+
+        prefixes = sample_prefixes(corpus, args.samples, rng)
+        typos = [misspell(prefix, rng) for prefix in prefixes]
+        # Queries not yet in the trie, inserted one per call
+        fresh = [f"{query} {i}" for i, query in enumerate(rng.choices(corpus, k=args.samples))]
+        result["latency_ms"] = {
+            "smart_search": time_calls(lambda q: trie.smart_search(q, 10), prefixes),
+            "_prefix_search": time_calls(lambda q: trie._prefix_search(q, 10), prefixes),
+            "_fuzzy_search": time_calls(lambda q: trie._fuzzy_search(q, 1, 10), typos),
+            "insert_batch": time_calls(lambda q: trie.insert_batch([q]), fresh),
+        }
+        result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_scale_in_subprocess(args, size: int) -> Dict:
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--run-scale",
+        str(size),
+        "--seed-file",
+        args.seed_file,
+        "--samples",
+        str(args.samples),
+        "--seed",
+        str(args.seed),
+    ]
+    if args.workers is not None:
+        command += ["--workers", str(args.workers)]
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    # The trie prints progress; the result is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def find_regressions(results: List[Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Metrics more than ``tolerance`` slower than the same scale in ``baseline``."""
+    previous = {entry["scale"]: entry for entry in baseline.get("results", [])}
+    regressions = []
+    for entry in results:
+        before = previous.get(entry["scale"])
+        if before is None:
+            continue
+        pairs = [("build_seconds", entry["build_seconds"], before["build_seconds"])]
+        for method, stats in entry["latency_ms"].items():
+            if method in before.get("latency_ms", {}):
+                pairs.append(
+                    (f"{method}.p95", stats["p95"], before["latency_ms"][method]["p95"])
+                )
+        for name, now, then in pairs:
+            if then > 0 and now > then * (1 + tolerance):
+                regressions.append(
+                    f"scale {entry['scale']}: {name} {then} -> {now} "
+                    f"(+{(now / then - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_summary(entry: Dict):
+    print(
+        f"{entry['scale']:>9,} queries: build {entry['build_seconds']}s, "
+        f"snapshot {entry['snapshot_bytes'] / 2**20:.1f} MiB, "
+        f"load {entry['load_seconds']}s, RSS {entry['rss_mb_after_build']} MiB"
+    )
+    for method in SEARCH_METHODS:
+        stats = entry["latency_ms"][method]
+        print(
+            f"    {method:<15} p50 {stats['p50']:.3f}ms  "
+            f"p95 {stats['p95']:.3f}ms  p99 {stats['p99']:.3f}ms"
+        )
+
+
+def main():
+    """Main function"""
+    args = parse_args()
+
+    if args.run_scale is not None:
+        print(json.dumps(benchmark_scale(args, args.run_scale)))
+        return
+
+    scales = [int(scale) for scale in args.scales.split(",") if scale.strip()]
+    results = []
+    for size in scales:
+        print(f"Benchmarking {size:,} queries...")
+        entry = run_scale_in_subprocess(args, size)
+        results.append(entry)
+        print_summary(entry)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "samples": args.samples,
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
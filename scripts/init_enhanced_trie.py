@@ -2,22 +2,75 @@
 """
 Enhanced Trie initialization script
 Supports Chinese word segmentation, fuzzy matching and smart search
+
+Usage:
+    python scripts/init_enhanced_trie.py [data_file] [--output PATH]
+        [--bulk] [--workers N] [--chunk-size N]
+
+``--bulk`` streams the file through the parallel builder
+(``AutocompleteTrie.build_from_text_file``) and reports lines per second.
 """
 
+import argparse
 import sys
 import os
+import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from core.trie import AutocompleteTrie
 
 
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Build the autocomplete trie")
+    parser.add_argument(
+        "data_file",
+        nargs="?",
+        default="data/search_queries.txt",
+        help="Text file with one query per line",
+    )
+    parser.add_argument(
+        "--output",
+        default="models/autocomplete/enhanced_trie_data.pkl",
+        help="Trie snapshot to write",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="Segment in a process pool and report throughput",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for --bulk (default: CPU count)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=5000,
+        help="Lines per work unit for --bulk",
+    )
+    return parser.parse_args()
+
+
 def main():
     """Main function"""
-    trie = AutocompleteTrie("models/autocomplete/enhanced_trie_data.pkl")
-    data_file = "data/search_queries.txt"
+    args = parse_args()
+    trie = AutocompleteTrie(args.output)
+    data_file = args.data_file
 
-    trie.load_from_text_file(data_file)
+    if args.bulk:
+        start = time.perf_counter()
+        lines = trie.build_from_text_file(
+            data_file, workers=args.workers, chunk_size=args.chunk_size
+        )
+        elapsed = time.perf_counter() - start
+        rate = lines / elapsed if elapsed > 0 else 0.0
+        print(f"Built {lines} lines in {elapsed:.2f}s ({rate:,.0f} lines/sec)")
+    else:
+        trie.load_from_text_file(data_file)
     trie.save_to_disk()
 
     stats = trie.get_stats()
@@ -31,3 +31,41 @@ def test_fastapi_server() -> None:
     except Exception as e:
         assert False, f"Failed to start/stop FastAPI server: {e}"
     assert True
+
+
+def test_autocomplete_suggest_etag(monkeypatch) -> None:
+    """Test ETag revalidation of GET /autocomplete/suggest"""
+    from fastapi.testclient import TestClient
+    import main
+
+    # A cold segmenter could spend the budget and make the answer uncacheable
+    monkeypatch.setattr(main, "autocomplete_budget_ms", 10000.0)
+    main.autocomplete_trie.insert("etag revalidation check")
+    client = TestClient(main.app)
+    params = {"prefix": "etag revalidation"}
+
+    response = client.get("/autocomplete/suggest", params=params)
+    assert response.status_code == 200
+    assert response.json()["suggestions"][0]["original_word"] == (
+        "etag revalidation check"
+    )
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"].startswith("public")
+
+    response = client.get(
+        "/autocomplete/suggest", params=params, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    # An update bumps the generation, so the old tag no longer matches
+    response = client.post(
+        "/autocomplete/update", json={"word": "etag revalidation check"}
+    )
+    assert response.status_code == 200
+    response = client.get(
+        "/autocomplete/suggest", params=params, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["suggestions"][0]["frequency"] == 2
@@ -2,14 +2,25 @@
 Test script for the autocomplete trie functionality.
 """
 
+import asyncio
 import sys
 import os
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from core.trie import AutocompleteTrie
+from core.ingestion import QueryIngestor, SpaceSaving
+from core.personalization import PersonalizationLayer
+from core.trie import (
+    AutocompleteTrie,
+    PrefixSession,
+    SearchBudget,
+    SharedTrieHolder,
+    TrieHolder,
+)
 import tempfile
+import threading
+import time
 
 
 def test_trie_basic_functionality():
@@ -147,6 +158,1175 @@ def test_edge_cases():
             os.unlink(tmp_path)
 
 
+def test_radix_edge_splitting():
+    """Test that shared prefixes split compressed edges correctly."""
+    print("Testing radix edge splitting...")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pkl") as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        trie.enable_word_segmentation = False
+
+        for word in ["romane", "romanus", "romulus", "rubens", "ruber", "rom"]:
+            trie.insert(word)
+
+        assert trie.search("rom") == True
+        assert trie.search("roman") == False
+        assert trie.search("rubens") == True
+
+        # A prefix ending in the middle of an edge still finds the subtree
+        words = {s["word"] for s in trie._prefix_search("roma")}
+        assert words == {"romane", "romanus"}
+
+        # Fewer nodes than characters once edges are compressed
+        assert trie.root.node_count < sum(len(w) for w in trie.word_frequencies)
+
+        trie.save_to_disk()
+        trie2 = AutocompleteTrie(persistence_file=tmp_path)
+        assert {s["word"] for s in trie2._prefix_search("ru")} == {"rubens", "ruber"}
+
+        print("✅ Radix edge splitting test passed!")
+
+    finally:
+        # Cleanup
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def test_cached_top_k():
+    """Test that cached per-node top-K lists follow frequency updates."""
+    print("Testing cached top-K suggestions...")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pkl") as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        trie.enable_word_segmentation = False
+
+        words = [f"query {i:02d}" for i in range(30)]
+        for i, word in enumerate(words):
+            trie.insert(word, frequency=i + 1)
+
+        top = [s["word"] for s in trie._prefix_search("query", 3)]
+        assert top == ["query 29", "query 28", "query 27"]
+
+        # A key outside the cached lists climbs to the top after an update
+        trie.update_frequency("query 03", 100)
+        top = trie._prefix_search("query 0", 2)
+        assert top[0]["word"] == "query 03"
+        assert top[0]["frequency"] == 104
+
+        # Asking for more than the cached size falls back to a full walk
+        assert len(trie._prefix_search("query", 25)) == 25
+
+        print("✅ Cached top-K test passed!")
+
+    finally:
+        # Cleanup
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def test_mapped_snapshot():
+    """Test that binary snapshots are queried in place and copied on write."""
+    print("Testing memory-mapped snapshots...")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".bin") as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        for word in ["machine learning", "machine translation", "天气预报"]:
+            trie.insert(word)
+        trie.save_to_disk()
+
+        mapped = AutocompleteTrie(persistence_file=tmp_path)
+        assert mapped.root.is_mapped
+        assert mapped.search("machine learning") == True
+        assert mapped._prefix_search("machine", 5) == trie._prefix_search("machine", 5)
+        assert mapped.get_stats()["total_words"] == 3
+
+        # The first mutation copies the columns out of the mapping
+        mapped.insert("machine vision")
+        assert not mapped.root.is_mapped
+        assert mapped.search("machine vision") == True
+
+        print("✅ Memory-mapped snapshot test passed!")
+
+    finally:
+        # Cleanup
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def test_frequency_journal_replay():
+    """Test that journaled updates survive a restart without a full save."""
+    print("Testing frequency journal replay...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+
+        trie = AutocompleteTrie(persistence_file=tmp_path, journal=True)
+        trie.enable_word_segmentation = False
+        trie.insert("weather today")
+        trie.insert("weather tomorrow")
+        trie.save_to_disk()
+
+        trie.update_frequency("weather tomorrow", 10)
+        trie.journal.flush()
+
+        # No save_to_disk: the update must come back from the journal
+        reloaded = AutocompleteTrie(persistence_file=tmp_path, journal=True)
+        top = reloaded._prefix_search("weather", 1)
+        assert top[0]["word"] == "weather tomorrow"
+        assert top[0]["frequency"] == 11
+
+        # Compaction folds the journal into the snapshot and drops it
+        reloaded.compact_in_background().join()
+        assert reloaded.journal.segments() == []
+        assert AutocompleteTrie(persistence_file=tmp_path).word_frequencies[
+            "weather tomorrow"
+        ] == 11
+
+        trie.journal.close()
+        reloaded.journal.close()
+        print("✅ Frequency journal test passed!")
+
+
+def test_fuzzy_search():
+    """Test bounded fuzzy prefix matching."""
+    print("Testing fuzzy search...")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pkl") as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        trie.enable_word_segmentation = False
+        trie.insert("python tutorial", frequency=5)
+        trie.insert("python", frequency=3)
+        trie.insert("weather forecast", frequency=2)
+
+        # One substitution / deletion / insertion away from a stored prefix
+        for typo in ["pytjon", "pyhon", "pythhon"]:
+            words = [s["word"] for s in trie._fuzzy_search(typo, max_distance=1)]
+            assert words[:2] == ["python tutorial", "python"], typo
+
+        assert trie._fuzzy_search("wxathxr", max_distance=1) == []
+        matches = trie._fuzzy_search("wxathxr", max_distance=2)
+        assert matches[0]["word"] == "weather forecast"
+        assert matches[0]["distance"] == 2
+
+        print("✅ Fuzzy search test passed!")
+
+    finally:
+        # Cleanup
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def test_suggestion_cache_invalidation():
+    """Test that cached suggestions never outlive a trie mutation."""
+    print("Testing suggestion cache invalidation...")
+
+    with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt") as tmp_file:
+        tmp_file.write("python decorators\n")
+        tmp_file_path = tmp_file.name
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pkl") as tmp_trie:
+        tmp_trie_path = tmp_trie.name
+
+    try:
+        trie = AutocompleteTrie(persistence_file=tmp_trie_path, cache_size=2)
+        trie.insert("python basics")
+
+        first = trie.get_suggestions("python", max_suggestions=5)
+        assert trie.get_suggestions("PYTHON ", max_suggestions=5) is first
+
+        trie.load_from_text_file(tmp_file_path)
+        originals = {
+            s["original_word"] for s in trie.get_suggestions("python", max_suggestions=5)
+        }
+        assert "python decorators" in originals
+
+        trie.get_suggestions("basics")
+        trie.get_suggestions("decorators")
+        cache_stats = trie.get_stats()["suggestion_cache"]
+        assert cache_stats["hits"] == 1
+        assert cache_stats["misses"] == 4
+        assert cache_stats["evictions"] == 2
+
+        print("✅ Suggestion cache test passed!")
+
+    finally:
+        # Cleanup
+        if os.path.exists(tmp_file_path):
+            os.unlink(tmp_file_path)
+        if os.path.exists(tmp_trie_path):
+            os.unlink(tmp_trie_path)
+
+
+def test_token_posting_index():
+    """Test that partial matches come from token postings, not combination keys."""
+    print("Testing token posting index...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        trie.insert("how to learn python quickly", frequency=3)
+        trie.insert("learn python the hard way", frequency=5)
+        trie.insert("python web frameworks")
+        trie.insert("learn rust")
+
+        # Full queries and single tokens are keys; token combinations are not
+        assert trie.search("learn python the hard way") == True
+        assert trie.search("python") == True
+        assert trie.search("learn python") == False
+
+        # A one-word query still reaches every query containing the word
+        single = {s["original_word"] for s in trie.smart_search("python", 10)}
+        assert single == {
+            "how to learn python quickly",
+            "learn python the hard way",
+            "python web frameworks",
+        }
+
+        partial = trie._partial_search("learn python", max_suggestions=4)
+        both = [s["original_word"] for s in partial if s["word"] == "learn python"]
+        assert both == ["learn python the hard way", "how to learn python quickly"]
+
+        # Postings survive a snapshot and keep growing after the mapping
+        trie.save_to_disk()
+        mapped = AutocompleteTrie(persistence_file=tmp_path)
+        assert mapped._partial_search("learn python", 4) == partial
+        mapped.insert("python tips to learn fast")
+        mapped.save_to_disk()
+        reloaded = AutocompleteTrie(persistence_file=tmp_path)
+        originals = {
+            s["original_word"]
+            for s in reloaded._partial_search("learn python", 6)
+            if s["word"] == "learn python"
+        }
+        assert "python tips to learn fast" in originals
+        assert "python web frameworks" not in originals
+
+    print("✅ Token posting index test passed!")
+
+
+def test_batch_suggestions():
+    """Test that batch suggestions match per-prefix calls and share the cache."""
+    print("Testing batch suggestions...")
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pkl") as tmp_file:
+        tmp_path = tmp_file.name
+
+    try:
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        for word in [
+            "python tutorial",
+            "python decorators",
+            "pyramid schemes",
+            "learn python fast",
+            "天气预报",
+        ]:
+            trie.insert(word)
+
+        prefixes = ["pyt", "pyth", "pythn", "PYTHON ", "", "天气", "pyt", "zzz"]
+        expected = [trie.smart_search(p, 5) if p else [] for p in prefixes]
+        assert trie.get_suggestions_batch(prefixes, max_suggestions=5) == expected
+
+        # Every distinct prefix was cached by the batch
+        assert trie.get_suggestions("pythn", max_suggestions=5) == expected[2]
+        assert trie.get_stats()["suggestion_cache"]["hits"] == 1
+
+        print("✅ Batch suggestions test passed!")
+
+    finally:
+        # Cleanup
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def test_snapshot_swap():
+    """Test that rebuilds go into a fork and are swapped in whole."""
+    print("Testing copy-on-write trie swap...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        data_path = os.path.join(tmp_dir, "queries.txt")
+        with open(data_path, "w", encoding="utf-8") as f:
+            f.write("".join(f"search query {i}\n" for i in range(2000)))
+
+        holder = TrieHolder(AutocompleteTrie(persistence_file=tmp_path))
+        holder.insert("search engines")
+        live = holder.current
+
+        rebuild = threading.Thread(
+            target=holder.rebuild_from_text_file, args=(data_path,)
+        )
+        rebuild.start()
+        updates = 0
+        while rebuild.is_alive() or not updates:
+            # Readers only ever see the old or the fully built trie
+            count = holder.get_stats()["total_words"]
+            assert count in (1, 2001), count
+            holder.update_frequency("search engines", 1)
+            updates += 1
+        rebuild.join()
+
+        assert holder.current is not live
+        assert live.search("search query 1999") == False
+        assert holder.search("search query 1999") == True
+        # No update is lost, whichever side of the swap it landed on
+        assert holder.word_frequencies["search engines"] == 1 + updates
+        assert AutocompleteTrie(persistence_file=tmp_path).search("search query 0")
+
+        # New queries keep arriving while the rebuilt trie is being saved;
+        # the snapshot is written from a frozen copy, never the live trie
+        with open(data_path, "w", encoding="utf-8") as f:
+            f.write("".join(f"bulk query {i}\n" for i in range(5000)))
+        radix_trie = type(holder.current.root)
+        write_snapshot = radix_trie.write_snapshot
+        written_live = []
+
+        def recording(root, path):
+            written_live.append(root is holder.current.root)
+            return write_snapshot(root, path)
+
+        radix_trie.write_snapshot = recording
+        try:
+            rebuild = threading.Thread(
+                target=holder.rebuild_from_text_file, args=(data_path,)
+            )
+            rebuild.start()
+            inserted = 0
+            while rebuild.is_alive():
+                query = f"arriving query {inserted}"
+                holder.update_frequency(query, 1, None, query.split())
+                inserted += 1
+            rebuild.join()
+        finally:
+            radix_trie.write_snapshot = write_snapshot
+        assert written_live == [False]
+
+        for trie in (holder.current, AutocompleteTrie(persistence_file=tmp_path)):
+            root = trie.root
+            nodes = root.node_count
+            assert len(root.top) == nodes * root.top_k
+            for name in ("parent", "first_child", "frequency", "rank", "original"):
+                assert len(getattr(root, name)) == nodes, name
+            assert all(-1 <= parent < nodes for parent in root.parent)
+        assert holder.search(f"arriving query {inserted - 1}")
+
+    print("✅ Snapshot swap test passed!")
+
+
+def test_parallel_bulk_build():
+    """Test that the process-pool bulk builder matches the serial loader."""
+    print("Testing parallel bulk build...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, "queries.txt")
+        queries = ["machine learning", "如何学习编程", "python tips", "天气预报"]
+        with open(data_path, "w", encoding="utf-8") as f:
+            for i in range(300):
+                f.write(f"{queries[i % 4]} {i % 7}\n\n")
+
+        serial = AutocompleteTrie(persistence_file=os.path.join(tmp_dir, "a.bin"))
+        serial.load_from_text_file(data_path)
+        bulk = AutocompleteTrie(persistence_file=os.path.join(tmp_dir, "b.bin"))
+        lines = bulk.build_from_text_file(data_path, workers=2, chunk_size=64)
+
+        assert lines == 300
+        assert dict(bulk.word_frequencies) == dict(serial.word_frequencies)
+        for prefix in ["machine", "如何", "天气", "learn py"]:
+            assert [s["frequency"] for s in bulk.smart_search(prefix, 5)] == [
+                s["frequency"] for s in serial.smart_search(prefix, 5)
+            ]
+
+    print("✅ Parallel bulk build test passed!")
+
+
+def test_time_decayed_ranking():
+    """Test that recent use outranks old counts and top queries follow."""
+    print("Testing time-decayed ranking...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        now = time.time()
+        day = 86400
+
+        trie = AutocompleteTrie(persistence_file=tmp_path, half_life_days=7)
+        trie.enable_word_segmentation = False
+        trie.insert("news archive", frequency=50, timestamp=now - 70 * day)
+        trie.insert("news today", frequency=2, timestamp=now)
+
+        # Ten half-lives later 50 uses weigh less than 2 fresh ones
+        assert [s["word"] for s in trie._prefix_search("news", 2)] == [
+            "news today",
+            "news archive",
+        ]
+        top = trie.get_top_queries(2)
+        assert [q["word"] for q in top] == ["news today", "news archive"]
+        assert top[1]["frequency"] == 50
+        assert abs(top[1]["score"] - 50 / 1024) < 1e-3
+
+        trie.update_frequency("news archive", 3, timestamp=now)
+        assert trie.get_top_queries(1)[0]["word"] == "news archive"
+        trie.save_to_disk()
+        reloaded = AutocompleteTrie(persistence_file=tmp_path, half_life_days=None)
+        assert reloaded.get_top_queries(1)[0]["word"] == "news archive"
+        assert reloaded._prefix_search("news", 1)[0]["word"] == "news archive"
+
+        # Without decay the raw counts decide
+        flat = AutocompleteTrie(
+            persistence_file=os.path.join(tmp_dir, "flat.bin"), half_life_days=None
+        )
+        flat.enable_word_segmentation = False
+        flat.insert("news archive", frequency=50, timestamp=now - 70 * day)
+        flat.insert("news today", frequency=2, timestamp=now)
+        assert flat.get_top_queries(1)[0]["word"] == "news archive"
+
+        # Within a match type, smart_search orders by rank
+        mixed = AutocompleteTrie(persistence_file=os.path.join(tmp_dir, "mixed.bin"))
+        mixed.insert("java beans", frequency=1, timestamp=now)
+        mixed.insert("python tips", frequency=100, timestamp=now)
+        partial = [
+            s["original_word"]
+            for s in mixed.smart_search("java python", 5)
+            if s["match_type"] == "partial"
+        ]
+        assert partial == ["python tips", "java beans"]
+
+    print("✅ Time-decayed ranking test passed!")
+
+
+def test_shared_index():
+    """Test that readers serve the writer's published snapshot and fail over."""
+    print("Testing shared index across workers...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        # flock is per open file, so two holders in one process act like two workers
+        writer = SharedTrieHolder(tmp_path, publish_interval=3600, refresh_interval=0)
+        reader = SharedTrieHolder(tmp_path, publish_interval=3600, refresh_interval=0)
+        try:
+            assert writer.is_writer and not reader.is_writer
+
+            writer.insert("shared index query", frequency=3)
+            assert reader._prefix_search("shared index", 1) == []
+            writer.sync()
+
+            # Remapping runs off the request path; the old trie answers meanwhile
+            opened, release = threading.Event(), threading.Event()
+            open_reader = reader._open_reader
+
+            def slow_open():
+                opened.set()
+                release.wait()
+                return open_reader()
+
+            reader._open_reader = slow_open
+            assert reader._prefix_search("shared index", 1) == []
+            assert opened.wait(5)
+            assert reader._prefix_search("shared index", 1) == []
+            release.set()
+            reader.refresh(wait=True)
+            del reader._open_reader
+            assert reader._prefix_search("shared index", 1)[0]["word"] == (
+                "shared index query"
+            )
+            # Top queries of the remapped snapshot are ranked on first use
+            assert reader.current.top_queries._pending is not None
+            assert reader.get_top_queries(1)[0]["word"] == "shared index query"
+
+            # Reader updates travel through the inbox to the writer
+            reader.update_frequency("shared index query", 4)
+            assert writer.word_frequencies["shared index query"] == 3
+            writer.sync()
+            assert writer.word_frequencies["shared index query"] == 7
+            reader.refresh(wait=True)
+            assert reader.word_frequencies["shared index query"] == 7
+
+            # A reader's save asks the writer instead of writing its stale copy
+            writer.update_frequency("shared index query", 2)
+            published = reader._snapshot_identity()
+            reader.save_to_disk()
+            assert reader._snapshot_identity() == published
+            writer.sync()
+            reader.refresh(wait=True)
+            assert reader.word_frequencies["shared index query"] == 9
+
+            # With a loop attached, synced updates are applied on its thread
+            loop = asyncio.new_event_loop()
+            loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+            loop_thread.start()
+            applied_on = []
+            apply = writer.current.update_frequency
+
+            def traced(*args):
+                applied_on.append(threading.current_thread())
+                return apply(*args)
+
+            writer.current.update_frequency = traced
+            writer.attach_loop(loop)
+            reader.update_frequency("shared index query", 1)
+            writer.sync()
+            assert applied_on == [loop_thread]
+            writer.attach_loop(None)
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+            loop.close()
+            del writer.current.update_frequency
+            reader.refresh(wait=True)
+            assert reader.word_frequencies["shared index query"] == 10
+
+            # A reader takes over once the writer is gone
+            writer.close()
+            reader.refresh(wait=True)
+            assert reader.is_writer
+            reader.update_frequency("shared index query", 1)
+            assert reader.word_frequencies["shared index query"] == 11
+        finally:
+            writer.close()
+            reader.close()
+
+    print("✅ Shared index test passed!")
+
+
+def test_best_first_collection():
+    """Test bounded best-first collection beyond the cached top-K."""
+    print("Testing best-first collection...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trie = AutocompleteTrie(persistence_file=os.path.join(tmp_dir, "trie.bin"))
+        trie.enable_word_segmentation = False
+        now = time.time()
+        for i in range(60):
+            trie.insert(f"book {i:02d}", frequency=(i * 37) % 61 + 1, timestamp=now)
+        # A deep chain of nested prefixes must not hit the recursion limit
+        for depth in range(1, 1500):
+            trie.insert("z" * depth, timestamp=now)
+
+        suggestions = trie._prefix_search("book", 25)
+        frequencies = [s["frequency"] for s in suggestions]
+        expected = sorted(((i * 37) % 61 + 1 for i in range(60)), reverse=True)
+        assert frequencies == expected[:25]
+
+        root = trie.root
+        collected = root.best_keys(root.locate("z")[0], 1499)
+        # "z" itself is too short to suggest and is never collected
+        assert len(collected) == 1498
+        assert {root.original_word(n) for n in collected} == {
+            "z" * d for d in range(2, 1500)
+        }
+
+    print("✅ Best-first collection test passed!")
+
+
+def test_prefix_session():
+    """Test that incremental typing matches independent lookups."""
+    print("Testing incremental prefix session...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        holder = TrieHolder(AutocompleteTrie(persistence_file=tmp_path))
+        for query in [
+            "python tutorial",
+            "python programming",
+            "pytorch install",
+            "java spring",
+            "北京天气预报",
+            "北京大学",
+        ]:
+            holder.insert(query)
+
+        session = PrefixSession(holder, max_suggestions=5)
+        for typed in ["p", "py", "pyt", "pyth", "pytho", "python t"]:
+            assert session.set_text(typed) == holder.smart_search(typed, 5)
+        assert session.backspace(2) == holder.smart_search("python", 5)
+        assert session.append(" p") == holder.smart_search("python p", 5)
+        assert session.set_text("北京") == holder.smart_search("北京", 5)
+        assert session.set_text("pytx") == holder.smart_search("pytx", 5)
+
+        # Mutations and swaps restart the stack against the live trie
+        holder.insert("python pandas", frequency=10)
+        assert session.set_text("python p")[0]["word"] == "python pandas"
+        holder.current = holder.current.fork()
+        holder.insert("javascript", frequency=3)
+        assert session.set_text("jav") == holder.smart_search("jav", 5)
+
+    print("✅ Prefix session test passed!")
+
+
+def test_personalization_overlay():
+    """Test per-user history merged over global suggestions with caps."""
+    print("Testing personalization overlay...")
+
+    layer = PersonalizationLayer(
+        max_users=2, max_queries_per_user=3, max_total_queries=5
+    )
+    global_suggestions = [
+        {"word": f"python {name}", "original_word": f"python {name}", "frequency": 9}
+        for name in ("tutorial", "download", "docs", "jobs")
+    ]
+
+    # Only the first selection of a query per user counts globally
+    assert layer.record("alice", "python asyncio")
+    assert not layer.record("alice", "python asyncio")
+    assert layer.record("alice", "Python Docs")
+
+    merged = layer.merge("alice", "pyth", global_suggestions, 4)
+    assert [s["original_word"] for s in merged] == [
+        "python asyncio",
+        "python tutorial",
+        "Python Docs",
+        "python download",
+    ]
+    assert merged[0]["match_type"] == "personal"
+    # Unknown users and non-matching prefixes get the global list unchanged
+    assert layer.merge("bob", "pyth", global_suggestions, 4) == global_suggestions
+    assert layer.merge(None, "pyth", global_suggestions, 2) == global_suggestions[:2]
+
+    # Per-user cap keeps the most recent queries
+    for query in ("rust", "go", "java"):
+        layer.record("alice", query)
+    assert layer.suggestions("alice", "python", 5) == []
+    assert len(layer.users["alice"]) == 3
+
+    # User and total caps evict the least recently active users
+    layer.record("bob", "bob query")
+    layer.record("carol", "carol query")
+    assert list(layer.users) == ["bob", "carol"]
+    for query in ("one", "two", "three"):
+        layer.record("carol", query)
+    assert layer.total_queries <= 5
+    assert layer.get_stats()["evicted_users"] >= 1
+
+    print("✅ Personalization overlay test passed!")
+
+
+def test_lazy_search_stages():
+    """Test that later smart_search stages only run when still needed."""
+    print("Testing lazy search stages...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trie = AutocompleteTrie(persistence_file=os.path.join(tmp_dir, "trie.bin"))
+        for i in range(6):
+            trie.insert(f"python lesson {i}", frequency=10 - i)
+        trie.insert("learn python fast")
+
+        calls = []
+        for name in ("_partial_search", "_fuzzy_search"):
+            search = getattr(trie, name)
+
+            def traced(*args, _name=name, _search=search, **kwargs):
+                calls.append(_name)
+                return _search(*args, **kwargs)
+
+            setattr(trie, name, traced)
+
+        # Exact prefix matches fill the result, so nothing else runs
+        results = trie.smart_search("python", 1)
+        assert results[0]["original_word"] == "python lesson 0"
+        assert results[0]["match_type"] == "exact"
+        assert calls == []
+
+        # Otherwise stages run in priority order and are merged without dupes
+        results = trie.smart_search("python fast", 10)
+        assert calls == ["_partial_search", "_fuzzy_search"]
+        assert results[0]["original_word"] == "learn python fast"
+        assert results[0]["match_type"] == "partial"
+        words = [s["original_word"] for s in results]
+        assert len(words) == len(set(words))
+
+        # Intersection hits lead, then single-token hits in rank order
+        ranked = trie._partial_search("python fast", 10, with_rank=True)
+        ranks = [rank for rank, _ in ranked]
+        assert ranks == sorted(ranks, reverse=True)
+        assert [s["original_word"] for _, s in ranked][:3] == [
+            "learn python fast",
+            "python lesson 0",
+            "python lesson 1",
+        ]
+
+    print("✅ Lazy search stages test passed!")
+
+
+def test_stream_ingestion():
+    """Test that queries repeated by several clients are learned, others not."""
+    print("Testing stream ingestion...")
+
+    summary = SpaceSaving(capacity=2)
+    evicted = [summary.offer(item) for item in ["a", "a", "b", "c", "a"]]
+    assert evicted == [None, None, None, "b", None]
+    assert len(summary) == 2
+    # "c" replaced "b" and inherited its count as error
+    assert summary.counters["c"] == [2, 1, 0]
+    assert summary.take_ready(2, lambda item: item != "a") == []
+    assert summary.take_ready(2) == [("a", 3)]
+    summary.offer("a")
+    assert summary.take_ready(2) == [("a", 1)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        holder = TrieHolder(AutocompleteTrie(persistence_file=tmp_path, journal=True))
+        holder.insert("python tutorial")
+        ingestor = QueryIngestor(holder, queue_size=8, min_count=2, min_sources=2)
+        try:
+            assert ingestor.submit("how to  learn rust", source="alice")
+            assert ingestor.submit("how to learn rust", source="bob")
+            assert ingestor.submit("python tutorial", source="alice")
+            ingestor.submit("python tutorial", source="carol")
+            ingestor.submit("one-off question about compilers", source="dave")
+            assert not ingestor.submit("x" * 500, source="dave")
+            # One client repeating a query is not enough to learn it
+            ingestor.submit("rust borrow checker tips", source="mallory")
+            ingestor.submit("rust borrow checker tips", source="mallory")
+
+            assert ingestor.flush() == 2
+            assert holder.word_frequencies["how to learn rust"] == 2
+            assert holder.word_frequencies["python tutorial"] == 3
+            assert "one-off question about compilers" not in holder.word_frequencies
+            assert "rust borrow checker tips" not in holder.word_frequencies
+            # A second client makes it count, with every submission
+            ingestor.submit("rust borrow checker tips", source="eve")
+            assert ingestor.flush() == 1
+            assert holder.word_frequencies["rust borrow checker tips"] == 3
+            assert holder.get_suggestions("learn ru")[0]["original_word"] == (
+                "how to learn rust"
+            )
+
+            # Learned queries are journaled and survive a restart
+            holder.journal.flush()
+            reloaded = AutocompleteTrie(persistence_file=tmp_path, journal=True)
+            reloaded.journal.close()
+            assert reloaded.word_frequencies["how to learn rust"] == 2
+            assert reloaded.get_suggestions("learn ru") == holder.get_suggestions(
+                "learn ru"
+            )
+
+            # A full queue drops instead of blocking
+            for i in range(10):
+                ingestor.submit(f"query {i}")
+            assert ingestor.get_stats()["dropped"] == 2
+
+            # With a loop attached, learned queries are applied on its thread
+            loop = asyncio.new_event_loop()
+            loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+            loop_thread.start()
+            holder.attach_loop(loop)
+            applied_on = []
+            apply = holder.current.update_frequency
+
+            def traced(*args):
+                applied_on.append(threading.current_thread())
+                return apply(*args)
+
+            holder.current.update_frequency = traced
+            ingestor.flush()
+            ingestor.submit("query 0", source="another client")
+            ingestor.flush()
+            assert applied_on and set(applied_on) == {loop_thread}
+            holder.attach_loop(None)
+            loop.call_soon_threadsafe(loop.stop)
+            loop_thread.join()
+            loop.close()
+            del holder.current.update_frequency
+        finally:
+            holder.journal.close()
+
+        # Readers of a shared index check keys without building the string table
+        shared_path = os.path.join(tmp_dir, "shared.bin")
+        writer = SharedTrieHolder(shared_path, publish_interval=3600)
+        writer.insert("python tutorial")
+        writer.sync()
+        reader = SharedTrieHolder(shared_path, publish_interval=3600)
+        try:
+            assert reader.current.root.is_mapped
+            reader_ingestor = QueryIngestor(reader, min_count=1, min_sources=1)
+            reader_ingestor.submit("python tutorial")
+            reader_ingestor.submit("learn go")
+            reader_ingestor.flush()
+            assert reader.current.root.string_ids is None
+            assert reader_ingestor.learned == 1
+            writer.sync()
+            assert writer.word_frequencies["python tutorial"] == 2
+            assert writer.word_frequencies["learn go"] == 1
+        finally:
+            writer.close()
+            reader.close()
+
+    print("✅ Stream ingestion test passed!")
+
+
+def test_validity_flags():
+    """Test that unsuggestable queries are flagged once and kept out of top-K."""
+    print("Testing precomputed validity flags...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        trie.enable_word_segmentation = False
+        trie.insert("the", frequency=100)
+        trie.insert("to be", frequency=50)
+        trie.insert("x", frequency=40)
+        trie.insert("theory of everything", frequency=2)
+        trie.insert("xylophone", frequency=1)
+
+        root = trie.root
+        flags = {text: root.query_valid[root.string_id(text)] for text in root.strings}
+        assert flags == {
+            "the": 0,
+            "to be": 0,
+            "x": 0,
+            "theory of everything": 1,
+            "xylophone": 1,
+        }
+        # Invalid keys never reach the cached lists, however frequent
+        assert [root.key_of(k) for k in root.top_keys(0, 10)] == [
+            "theory of everything",
+            "xylophone",
+        ]
+        assert [s["word"] for s in trie._prefix_search("t", 5)] == [
+            "theory of everything"
+        ]
+        trie.update_frequency("the", 1000)
+        assert trie._prefix_search("th", 5)[0]["word"] == "theory of everything"
+        assert [s["word"] for s in trie._prefix_search("", 30)] == [
+            "theory of everything",
+            "xylophone",
+        ]
+
+        # Flags are persisted with the snapshot
+        trie.save_to_disk()
+        reloaded = AutocompleteTrie(persistence_file=tmp_path)
+        assert reloaded.root.is_mapped
+        assert list(reloaded.root.query_valid) == list(root.query_valid)
+        assert reloaded.smart_search("x", 5) == []
+        assert reloaded.smart_search("xy", 5)[0]["word"] == "xylophone"
+
+    print("✅ Validity flags test passed!")
+
+
+def test_search_budget():
+    """Test that a spent budget degrades smart_search to its exact stage."""
+    print("Testing latency-budgeted smart_search...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        trie = AutocompleteTrie(persistence_file=os.path.join(tmp_dir, "trie.bin"))
+        trie.insert("python tutorial", frequency=9)
+        trie.insert("learn python fast", frequency=5)
+        trie.insert("pythons of the world", frequency=3)
+        trie.insert("java tutorial", frequency=4)
+
+        # A generous budget changes nothing and reports every stage
+        budget = SearchBudget(10000)
+        assert trie.smart_search("pythn tutorial", 10, budget=budget) == (
+            trie.smart_search("pythn tutorial", 10)
+        )
+        assert budget.stages == {"exact": "ran", "partial": "ran", "fuzzy": "ran"}
+        assert not budget.degraded
+
+        # Earlier stages filling the result leave later ones unused
+        budget = SearchBudget(10000)
+        trie.smart_search("python", 1, budget=budget)
+        assert budget.stages == {
+            "exact": "ran",
+            "partial": "unused",
+            "fuzzy": "unused",
+        }
+
+        # With no budget left only the exact prefix stage runs
+        budget = SearchBudget(0)
+        suggestions = trie.get_suggestions("python tutorial", 10, budget=budget)
+        assert budget.stages == {
+            "exact": "ran",
+            "partial": "skipped",
+            "fuzzy": "skipped",
+        }
+        assert budget.degraded
+        assert [s["match_type"] for s in suggestions] == ["exact"]
+        assert budget.report()["stages"]["fuzzy"] == "skipped"
+
+        # Degraded results are not cached; a full search is
+        budget = SearchBudget(10000)
+        full = trie.get_suggestions("python tutorial", 10, budget=budget)
+        assert not budget.cached and len(full) > len(suggestions)
+        budget = SearchBudget(0)
+        assert trie.get_suggestions("python tutorial", 10, budget=budget) == full
+        assert budget.cached and budget.stages == {}
+
+        # An expired deadline stops the fuzzy automaton
+        assert trie.root.fuzzy_prefix_nodes("pythn", 1, deadline=0.0) == {}
+        assert trie.root.fuzzy_prefix_nodes("pythn", 1)
+
+    print("✅ Search budget test passed!")
+
+
+def test_stats_instrumentation():
+    """Test the structure, memory, cache and timing figures of get_stats."""
+    print("Testing get_stats instrumentation...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        queries_file = os.path.join(tmp_dir, "queries.txt")
+        with open(queries_file, "w", encoding="utf-8") as f:
+            f.write("python tutorial\npython tutorial\nlearn python\nzebra\n")
+
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        trie.build_from_text_file(queries_file, workers=1)
+        trie.get_suggestions("python", 5)
+        trie.get_suggestions("python", 5)
+
+        stats = trie.get_stats()
+        structure = stats["structure"]
+        assert structure["nodes"] == trie.root.node_count
+        assert structure["queries"] == 3
+        assert structure["max_key_length"] == len("python tutorial")
+        assert structure["max_depth"] >= 2
+        assert not structure["mapped"]
+        # Two token keys each for the multi-word queries, "zebra" is its own
+        assert structure["segment_fanout"] == {"1": 1, "2": 2}
+        assert stats["memory_bytes"]["total"] == sum(
+            v for k, v in stats["memory_bytes"].items() if k != "total"
+        )
+        assert stats["memory_bytes"]["top"] == trie.root.node_count * 10 * 4
+        assert stats["suggestion_cache"]["hit_ratio"] == 0.5
+        assert 0.0 <= stats["validity_cache"]["hit_ratio"] <= 1.0
+        assert "build_seconds" in stats["timings"]
+        # The full scan is reused for STATS_SCAN_INTERVAL, changes or not
+        scanned = trie._structure_stats
+        trie.insert("zebra crossing")
+        stats = trie.get_stats()
+        assert trie._structure_stats is scanned
+        assert stats["structure"]["queries"] == 3
+        assert stats["total_words"] == 4
+        trie.STATS_SCAN_INTERVAL = 0.0
+        assert trie.get_stats()["structure"]["queries"] == 4
+
+        trie.save_to_disk()
+        assert "save_seconds" in trie.get_stats()["timings"]
+        reloaded = AutocompleteTrie(persistence_file=tmp_path)
+        stats = reloaded.get_stats()
+        assert stats["structure"]["mapped"]
+        assert stats["structure"]["segment_fanout"] == {"1": 1, "2": 3}
+        assert "load_seconds" in stats["timings"]
+
+    print("✅ Stats instrumentation test passed!")
+
+
+def test_size_cap_pruning():
+    """Test that pruning evicts the lowest ranked queries and their keys."""
+    print("Testing size-capped pruning...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        trie = AutocompleteTrie(persistence_file=tmp_path, max_queries=4)
+        trie.insert("python tutorial", frequency=50)
+        trie.insert("java tutorial", frequency=40)
+        trie.insert("python snake", frequency=30)
+        trie.insert("rare zebra query", frequency=1)
+        trie.insert("odd walrus", frequency=2)
+        assert trie.over_capacity()
+        nodes_before = trie.root.node_count
+
+        holder = TrieHolder(trie)
+        assert holder.prune() == 2  # down to 90% of the cap
+        pruned = holder.current
+        assert pruned is not trie and not pruned.over_capacity()
+        assert sorted(pruned.word_frequencies) == [
+            "java tutorial",
+            "python snake",
+            "python tutorial",
+        ]
+        root = pruned.root
+        # Keys used only by evicted queries are gone, empty branches too
+        for key in ("rare zebra query", "zebra", "walrus", "odd walrus"):
+            assert not pruned.search(key)
+        assert root.node_count < nodes_before
+        assert len(root.labels) == sum(root.label_len)
+        # Shared token keys stay, pointing at a surviving query
+        tutorial = root.find("tutorial")
+        assert root.original_word(tutorial) == "python tutorial"
+        assert [root.strings[q] for q in root.postings_of(tutorial)] == [
+            "python tutorial",
+            "java tutorial",
+        ]
+        assert root.frequency[root.find("python")] == 80
+        assert [s["original_word"] for s in pruned.smart_search("java t", 5)] == [
+            "java tutorial"
+        ]
+        assert pruned.smart_search("zeb", 5) == []
+
+        # The pruned trie is what gets persisted
+        reloaded = AutocompleteTrie(persistence_file=tmp_path)
+        assert reloaded.word_frequencies == pruned.word_frequencies
+        assert reloaded.smart_search("py", 5) == pruned.smart_search("py", 5)
+
+        # A learned query re-enters after pruning; frequency pruning keeps
+        # the most used queries
+        holder.update_frequency("odd walrus", 100, tokens=["odd", "walrus"])
+        assert holder.search("walrus")
+        holder.current.prune_by = "frequency"
+        # The published trie keeps taking updates, so a frozen copy is saved
+        radix_trie = type(root)
+        write_snapshot = radix_trie.write_snapshot
+        written_live = []
+
+        def recording(written, path):
+            written_live.append(written is holder.current.root)
+            return write_snapshot(written, path)
+
+        radix_trie.write_snapshot = recording
+        try:
+            assert holder.prune(target=2) == 2
+        finally:
+            radix_trie.write_snapshot = write_snapshot
+        assert written_live == [False]
+        assert sorted(holder.word_frequencies) == ["odd walrus", "python tutorial"]
+
+    print("✅ Size cap pruning test passed!")
+
+
+def test_generation_etag():
+    """Test that the HTTP entity tag follows trie contents."""
+    print("Testing generation-derived ETags...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "trie.bin")
+        trie = AutocompleteTrie(persistence_file=tmp_path)
+        trie.insert("python tutorial", frequency=3)
+        etag = trie.etag
+        assert etag.startswith('"') and etag.endswith('"')
+
+        # Lookups leave it alone, mutations change it
+        trie.get_suggestions("py", 5)
+        assert trie.etag == etag
+        trie.update_frequency("python tutorial", 1)
+        assert trie.etag != etag
+
+        # Tries mapping the same snapshot agree until they are modified
+        trie.save_to_disk()
+        first = AutocompleteTrie(persistence_file=tmp_path)
+        second = AutocompleteTrie(persistence_file=tmp_path)
+        assert first.etag == second.etag
+        assert first.etag not in (etag, trie.etag)
+        second.update_frequency("python tutorial", 1)
+        assert second.etag != first.etag
+        first.update_frequency("python tutorial", 1)
+        assert first.generation == second.generation
+        assert first.etag != second.etag
+
+        # A swapped-in fork never reuses a tag the live trie handed out
+        holder = TrieHolder(first)
+        seen = {first.etag}
+        queries_file = os.path.join(tmp_dir, "queries.txt")
+        with open(queries_file, "w", encoding="utf-8") as f:
+            f.write("java tutorial\n")
+        fork = first.fork()
+        first.update_frequency("python tutorial", 1)
+        seen.add(first.etag)
+        fork.load_from_text_file(queries_file)
+        fork.adopt_updates(first)
+        holder.current = fork
+        assert holder.etag not in seen
+
+        # Workers sharing an index hand out the same tag for the same snapshot
+        shared_path = os.path.join(tmp_dir, "shared.bin")
+        writer = SharedTrieHolder(shared_path, publish_interval=3600)
+        readers = [
+            SharedTrieHolder(shared_path, publish_interval=3600) for _ in range(2)
+        ]
+        try:
+            writer.insert("python tutorial")
+            writer.sync()
+            for reader in readers:
+                reader.refresh(force=True, wait=True)
+            assert readers[0].etag == readers[1].etag != writer.etag
+        finally:
+            for shared in (writer, *readers):
+                shared.close()
+
+    print("✅ Generation ETag test passed!")
+
+
+def test_hot_prefix_table():
+    """Test that short prefixes are served from a table kept in sync."""
+    print("Testing the materialized hot-prefix table...")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        queries_file = os.path.join(tmp_dir, "queries.txt")
+        with open(queries_file, "w", encoding="utf-8") as f:
+            f.write(
+                "python tutorial\npython tutorial\npytorch install\n"
+                "java tutorial\n天气预报\n天气怎么样\njavascript array\n"
+            )
+        trie = AutocompleteTrie(persistence_file=os.path.join(tmp_dir, "trie.bin"))
+        trie.build_from_text_file(queries_file, workers=1)
+        hot = trie.hot_prefixes
+        assert {"py", "pyt", "ja", "jav", "天气", "天气预"} <= set(hot.entries)
+
+        def assert_in_sync():
+            for prefix, entry in hot.entries.items():
+                suggestions = trie._unpack_suggestions(entry)
+                assert suggestions == trie.smart_search(prefix, hot.width), prefix
+
+        assert_in_sync()
+        assert trie.get_suggestions("PY", 10) == trie.smart_search("py", 10)
+        assert hot.hits == 1
+        # Entries are packed ints, not suggestion dicts
+        rows, words = hot.entries["py"]
+        assert rows.typecode == "i" and all(isinstance(w, str) for w in words)
+
+        # Warm-up leaves the table to fill on demand
+        hot.clear()
+        trie.warm_up()
+        assert len(hot) == 0
+        trie.get_suggestions("py", 10)
+        assert list(hot.entries) == ["py"]
+        trie.materialize_hot_prefixes()
+        # Other sizes bypass the table
+        assert trie.get_suggestions("py", 3) == trie.smart_search("py", 3)
+
+        # A frequency change drops only the entries it can affect, and the
+        # byte estimate follows without a walk
+        before = hot.memory_bytes()
+        trie.update_frequency("pytorch install", 5)
+        assert "py" not in hot.entries and "ja" in hot.entries
+        assert hot.memory_bytes() < before
+        assert trie.get_suggestions("py", 10)[0]["original_word"] == (
+            "pytorch install"
+        )
+        assert "py" in hot.entries
+        # A new query reaches prefixes of its tokens and fuzzy neighbours
+        trie.insert("learn java", frequency=9)
+        assert "ja" not in hot.entries and "jav" not in hot.entries
+        trie.insert("天气不错", frequency=9)
+        assert "天气" not in hot.entries and "py" in hot.entries
+        for prefix in ("ja", "jav", "天气", "lea", "jaa"):
+            trie.get_suggestions(prefix, 10)
+        assert_in_sync()
+
+        # Clearing the caches empties the table too; lookups refill it
+        trie.clear_cache()
+        assert len(hot) == 0
+        trie.get_suggestions("py", 10)
+        assert "py" in hot.entries
+
+        # Toggling segmentation changes results, so the table starts over
+        trie.enable_word_segmentation = False
+        assert len(hot) == 0
+        stats = trie.get_stats()["hot_prefixes"]
+        assert stats["invalidated"] > 0 and stats["memory_bytes"] > 0
+
+    print("✅ Hot prefix table test passed!")
+
+
 def main():
     """Run all tests."""
     print("🧪 Running autocomplete trie tests...\n")
@@ -155,6 +1335,29 @@ def main():
         test_trie_basic_functionality()
         test_trie_with_file()
         test_edge_cases()
+        test_radix_edge_splitting()
+        test_cached_top_k()
+        test_mapped_snapshot()
+        test_frequency_journal_replay()
+        test_fuzzy_search()
+        test_suggestion_cache_invalidation()
+        test_token_posting_index()
+        test_batch_suggestions()
+        test_snapshot_swap()
+        test_parallel_bulk_build()
+        test_time_decayed_ranking()
+        test_shared_index()
+        test_best_first_collection()
+        test_prefix_session()
+        test_personalization_overlay()
+        test_lazy_search_stages()
+        test_stream_ingestion()
+        test_validity_flags()
+        test_search_budget()
+        test_stats_instrumentation()
+        test_size_cap_pruning()
+        test_generation_etag()
+        test_hot_prefix_table()
         print("\n🎉 All tests passed successfully!")
     except Exception as e:
         print(f"\n❌ Test failed: {e}")